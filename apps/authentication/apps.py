@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.authentication'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .checks import check_shared_cache
+
+        checks.register(check_shared_cache, checks.Tags.caches, deploy=True)
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+
+from .revocation import is_session_revoked
+
+
+class ClaimsUser(TokenUser):
+    """Пользователь, восстановленный из подписанных данных access-токена без запроса к БД"""
+
+    @cached_property
+    def group_names(self) -> frozenset:
+        return frozenset(self.token.get('groups', ()))
+
+    @cached_property
+    def department(self):
+        return self.token.get('department')
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT-аутентификация с проверкой отзыва сессии по кешу.
+
+    При AUTH_TRUST_TOKEN_CLAIMS пользователь не загружается из БД, а собирается из данных токена
+    (группы, подразделение, is_staff/is_superuser).
+    """
+
+    def get_user(self, validated_token):
+        if is_session_revoked(validated_token):
+            raise InvalidToken('Сессия завершена')
+        if settings.AUTH_TRUST_TOKEN_CLAIMS and 'groups' in validated_token:
+            return ClaimsUser(validated_token)
+        return super().get_user(validated_token)
@@ -1,38 +1,40 @@
-from django.contrib.auth.models import Group
-from rest_framework_simplejwt.tokens import AccessToken
+import logging
+
+from django.conf import settings
 from django_auth_ldap.backend import LDAPBackend
-from .models import DepartmentRole
+from ldap.ldapobject import LDAPObject
+
+from apps.common.metrics import LDAP_AUTH
+
+from .ldap_pool import PooledLDAPModule, get_pool
+from .roles import assign_roles
+
+logger = logging.getLogger(__name__)
+
+LDAPObject.bytes_mode = False
 
 
 class LDAPJWTBackend(LDAPBackend):
+    @property
+    def ldap(self):
+        """Модуль ldap, у которого initialize() выдает соединения из пула (при AUTH_LDAP_POOL_SIZE > 0)"""
+        if self._ldap is None:
+            module = super().ldap
+            self._ldap = PooledLDAPModule(module, get_pool()) if settings.AUTH_LDAP_POOL_SIZE else module
+        return self._ldap
+
     def authenticate(self, request, username, password, **kwargs):
-        print(f"\nAttempting LDAP authentication for: {username}")
-        user = super().authenticate(request, username, password, **kwargs)
+        user = super().authenticate(request, username, password, **kwargs)   # Вместе с синхронизацией из LDAP
 
         if user:
-            print(f"Authentication SUCCESS for: {username}")
-            self.populate_user(user)   # Синхронизация данных из LDAP
+            LDAP_AUTH.inc(result='success')
+            logger.info('Успешная LDAP-аутентификация: %s', username)
             self.assign_roles(user)    # Назначение ролей на основе групп из LDAP
-            # user.token = str(AccessToken.for_user(user))   # Генерация токена JWT
             return user
-        print(f"Authentication FAILED for: {username}")
+        LDAP_AUTH.inc(result='failed')
+        logger.warning('Неудачная LDAP-аутентификация: %s', username)
         return None
 
     def assign_roles(self, user):
-        user.groups.clear()                 # Очистка всех групп пользователя
-        has_special_permissions = False     # Флаг, определяющий наличие спецправ
-
-        if hasattr(user, 'ldap_user') and hasattr(user.ldap_user, 'group_dns'):   # Проверка наличия LDAP-атрибутов
-            for group_dn in user.ldap_user.group_dns:   # Перебор всех групп пользователя в LDAP
-                if 'CPortal_' in group_dn:
-                    try:
-                        role = DepartmentRole.objects.get(ldap_group_dn=group_dn)   # Поиск соответствия в БД
-                        group, _ = Group.objects.get_or_create(name=role.name)      # Получаем/создаем группу
-                        user.groups.add(group)                                      # Назначение пользователю группы
-                        has_special_permissions = True                              # Меняем флаг
-                    except DepartmentRole.DoesNotExist:
-                        pass                                                        # Если спецгруппы нет, пропускаем
-
-        if not has_special_permissions:                                             # Если спецгруппы не найдены, даем
-            viewer_group = Group.objects.get_or_create(name='Viewer')               # даем права обычного пользователя
-            user.groups.add(viewer_group)
+        group_dns = getattr(getattr(user, 'ldap_user', None), 'group_dns', None) or ()
+        return assign_roles(user, group_dns)
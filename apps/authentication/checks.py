@@ -0,0 +1,17 @@
+from django.core.checks import Warning
+
+from apps.common.utils import is_shared_cache
+
+
+def check_shared_cache(app_configs, **kwargs) -> list:
+    """Отзыв сессий при выходе (revoke_session) хранится только в кеше: без общего кеша его видит
+    лишь воркер, обработавший выход, а остальные принимают access-токены сессии до истечения их срока.
+    Проверка развертывания (manage.py check --deploy)
+    """
+    if is_shared_cache():
+        return []
+    return [Warning(
+        'Кеш процесса (CACHE_BACKEND): выход отзывает access-токены сессии только в одном воркере',
+        hint='Для нескольких воркеров задайте общий кеш, например django.core.cache.backends.redis.RedisCache',
+        id='authentication.W001',
+    )]
@@ -0,0 +1,110 @@
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+
+class FakeLDAPBackend:
+    """Локальная замена LDAP-бэкенда для тестов и нагрузочных прогонов без каталога.
+
+    Любой пользователь с паролем FAKE_LDAP_PASSWORD считается существующим в каталоге. Каждое обращение
+    к «каталогу» задерживается на FAKE_LDAP_LATENCY секунд и учитывается в счетчике directory_calls.
+    """
+
+    directory_calls = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def _directory_call(cls):
+        with cls._lock:
+            cls.directory_calls += 1
+        if settings.FAKE_LDAP_LATENCY:
+            time.sleep(settings.FAKE_LDAP_LATENCY)
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.directory_calls = 0
+
+    @staticmethod
+    def directory_attrs(username) -> dict:
+        return {
+            'first_name': username.capitalize(),
+            'last_name': 'Тестовый',
+            'email': f'{username}@example.local',
+        }
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if not username or password != settings.FAKE_LDAP_PASSWORD:
+            return None
+        return self.populate_user(username)
+
+    def populate_user(self, username):
+        self._directory_call()
+        user, _ = get_user_model().objects.update_or_create(
+            username=username,
+            defaults=self.directory_attrs(username),
+        )
+        return user
+
+    def get_user(self, user_id):
+        return get_user_model().objects.filter(pk=user_id).first()
+
+
+class FakeLDAPObject:
+    """Соединение с «каталогом» FakeLDAPModule: задержки на установку соединения и на каждую операцию"""
+
+    def __init__(self, module, uri):
+        self._module = module
+        self.uri = uri
+        module._count('connections', module.connect_latency)
+
+    def set_option(self, option, value):
+        pass
+
+    def start_tls_s(self):
+        self._module._count('operations', self._module.operation_latency)
+
+    def simple_bind_s(self, who='', cred=''):
+        self._module._count('binds', self._module.operation_latency)
+        if who != settings.AUTH_LDAP_BIND_DN and cred != settings.FAKE_LDAP_PASSWORD:
+            raise self._module.INVALID_CREDENTIALS(who)
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)', attrlist=None):
+        self._module._count('searches', self._module.operation_latency)
+        return [(f'CN=fake,{base}', {'cn': ['fake']})]
+
+    def unbind_s(self):
+        pass
+
+
+class FakeLDAPModule:
+    """Замена модуля ldap для нагрузочной проверки пула соединений (apps.authentication.ldap_pool)"""
+
+    SCOPE_BASE, SCOPE_ONELEVEL, SCOPE_SUBTREE = 0, 1, 2
+    OPT_REFERRALS = 8
+
+    class LDAPError(Exception):
+        pass
+
+    class SERVER_DOWN(LDAPError):
+        pass
+
+    class INVALID_CREDENTIALS(LDAPError):
+        pass
+
+    def __init__(self, connect_latency=0.05, operation_latency=0.005):
+        self.connect_latency = connect_latency
+        self.operation_latency = operation_latency
+        self.stats = dict.fromkeys(('connections', 'binds', 'searches', 'operations'), 0)
+        self._lock = threading.Lock()
+
+    def _count(self, name, latency):
+        with self._lock:
+            self.stats[name] += 1
+        if latency:
+            time.sleep(latency)
+
+    def initialize(self, uri, bytes_mode=False):
+        return FakeLDAPObject(self, uri)
@@ -0,0 +1,29 @@
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+# Объекты настроек django-auth-ldap, создаваемые при первом обращении: python-ldap и django_auth_ldap
+# загружаются только при LDAP-аутентификации, а не при импорте settings (manage.py, тесты, старт воркера).
+
+
+def lazy_search_union(*searches, scope='SCOPE_SUBTREE'):
+    """LDAPSearchUnion из пар (base_dn, filterstr)"""
+    def build():
+        import ldap
+        from django_auth_ldap.config import LDAPSearch, LDAPSearchUnion
+
+        return LDAPSearchUnion(*(LDAPSearch(base_dn, getattr(ldap, scope), filterstr) for base_dn, filterstr in searches))
+    return SimpleLazyObject(build)
+
+
+def lazy_connection_options(**options):
+    """AUTH_LDAP_CONNECTION_OPTIONS по именам констант модуля ldap: lazy_connection_options(OPT_REFERRALS=0)"""
+    def build():
+        import ldap
+
+        return {getattr(ldap, name): value for name, value in options.items()}
+    return SimpleLazyObject(build)
+
+
+def lazy_instance(path, *args, **kwargs):
+    """Экземпляр класса по пути импорта (например, AUTH_LDAP_GROUP_TYPE)"""
+    return SimpleLazyObject(lambda: import_string(path)(*args, **kwargs))
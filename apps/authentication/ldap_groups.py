@@ -0,0 +1,28 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django_auth_ldap.config import ActiveDirectoryGroupType
+
+
+class CachedGroupTypeMixin:
+    """Кеширование результатов поиска групп пользователя (AUTH_LDAP_GROUP_SEARCH) на короткое время.
+
+    Подмешивается к типу групп django-auth-ldap, ключ - DN пользователя.
+    """
+
+    def user_groups(self, ldap_user, group_search):
+        timeout = settings.AUTH_LDAP_GROUP_SEARCH_CACHE_TIMEOUT
+        if not timeout or ldap_user.dn is None:
+            return super().user_groups(ldap_user, group_search)
+
+        key = 'ldap_user_groups:' + hashlib.sha256(ldap_user.dn.lower().encode()).hexdigest()
+        group_infos = cache.get(key)
+        if group_infos is None:
+            group_infos = super().user_groups(ldap_user, group_search)
+            cache.set(key, group_infos, timeout)
+        return group_infos
+
+
+class CachedActiveDirectoryGroupType(CachedGroupTypeMixin, ActiveDirectoryGroupType):
+    pass
@@ -0,0 +1,142 @@
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+
+class LDAPConnectionPool:
+    """Пул установленных соединений с LDAP-сервером (по одному набору на URI).
+
+    Соединение возвращается в пул, когда освобождается обертка PooledLDAPConnection. Соединения старше
+    max_age секунд и соединения, на которых произошел SERVER_DOWN, закрываются.
+    """
+
+    def __init__(self, max_size, max_age):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, uri, factory):
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(uri, [])
+            while idle:
+                entry = idle.pop()
+                if now - entry.created_at < self.max_age:
+                    self.reused += 1
+                    return entry
+                entry.close()
+            self.created += 1
+        return _PoolEntry(factory())
+
+    def release(self, uri, entry):
+        if entry.broken:
+            entry.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(uri, [])
+            if len(idle) < self.max_size:
+                idle.append(entry)
+                return
+        entry.close()
+
+    def clear(self):
+        with self._lock:
+            entries = [entry for idle in self._idle.values() for entry in idle]
+            self._idle.clear()
+        for entry in entries:
+            entry.close()
+
+
+class _PoolEntry:
+    """Соединение из пула и его состояние (под какой учетной записью выполнен bind, заданные опции)"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.bound_dn = None
+        self.options = {}
+        self.tls = False
+        self.broken = False
+
+    def close(self):
+        try:
+            self.connection.unbind_s()
+        except Exception:
+            pass
+
+
+class PooledLDAPConnection:
+    """Обертка LDAPObject для django-auth-ldap: повторно использует соединение и bind служебной учетной записи.
+
+    Bind под пользователем (проверка пароля) выполняется всегда, повторный bind под AUTH_LDAP_BIND_DN
+    на соединении, уже привязанном к ней, пропускается.
+    """
+
+    def __init__(self, module, pool, uri):
+        self._module = module
+        self._uri = uri
+        self._entry = pool.acquire(uri, lambda: module.initialize(uri, bytes_mode=False))
+        weakref.finalize(self, pool.release, uri, self._entry)
+
+    def set_option(self, option, value):
+        if self._entry.options.get(option, object()) != value:
+            self._entry.connection.set_option(option, value)
+            self._entry.options[option] = value
+
+    def start_tls_s(self):
+        if not self._entry.tls:
+            self._call('start_tls_s')
+            self._entry.tls = True
+
+    def simple_bind_s(self, who='', cred='', *args, **kwargs):
+        service_dn = settings.AUTH_LDAP_BIND_DN
+        if who == service_dn and self._entry.bound_dn == service_dn:
+            return None
+        self._entry.bound_dn = None
+        result = self._call('simple_bind_s', who, cred, *args, **kwargs)
+        self._entry.bound_dn = who
+        return result
+
+    def _call(self, name, *args, **kwargs):
+        try:
+            return getattr(self._entry.connection, name)(*args, **kwargs)
+        except self._module.SERVER_DOWN:
+            self._entry.broken = True
+            raise
+
+    def __getattr__(self, name):
+        attr = getattr(self._entry.connection, name)
+        if not callable(attr):
+            return attr
+        return lambda *args, **kwargs: self._call(name, *args, **kwargs)
+
+
+class PooledLDAPModule:
+    """Замена модуля ldap для LDAPBackend.ldap: initialize() выдает соединения из пула"""
+
+    def __init__(self, module, pool):
+        self._module = module
+        self._pool = pool
+
+    def initialize(self, uri, *args, **kwargs):
+        return PooledLDAPConnection(self._module, self._pool, uri)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> LDAPConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LDAPConnectionPool(settings.AUTH_LDAP_POOL_SIZE, settings.AUTH_LDAP_POOL_MAX_AGE)
+        return _pool
@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from apps.authentication.fake_ldap import FakeLDAPModule
+from apps.authentication.ldap_pool import LDAPConnectionPool, PooledLDAPModule
+
+SERVICE_DN = 'CN=svc-cportal,DC=fake,DC=local'
+GROUP_SEARCH_BASES = 3      # LDAPSearchUnion по трем базам, как в AUTH_LDAP_GROUP_SEARCH
+
+
+def simulate_login(module, username):
+    """Последовательность обращений django-auth-ldap при входе: поиск DN, проверка пароля, поиск групп"""
+    connection = module.initialize('ldap://fake', bytes_mode=False)
+    connection.set_option(module.OPT_REFERRALS, 0)
+    connection.simple_bind_s(SERVICE_DN, 'service-password')
+    user_dn = connection.search_s('OU=Users,DC=fake,DC=local', module.SCOPE_SUBTREE,
+                                  f'(sAMAccountName={username})')[0][0]
+    connection.simple_bind_s(user_dn, settings.FAKE_LDAP_PASSWORD)
+    connection.simple_bind_s(SERVICE_DN, 'service-password')
+    for _ in range(GROUP_SEARCH_BASES):
+        connection.search_s('DC=fake,DC=local', module.SCOPE_SUBTREE, '(objectClass=group)')
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочная проверка входа через LDAP с пулом соединений и без него на локальной замене каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=300, help='Количество входов')
+        parser.add_argument('--concurrency', type=int, default=20, help='Одновременных входов')
+        parser.add_argument('--pool-size', type=int, default=10, help='Размер пула')
+        parser.add_argument('--connect-latency', type=float, default=0.05, help='Установка соединения, сек')
+        parser.add_argument('--operation-latency', type=float, default=0.005, help='Bind/поиск, сек')
+
+    def handle(self, *args, **options):
+        with override_settings(AUTH_LDAP_BIND_DN=SERVICE_DN):
+            for pooled in (False, True):
+                fake = FakeLDAPModule(options['connect_latency'], options['operation_latency'])
+                module = PooledLDAPModule(fake, LDAPConnectionPool(options['pool_size'], 300)) if pooled else fake
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                    list(executor.map(lambda i: simulate_login(module, f'user{i}'), range(options['logins'])))
+                elapsed = time.perf_counter() - started
+
+                self.stdout.write(
+                    f'{"С пулом" if pooled else "Без пула"}: {options["logins"] / elapsed:.1f} входов/с, '
+                    f'соединений: {fake.stats["connections"]}, bind: {fake.stats["binds"]}, '
+                    f'поисков: {fake.stats["searches"]}'
+                )
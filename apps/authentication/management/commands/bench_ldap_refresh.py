@@ -0,0 +1,58 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from apps.authentication.fake_ldap import FakeLDAPBackend
+from apps.authentication.middleware import REFRESH_CACHE_KEY, LDAPUserRefreshMiddleware, refresh_stats
+
+# Верхняя граница --users: пользователи создаются в БД по одному
+MAX_USERS = 10000
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк LDAPUserRefreshMiddleware на локальной замене LDAP (FakeLDAPBackend)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Количество запросов')
+        parser.add_argument('--users', type=int, default=20, help=f'Количество пользователей (1-{MAX_USERS})')
+        parser.add_argument('--ttl', type=int, default=300, help='LDAP_USER_REFRESH_TTL, сек (0 - без кеша)')
+        parser.add_argument('--latency', type=float, default=0.02, help='Задержка обращения к каталогу, сек')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['users'] <= MAX_USERS:
+            raise CommandError(f'--users: допустимо от 1 до {MAX_USERS}')
+        User = get_user_model()
+        users = [User.objects.get_or_create(username=f'bench_ldap_{i}')[0] for i in range(options['users'])]
+        middleware = LDAPUserRefreshMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+
+        with override_settings(
+            LDAP_USER_REFRESH_BACKEND='apps.authentication.fake_ldap.FakeLDAPBackend',
+            LDAP_USER_REFRESH_BACKGROUND=False,
+            LDAP_USER_REFRESH_TTL=options['ttl'],
+            FAKE_LDAP_LATENCY=options['latency'],
+        ):
+            for user in users:
+                cache.delete(REFRESH_CACHE_KEY.format(user.username))
+            FakeLDAPBackend.reset()
+            refresh_stats.reset()
+
+            started = time.perf_counter()
+            for i in range(options['requests']):
+                request = factory.get('/api/companies/debtors/top/')
+                request.user = users[i % len(users)]
+                if options['ttl'] == 0:
+                    cache.delete(REFRESH_CACHE_KEY.format(request.user.username))
+                middleware(request)
+            elapsed = time.perf_counter() - started
+
+        stats = refresh_stats.snapshot()
+        self.stdout.write(
+            f'Запросов: {options["requests"]}, время: {elapsed:.2f} с '
+            f'({options["requests"] / elapsed:.0f} запросов/с), обращений к каталогу: '
+            f'{FakeLDAPBackend.directory_calls}, попаданий: {stats["hits"]}, промахов: {stats["misses"]}'
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.authentication.revocation import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Удаление истекших выданных и отозванных JWT-токенов пачками (запускать периодически, например cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Количество токенов в пачке')
+
+    def handle(self, *args, **options):
+        outstanding, blacklisted = purge_expired_tokens(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено выданных токенов: {outstanding}, отозванных: {blacklisted}'
+        ))
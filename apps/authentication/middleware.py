@@ -1,9 +1,96 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
 from django.utils.deprecation import MiddlewareMixin
-from .backends import LDAPJWTBackend
+from django.utils.module_loading import import_string
+
+from apps.common.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+REFRESH_CACHE_KEY = 'ldap_user_refresh:{}'
+
+
+class RefreshStats:
+    """Счетчики кеша обновления пользователей из LDAP (в пределах процесса)"""
+
+    FIELDS = ('hits', 'misses', 'refreshes', 'errors')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, name):
+        with self._lock:
+            self._values[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values = dict.fromkeys(self.FIELDS, 0)
+
+
+refresh_stats = RefreshStats()
+registry.counter(
+    'ldap_user_refresh_events_total', 'Счетчики кеша обновления пользователей из LDAP', ('event',),
+    callback=lambda: {(name,): value for name, value in refresh_stats.snapshot().items()},
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.LDAP_USER_REFRESH_WORKERS,
+                thread_name_prefix='ldap-refresh',
+            )
+        return _executor
+
+
+def refresh_ldap_user(username, background=False):
+    """Функция для синхронизации данных пользователя из LDAP"""
+    try:
+        backend = import_string(settings.LDAP_USER_REFRESH_BACKEND)()
+        backend.populate_user(username)
+        refresh_stats.incr('refreshes')
+    except Exception:
+        refresh_stats.incr('errors')
+        cache.delete(REFRESH_CACHE_KEY.format(username))    # Повтор при следующем запросе
+        logger.exception('Не удалось обновить пользователя %s из LDAP', username)
+    finally:
+        if background:
+            connections.close_all()
 
 
 class LDAPUserRefreshMiddleware(MiddlewareMixin):
+    """Обновление пользователя из LDAP не чаще одного раза за LDAP_USER_REFRESH_TTL секунд.
+
+    Отметка об обновлении хранится в кеше Django (для нескольких воркеров нужен общий кеш, см. CACHES).
+    При LDAP_USER_REFRESH_BACKGROUND обращение к каталогу выполняется в фоновом потоке и не задерживает запрос.
+    """
+
     def process_request(self, request):
-        if request.user.is_authenticated:
-            backend = LDAPJWTBackend()
-            backend.populate_user(username=request.user.username)
+        if not request.user.is_authenticated:
+            return
+
+        username = request.user.username
+        if not cache.add(REFRESH_CACHE_KEY.format(username), True, settings.LDAP_USER_REFRESH_TTL):
+            refresh_stats.incr('hits')
+            return
+
+        refresh_stats.incr('misses')
+        if settings.LDAP_USER_REFRESH_BACKGROUND:
+            _get_executor().submit(refresh_ldap_user, username, background=True)
+        else:
+            refresh_ldap_user(username)
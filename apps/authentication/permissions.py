@@ -1,9 +1,12 @@
-from rest_framework.permissions import BasePermission
+from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 
 class HasServiceAcces(BasePermission):
     def has_permission(self, request, view):
         required_service = getattr(view, 'requiered_service', None)
+        group_names = getattr(request.user, 'group_names', None)   # Группы из токена (ClaimsUser)
+        if group_names is not None:
+            return required_service in group_names
         return request.user.groups.filter(name=required_service).exists()
 
 
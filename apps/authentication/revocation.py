@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from apps.common.utils import is_shared_cache
+
+REVOKED_SESSION_KEY = 'revoked_session:{}'
+REVOKED_REFRESH_KEY = 'revoked_refresh:{}'
+VALID_REFRESH_KEY = 'valid_refresh:{}'
+
+
+def _timeout_until(expires_at) -> int:
+    return max(int((expires_at - timezone.now()).total_seconds()), 1)
+
+
+def revoke_session(token):
+    """Отзыв сессии токена: все access-токены с тем же sid перестают приниматься до истечения срока.
+        Отметка только в кеше (проверка access-токена без запросов к БД), поэтому для нескольких воркеров
+        нужен общий кеш - иначе отзыв видит только этот воркер (проверка authentication.W001).
+    """
+    sid = token.get('sid')
+    if not sid:
+        return
+    timeout = max(int(token['exp'] - timezone.now().timestamp()), 1)
+    cache.set(REVOKED_SESSION_KEY.format(sid), True, timeout)
+
+
+def is_session_revoked(token) -> bool:
+    """Проверка отзыва сессии токена по кешу (без обращения к БД)"""
+    sid = token.get('sid')
+    return bool(sid) and cache.get(REVOKED_SESSION_KEY.format(sid), False)
+
+
+def remember_revoked_refresh(jti, expires_at):
+    """Добавление refresh-токена в кешируемое множество отозванных (до истечения его срока)"""
+    cache.set(REVOKED_REFRESH_KEY.format(jti), True, _timeout_until(expires_at))
+
+
+def remember_valid_refresh(jti, exp):
+    """Отметка «проверен, не отозван» для refresh-токена до истечения его срока (exp - время в секундах).
+        Снимается при отзыве (сигнал post_save BlacklistedToken), поэтому проверка по БД при обновлении не нужна.
+        Только при общем кеше: в кеше процесса отметку сняли бы лишь в воркере, где токен отозван,
+        а остальные принимали бы отозванный токен до истечения срока.
+    """
+    if not is_shared_cache():
+        return
+    timeout = max(int(exp - timezone.now().timestamp()), 1)
+    cache.set(VALID_REFRESH_KEY.format(jti), True, timeout)
+
+
+def forget_valid_refresh(jti):
+    cache.delete(VALID_REFRESH_KEY.format(jti))
+
+
+def refresh_revocation(jti):
+    """Состояние refresh-токена по кешу за одно обращение: True - отозван, False - не отозван,
+        None - неизвестно (нужна проверка по БД). Без общего кеша известен только отзыв.
+    """
+    revoked_key, valid_key = REVOKED_REFRESH_KEY.format(jti), VALID_REFRESH_KEY.format(jti)
+    cached = cache.get_many([revoked_key, valid_key] if is_shared_cache() else [revoked_key])
+    if cached.get(revoked_key):
+        return True
+    if cached.get(valid_key):
+        return False
+    return None
+
+
+def purge_expired_tokens(batch_size=1000) -> tuple:
+    """Функция для удаления истекших выданных и отозванных токенов пачками.
+        Каждая пачка удаляется в отдельной транзакции, чтобы не держать блокировки на всю таблицу.
+    """
+    now = timezone.now()
+    outstanding_deleted = blacklisted_deleted = 0
+    while True:
+        ids = list(OutstandingToken.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            blacklisted_deleted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+            outstanding_deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+    return outstanding_deleted, blacklisted_deleted
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+from .models import DepartmentRole
+
+ROLE_MAP_CACHE_KEY = 'department_role_map'
+ROLE_GROUP_MARKER = 'cportal_'
+VIEWER_GROUP = 'Viewer'
+
+
+def get_role_map() -> dict:
+    """Соответствие DN группы LDAP (в нижнем регистре) -> наименование роли, кешируется целиком"""
+    role_map = cache.get(ROLE_MAP_CACHE_KEY)
+    if role_map is None:
+        role_map = {dn.lower(): name for dn, name in DepartmentRole.objects.values_list('ldap_group_dn', 'name')}
+        cache.set(ROLE_MAP_CACHE_KEY, role_map, settings.ROLE_MAP_CACHE_TTL)
+    return role_map
+
+
+def invalidate_role_map(**kwargs):
+    cache.delete(ROLE_MAP_CACHE_KEY)
+
+
+def assign_roles(user, group_dns):
+    """Назначение пользователю групп по его группам в LDAP за постоянное число запросов.
+        Роли определяются по кешированному справочнику DepartmentRole, при отсутствии спецгрупп
+        назначается Viewer. Состав групп пользователя сверяется одним groups.set().
+    """
+    role_map = get_role_map()
+    role_names = {
+        role_map[dn.lower()] for dn in group_dns
+        if ROLE_GROUP_MARKER in dn.lower() and dn.lower() in role_map
+    } or {VIEWER_GROUP}
+
+    groups = list(Group.objects.filter(name__in=role_names))
+    missing = role_names - {group.name for group in groups}
+    if missing:
+        Group.objects.bulk_create([Group(name=name) for name in missing], ignore_conflicts=True)
+        groups = list(Group.objects.filter(name__in=role_names))
+
+    user.groups.set(groups)
+    return groups
@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .tokens import CustomRefreshToken, add_user_claims
+
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """Обновление токенов с пересчетом данных пользователя (группы, is_staff/is_superuser) из БД.
+
+    ClaimsJWTAuthentication доверяет данным access-токена без обращения к БД, поэтому при каждом обновлении
+    они берутся заново: пользователь, исключенный из группы или лишенный прав, теряет их со следующим токеном.
+    """
+    token_class = CustomRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        user = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        add_user_claims(refresh, user)
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            refresh.remember_valid()
+            data['refresh'] = str(refresh)
+
+        return data
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .models import DepartmentRole
+from .revocation import forget_valid_refresh, remember_revoked_refresh
+from .roles import invalidate_role_map
+
+
+@receiver([post_save, post_delete], sender=DepartmentRole)
+def department_role_changed(sender, **kwargs):
+    invalidate_role_map()
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def refresh_token_blacklisted(sender, instance, created, **kwargs):
+    if created:
+        remember_revoked_refresh(instance.token.jti, instance.token.expires_at)
+        forget_valid_refresh(instance.token.jti)
@@ -1,3 +1,169 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.common.testing import QueryBudgetMixin
+
+from .checks import check_shared_cache
+from .revocation import REVOKED_REFRESH_KEY
+from .tokens import CustomRefreshToken
+
+PASSWORD = 'budget-password'
+
+# Бюджеты запросов: число запросов не зависит от числа групп пользователя, пользователей и выданных токенов
+LOGIN_BUDGET = 6
+REFRESH_BUDGET = 14         # Пользователь и его группы, отзыв старого и запись нового токена (simplejwt)
+LOGOUT_BUDGET = 7
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=['apps.authentication.fake_ldap.FakeLDAPBackend'],
+    LDAP_USER_REFRESH_BACKEND='apps.authentication.fake_ldap.FakeLDAPBackend',
+    LDAP_USER_REFRESH_BACKGROUND=False,
+    FAKE_LDAP_PASSWORD=PASSWORD,
+    FAKE_LDAP_LATENCY=0,
+)
+class AuthQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Число запросов входа, обновления токена и выхода не зависит от объема данных"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def post(self, url, data, expected_status):
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response
+
+    def prepare(self, size):
+        """Пользователь в size группах с size прежними сессиями и size других пользователей"""
+        cache.clear()
+        self.user = get_user_model().objects.create(username=f'budget{size}')
+        groups = Group.objects.bulk_create([Group(name=f'group{size}-{i}') for i in range(size)])
+        self.user.groups.add(*groups)
+        get_user_model().objects.bulk_create([get_user_model()(username=f'other{size}-{i}') for i in range(size)])
+        for _ in range(size):
+            CustomRefreshToken.for_user(self.user)
+        self.refresh = CustomRefreshToken.for_user(self.user)
+
+    def test_login(self):
+        self.assertConstantQueries(
+            lambda size: self.post('/api/auth/login/', {'username': self.user.username, 'password': PASSWORD}, 200),
+            LOGIN_BUDGET, prepare=self.prepare, label='POST auth/login/',
+        )
+
+    def test_refresh(self):
+        self.assertConstantQueries(
+            lambda size: self.post('/api/auth/refresh/', {'refresh': str(self.refresh)}, 200),
+            REFRESH_BUDGET, prepare=self.prepare, label='POST auth/refresh/',
+        )
+
+    def test_logout(self):
+        self.assertConstantQueries(
+            lambda size: self.post('/api/auth/logout/', {'refresh_token': str(self.refresh)}, 205),
+            LOGOUT_BUDGET, prepare=self.prepare, label='POST auth/logout/',
+        )
+
+
+class TokenClaimsRefreshTests(TestCase):
+    """Данные пользователя в токенах пересчитываются при каждом обновлении"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create(username='claims', is_staff=True)
+        self.group = Group.objects.create(name='CPortal_admins')
+        self.user.groups.add(self.group)
+
+    def refresh(self, refresh):
+        response = self.client.post('/api/auth/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_revoked_rights_leave_next_tokens(self):
+        refresh = CustomRefreshToken.for_user(self.user)
+        self.assertEqual(refresh.access_token['groups'], ['CPortal_admins'])
+
+        self.user.groups.remove(self.group)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_staff=False)
+        tokens = self.refresh(str(refresh))
+
+        for token in (AccessToken(tokens['access']), CustomRefreshToken(tokens['refresh'])):
+            self.assertEqual(token['groups'], [])
+            self.assertFalse(token['is_staff'])
+
+    def test_inactive_user(self):
+        refresh = CustomRefreshToken.for_user(self.user)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post('/api/auth/refresh/', {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, 401, response.content)
+
+
+def shared_cache(shared=True):
+    """Общий кеш (как Redis у нескольких воркеров) либо кеш процесса"""
+    return mock.patch('apps.authentication.revocation.is_shared_cache', return_value=shared)
+
+
+class RefreshRevocationTests(TestCase):
+    """Отзыв refresh-токенов: кеш «проверен, не отозван» (только при общем кеше) снимается при отзыве"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create(username='revocation')
+
+    def post(self, url, data):
+        return self.client.post(url, data, format='json')
+
+    def blacklist_queries(self, refresh) -> list:
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.post('/api/auth/refresh/', {'refresh': str(refresh)}).status_code, 200)
+        return [q for q in captured.captured_queries
+                if q['sql'].startswith('SELECT 1 AS "a" FROM "token_blacklist_blacklistedtoken"')]
+
+    def test_valid_refresh_skips_blacklist_query(self):
+        with shared_cache():
+            self.assertFalse(self.blacklist_queries(CustomRefreshToken.for_user(self.user)))
+
+    def test_process_cache_checks_blacklist(self):
+        self.assertTrue(self.blacklist_queries(CustomRefreshToken.for_user(self.user)))
+
+    def test_revocation_seen_by_other_worker(self):
+        """Токен проверен в воркере B, отозван в воркере A: B не должен принять его по своему кешу"""
+        worker_a, worker_b = LocMemCache('worker-a', {}), LocMemCache('worker-b', {})
+        refresh = str(CustomRefreshToken.for_user(self.user))
+        with mock.patch('apps.authentication.revocation.cache', worker_b):
+            refresh = self.post('/api/auth/refresh/', {'refresh': refresh}).json()['refresh']
+        with mock.patch('apps.authentication.revocation.cache', worker_a):
+            self.assertEqual(self.post('/api/auth/logout/', {'refresh_token': refresh}).status_code, 205)
+        with mock.patch('apps.authentication.revocation.cache', worker_b):
+            self.assertEqual(self.post('/api/auth/refresh/', {'refresh': refresh}).status_code, 401)
+
+    def test_revoked_refresh_rejected(self):
+        refresh = CustomRefreshToken.for_user(self.user)
+        self.assertEqual(self.post('/api/auth/logout/', {'refresh_token': str(refresh)}).status_code, 205)
+        self.assertEqual(self.post('/api/auth/refresh/', {'refresh': str(refresh)}).status_code, 401)
+
+        cache.delete(REVOKED_REFRESH_KEY.format(refresh['jti']))    # Отметка отзыва вытеснена из кеша
+        self.assertEqual(self.post('/api/auth/refresh/', {'refresh': str(refresh)}).status_code, 401)
+
+    def test_rotated_refresh_rejected(self):
+        refresh = str(CustomRefreshToken.for_user(self.user))
+        rotated = self.post('/api/auth/refresh/', {'refresh': refresh}).json()['refresh']
+        self.assertEqual(self.post('/api/auth/refresh/', {'refresh': refresh}).status_code, 401)
+        self.assertEqual(self.post('/api/auth/refresh/', {'refresh': rotated}).status_code, 200)
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    """Отзыв сессий требует общего кеша: без него - предупреждение check --deploy"""
+
+    def test_process_cache_warns(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['authentication.W001'])
+        with mock.patch('apps.authentication.checks.is_shared_cache', return_value=True):
+            self.assertEqual(check_shared_cache(None), [])
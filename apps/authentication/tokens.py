@@ -1,16 +1,56 @@
-from rest_framework_simplejwt.tokens import AccessToken
-from django.contrib.auth.models import Group
+import uuid
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .revocation import refresh_revocation, remember_valid_refresh
+
+
+def add_user_claims(token, user):
+    """Добавление в токен данных для авторизации без обращения к БД (см. ClaimsJWTAuthentication)"""
+    groups = user.groups.all().values_list('name', flat=True)
+    token['groups'] = list(groups)
+    token['username'] = user.get_username()
+    token['is_staff'] = user.is_staff
+    token['is_superuser'] = user.is_superuser
+
+    if hasattr(user, 'ldap_user') and 'department' in user.ldap_user.attrs:
+        token['department'] = user.ldap_user.attrs['department'][0]
+
+    return token
 
 
 class CustomAccessToken(AccessToken):
     @classmethod
     def for_user(cls, user):
-        token = super().for_user(user)
+        return add_user_claims(super().for_user(user), user)
 
-        groups = user.groups.all().values_list('name', flat=True)
-        token['groups'] = list(groups)
 
-        if hasattr(user, 'ldap_user') and 'department' in user.ldap_user.attrs:
-            token['department'] = user.ldap_user.attrs['department'][0]
+class CustomRefreshToken(RefreshToken):
+    """Refresh-токен с данными пользователя и идентификатором сессии (sid).
 
+    Данные копируются в выдаваемые access-токены и сохраняются при ротации refresh-токена,
+    sid позволяет отозвать все токены сессии при выходе.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = add_user_claims(super().for_user(user), user)
+        token['sid'] = uuid.uuid4().hex
+        token.remember_valid()
         return token
+
+    def remember_valid(self):
+        """Отметка в кеше для нового (только что выданного) токена: при обновлении он не проверяется по БД"""
+        remember_valid_refresh(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+
+    def check_blacklist(self):
+        """Проверка по кешу (отозван; проверен и не отозван - только при общем кеше), по БД - если токена нет в кеше"""
+        revoked = refresh_revocation(self.payload[api_settings.JTI_CLAIM])
+        if revoked:
+            raise TokenError(_('Token is blacklisted'))
+        if revoked is None:
+            super().check_blacklist()
+            self.remember_valid()
@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import LDAPLoginView, LDAPLogoutView
+from rest_framework_simplejwt.views import TokenRefreshView
+from .views import LDAPLoginView, LDAPLogoutView, LDAPRefreshStatsView
 
 urlpatterns = [
     path('login/', LDAPLoginView.as_view(), name='login'),
     path('logout/', LDAPLogoutView.as_view(), name='logout'),
+    path('refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('ldap-refresh/stats/', LDAPRefreshStatsView.as_view(), name='ldap-refresh-stats'),
 ]
@@ -1,9 +1,13 @@
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 
+from .middleware import refresh_stats
+from .revocation import revoke_session
+from .tokens import CustomRefreshToken
+
 
 class LDAPLoginView(APIView):
     def post(self, request):
@@ -13,7 +17,7 @@ class LDAPLoginView(APIView):
         user = authenticate(request=request, username=username, password=password)
 
         if user:
-            refresh = RefreshToken.for_user(user)
+            refresh = CustomRefreshToken.for_user(user)
             access = refresh.access_token
             return Response(
                 {
@@ -32,9 +36,17 @@ class LDAPLogoutView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data.get('refresh_token')
-            token = RefreshToken(refresh_token)
+            token = CustomRefreshToken(refresh_token)
             token.blacklist()
+            revoke_session(token)
             return Response(status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+
+class LDAPRefreshStatsView(APIView):
+    """Счетчики кеша обновления пользователей из LDAP (попадания/промахи/обращения к каталогу)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(refresh_stats.snapshot(), status=status.HTTP_200_OK)
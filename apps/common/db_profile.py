@@ -0,0 +1,15 @@
+from django.conf import settings
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Прагмы SQLite (SQLITE_PRAGMAS) для каждого нового соединения (сигнал connection_created)"""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def check_pool_connection(conn) -> None:
+    """Проверка соединения из пула psycopg перед выдачей (разорванное соединение пул заменит новым)"""
+    conn.execute('SELECT 1')
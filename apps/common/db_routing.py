@@ -0,0 +1,114 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.common.utils import is_shared_cache
+
+# Псевдоним реплики в DATABASES (чтение аналитики и списков)
+REPLICA_DB_ALIAS = 'replica'
+
+PIN_CACHE_KEY = 'db:pin-primary:{}'
+
+# Чтение текущего запроса/задачи идет с реплики (только внутри replica_reads)
+_read_replica = ContextVar('read_replica', default=False)
+
+
+def replica_configured() -> bool:
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+class PrimaryReplicaRouter:
+    """Маршрутизация БД: запись, аутентификация, импорт - основная база (default);
+    чтение с реплики - только в представлениях-отчетах (ReplicaReadMixin) и только если
+    пользователь не закреплен за основной базой после своего импорта (pin_primary).
+    """
+
+    def db_for_read(self, model, **hints):
+        return REPLICA_DB_ALIAS if _read_replica.get() else 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True    # Реплика - копия default: связи между объектами из обеих баз допустимы
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_DB_ALIAS:
+            return False    # Схему реплике передает репликация (локально - sync_replica)
+        return None
+
+
+def pin_primary(user_id) -> None:
+    """Закрепление пользователя за основной базой на REPLICA_PIN_SECONDS после записи:
+    реплика может отставать, а пользователь должен сразу видеть результат своего импорта.
+    Закрепление должны видеть все воркеры: в общем кеше, иначе - в основной базе (PrimaryPin).
+    """
+    if not replica_configured() or user_id is None:
+        return
+    if is_shared_cache():
+        cache.set(PIN_CACHE_KEY.format(user_id), True, settings.REPLICA_PIN_SECONDS)
+        return
+    from apps.common.models import PrimaryPin
+
+    PrimaryPin.objects.using('default').update_or_create(
+        user_id=user_id, defaults={'pinned_until': timezone.now() + timedelta(seconds=settings.REPLICA_PIN_SECONDS)},
+    )
+
+
+def primary_pinned(user_id) -> bool:
+    if user_id is None:
+        return False
+    if is_shared_cache():
+        return bool(cache.get(PIN_CACHE_KEY.format(user_id)))
+    from apps.common.models import PrimaryPin
+
+    return PrimaryPin.objects.using('default').filter(user_id=user_id, pinned_until__gt=timezone.now()).exists()
+
+
+def reads_from_replica(user_id=None) -> bool:
+    """Чтение пользователя идет с реплики: она настроена и пользователь не закреплен за основной базой.
+        Без общего кеша - запрос к основной базе: из асинхронного кода вызывать через sync_to_async.
+    """
+    return replica_configured() and not primary_pinned(user_id)
+
+
+@contextmanager
+def replica_reads(user_id=None, enabled=None):
+    """Чтение внутри блока с реплики (если она настроена и пользователь не закреплен за основной базой).
+        enabled - заранее вычисленный reads_from_replica (в асинхронном коде).
+    """
+    if enabled is None:
+        enabled = reads_from_replica(user_id)
+    if not enabled:
+        yield
+        return
+    token = _read_replica.set(True)
+    try:
+        yield
+    finally:
+        _read_replica.reset(token)
+
+
+class ReplicaReadMixin:
+    """Представление DRF только для чтения, запросы обработчика которого идут на реплику.
+
+    Аутентификация и проверка прав выполняются до переключения - по основной базе
+    (отозванные токены, роли видны сразу).
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._replica_reads = replica_reads(getattr(request.user, 'pk', None))
+        self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica = getattr(self, '_replica_reads', None)
+        if replica is not None:
+            self._replica_reads = None
+            replica.__exit__(None, None, None)
+        return super().finalize_response(request, response, *args, **kwargs)
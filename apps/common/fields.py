@@ -0,0 +1,85 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models
+
+
+def to_minor_units(value, decimal_places) -> int:
+    """Сумма -> целое число минимальных единиц (10^-decimal_places)"""
+    return int(Decimal(value).scaleb(decimal_places).to_integral_value(ROUND_HALF_UP))
+
+
+def from_minor_units(value, decimal_places) -> Decimal:
+    """Целое число минимальных единиц (из БД: int, на PostgreSQL SUM(bigint) - Decimal) -> сумма"""
+    return Decimal(value).scaleb(-decimal_places)
+
+
+def minor_units_column(column, decimal_places, max_digits=18) -> tuple:
+    """Колонка сумм pandas.Series -> (int64 минимальных единиц, число нечисловых значений) одним проходом по колонке.
+        Строки с десятичной запятой разбираются; пустые и нечисловые значения - 0, нечисловые подсчитываются.
+        Сумма, не помещающаяся в max_digits, - ValueError (раньше такая сумма не сохранялась в БД).
+    """
+    import pandas as pd
+
+    missing = column.isna()
+    if not pd.api.types.is_numeric_dtype(column):
+        column = column.astype(str).str.replace(',', '.', regex=False).str.strip()
+        missing |= column.isin(('', 'nan', 'None', 'NaT', '<NA>'))
+    values = pd.to_numeric(column, errors='coerce')
+    unparsed = int((values.isna() & ~missing).sum())
+
+    oversized = values.abs() >= 10 ** (max_digits - decimal_places)
+    if oversized.any():
+        rows = ', '.join(map(str, column.index[oversized][:5]))
+        raise ValueError(
+            f'Колонка "{str(column.name).strip()}": сумм, не помещающихся в {max_digits} знаков, - '
+            f'{int(oversized.sum())} (строки {rows})'
+        )
+    return (values.fillna(0) * 10 ** decimal_places).round().astype('int64'), unparsed
+
+
+class MinorUnits(int):
+    """Сумма, уже переведенная в минимальные единицы (10^-decimal_places): MoneyField пишет ее в БД как есть.
+        Позволяет передать результат minor_units_column в модель без обратного перевода в Decimal на каждую ячейку.
+    """
+
+    def __new__(cls, value, decimal_places):
+        obj = super().__new__(cls, value)
+        obj.decimal_places = decimal_places
+        return obj
+
+    def to_decimal(self) -> Decimal:
+        return from_minor_units(int(self), self.decimal_places)
+
+
+class MoneyField(models.DecimalField):
+    """Денежная сумма, которая хранится целым числом минимальных единиц (BIGINT).
+
+    В Python значение - Decimal с decimal_places знаками, как у DecimalField (сериализаторы, формы и фильтры
+    работают без изменений); в БД - целое, поэтому SUM считается точно и по целым числам
+    (DecimalField на SQLite хранится как REAL/TEXT). max_digits по умолчанию - сколько вмещает BIGINT.
+    """
+
+    def __init__(self, *args, max_digits=18, **kwargs):
+        super().__init__(*args, max_digits=max_digits, **kwargs)
+
+    def get_internal_type(self):
+        return 'BigIntegerField'
+
+    def get_prep_value(self, value):
+        if isinstance(value, MinorUnits):
+            return value.to_decimal() if value.decimal_places != self.decimal_places else value
+        return super().get_prep_value(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None or hasattr(value, 'as_sql'):
+            return value
+        if isinstance(value, MinorUnits):
+            return int(value)
+        return to_minor_units(value, self.decimal_places)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return from_minor_units(value, self.decimal_places)
@@ -0,0 +1,255 @@
+import io
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+
+# Расположение колонок ОФ-9, которое ожидает read_excel_file (заголовок в 4-й строке, данные с 8-й).
+# Повторяющиеся в реальном отчете заголовки pandas нумерует суффиксом .1 - здесь они записаны сразу так.
+OF9_COLUMNS = (
+    (1, 'Район'),
+    (2, 'Наименование предприятия'),
+    (3, 'ИНН'),
+    (4, 'Адрес'),
+    (5, 'Категория'),
+    (6, 'Категория по бизнес плану'),
+    (7, '№ Договора'),
+    (8, 'Дата заключения'),
+    (10, 'Дата расторжения'),
+    (11, 'Вид договора'),
+    (27, 'Дебиторская задолженность на 31.05.2025'),
+    (28, 'В т.ч. по актам недоучета.1'),
+    (29, '     текущая       (до 30 дней).1'),
+    (30, 'просроченная.1'),
+    (37, 'Дата возникновения задолженности'),
+    (38, 'Кредиторская задолженность на 31.05.2025'),
+)
+OF9_HEADER_ROW, OF9_FIRST_ROW = 4, 8
+
+DISTRICTS = ('Центральный', 'Северный', 'Южный', 'Западный', 'Восточный')
+
+SCENARIOS = ('login', 'refresh', 'upload', 'debtors', 'group_debt')
+DEFAULT_MIX = {'login': 1, 'refresh': 2, 'upload': 0.2, 'debtors': 6, 'group_debt': 3}
+
+
+def build_of9_workbook(rows, seed=0, offset=0) -> bytes:
+    """Excel-файл в формате ОФ-9 со сгенерированными контрагентами и договорами.
+        Договор с одним номером при одинаковых seed/offset получает одного и того же контрагента,
+        поэтому повторная загрузка обновляет уже существующие записи.
+    """
+    from openpyxl import Workbook
+
+    rnd = random.Random(seed)
+    workbook = Workbook()
+    sheet = workbook.active
+    for column, name in OF9_COLUMNS:
+        sheet.cell(row=OF9_HEADER_ROW, column=column + 1, value=name)
+
+    for i in range(offset, offset + rows):
+        debt_total = round(rnd.uniform(0, 500000), 2)
+        values = (
+            DISTRICTS[i % len(DISTRICTS)],
+            f'ООО Нагрузка {i // 2}',
+            str(7700000000 + i // 2),
+            f'г. Москва, ул. Тестовая, д. {i % 3 + 1}',
+            f'Категория {i % 7}',
+            f'Бизнес-план {i % 3}',
+            f'LT-{i:07d}',
+            None,
+            None,
+            'Энергоснабжение',
+            debt_total,
+            0,
+            round(debt_total * 0.3, 2),
+            round(debt_total * rnd.random(), 2),
+            None,
+            round(rnd.uniform(0, 1000), 2),
+        )
+        for (column, _), value in zip(OF9_COLUMNS, values):
+            sheet.cell(row=OF9_FIRST_ROW + i - offset, column=column + 1, value=value)
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def percentile(values, q) -> float:
+    """Перцентиль по методу ближайшего ранга (values отсортированы)"""
+    if not values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+@dataclass
+class ScenarioStats:
+    latencies: list = field(default_factory=list)
+    errors: int = 0
+
+    def summary(self, elapsed) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p95': round(percentile(latencies, 95) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2),
+        }
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LoadTestServer:
+    """Приложение в WSGI-сервере с пулом потоков (как runserver) на свободном порту"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = ThreadedWSGIServer((host, port), _QuietRequestHandler, allow_reuse_address=False)
+        self._server.set_app(get_wsgi_application())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class VirtualUser:
+    """Пользователь портала: входит через LDAP, затем выполняет сценарии в заданной пропорции"""
+
+    def __init__(self, client, username, password, rnd, upload_file, counterparty_ids):
+        self.client = client
+        self.username = username
+        self.password = password
+        self.rnd = rnd
+        self.upload_file = upload_file
+        self.counterparty_ids = counterparty_ids
+        self.access = self.refresh = None
+
+    def _auth(self) -> dict:
+        return {'Authorization': f'Bearer {self.access}'}
+
+    def login(self):
+        response = self.client.post('/api/auth/login/', json={'username': self.username, 'password': self.password})
+        if response.status_code == 200:
+            self.access, self.refresh = response.json()['access'], response.json()['refresh']
+        return response
+
+    def refresh_token(self):
+        response = self.client.post('/api/auth/refresh/', json={'refresh': self.refresh})
+        if response.status_code == 200:
+            self.access = response.json()['access']
+            self.refresh = response.json().get('refresh', self.refresh)
+        return response
+
+    def upload(self):
+        files = {'file': ('loadtest.xlsx', self.upload_file, 'application/vnd.ms-excel')}
+        return self.client.post('/api/companies/upload/', files=files, headers=self._auth())
+
+    def debtors(self):
+        params = {'district': self.rnd.choice(DISTRICTS), 'limit': 50}
+        return self.client.get('/api/companies/debtors/top/', params=params, headers=self._auth())
+
+    def group_debt(self):
+        pk = self.rnd.choice(self.counterparty_ids)
+        return self.client.get(f'/api/companies/groups/{pk}/debt/', headers=self._auth())
+
+
+@dataclass
+class LoadTestResult:
+    elapsed: float
+    scenarios: dict
+
+    def report(self) -> dict:
+        total = ScenarioStats()
+        for stats in self.scenarios.values():
+            total.latencies.extend(stats.latencies)
+            total.errors += stats.errors
+        return {
+            'elapsed': round(self.elapsed, 3),
+            'total': total.summary(self.elapsed),
+            'scenarios': {name: stats.summary(self.elapsed) for name, stats in sorted(self.scenarios.items())},
+        }
+
+
+def run_load(base_url, users, requests_per_user, mix, password, upload_file, counterparty_ids, seed=0):
+    """Запуск users виртуальных пользователей, каждый выполняет requests_per_user запросов.
+        Выбор сценариев детерминирован seed, поэтому повторные прогоны дают одинаковую нагрузку.
+    """
+    import httpx
+
+    names, weights = zip(*[(name, weight) for name, weight in mix.items() if weight > 0])
+    scenarios = {name: ScenarioStats() for name in names}
+    lock, setup_lock = threading.Lock(), threading.Lock()
+    barrier = threading.Barrier(users + 1)
+
+    def worker(index):
+        rnd = random.Random(seed * 100003 + index)
+        with httpx.Client(base_url=base_url, timeout=120) as client:
+            user = VirtualUser(client, f'loadtest_{index}', password, rnd, upload_file, counterparty_ids)
+            with setup_lock:    # Первый вход по очереди: прогон начинается с одинакового состояния
+                user.login()
+            plan = rnd.choices(names, weights=weights, k=requests_per_user)
+            barrier.wait()
+            for name in plan:
+                started = time.perf_counter()
+                try:
+                    ok = getattr(user, 'refresh_token' if name == 'refresh' else name)().status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                latency = time.perf_counter() - started
+                with lock:
+                    scenarios[name].latencies.append(latency)
+                    scenarios[name].errors += not ok
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return LoadTestResult(time.perf_counter() - started, scenarios)
+
+
+def compare_reports(report, baseline, tolerance) -> list:
+    """Регрессии относительно сохраненного отчета: рост p95 или падение пропускной способности больше tolerance"""
+    regressions = []
+    for name, current in {'total': report['total'], **report['scenarios']}.items():
+        previous = baseline['scenarios'].get(name) if name != 'total' else baseline.get('total')
+        if not previous:
+            continue
+        if previous['p95'] and current['p95'] > previous['p95'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {previous["p95"]} -> {current["p95"]} мс')
+        if previous['throughput'] and current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f'{name}: пропускная способность {previous["throughput"]} -> {current["throughput"]} запросов/с')
+        if current['errors'] > previous['errors']:
+            regressions.append(f'{name}: ошибок {previous["errors"]} -> {current["errors"]}')
+    return regressions
+
+
+def load_report(path) -> dict:
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_report(report, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
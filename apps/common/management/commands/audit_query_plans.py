@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from apps.common.loadtest import DISTRICTS, build_of9_workbook
+from apps.common.query_plans import QueryRecorder, audit
+
+# Приложения, таблицы которых проверяются (служебные таблицы Django не входят)
+AUDITED_APPS = ('authentication', 'common', 'companies', 'token_blacklist')
+
+
+class Command(BaseCommand):
+    help = ('Аудит планов запросов на канонической нагрузке: импорт ОФ-9 (создание и обновление), '
+            'связывание подразделений, запросы API отчетов и токенов в тестовой БД. По EXPLAIN отмечает '
+            'полные просмотры таблиц, неиспользуемые и дублирующие индексы; итог - основа миграций индексов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Строк ОФ-9 в импортируемом файле')
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Полный просмотр таблиц меньшего размера не считается замечанием')
+        parser.add_argument('--plans', action='store_true', help='Вывести планы всех запросов')
+        parser.add_argument('--json', action='store_true', help='Отчет в JSON')
+        parser.add_argument('--fail-on-findings', action='store_true',
+                            help='Код возврата 1, если есть замечания (для CI)')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory(prefix='audit-plans-') as workdir:
+            test_db = connection.settings_dict.setdefault('TEST', {})
+            if connection.vendor == 'sqlite' and not test_db.get('NAME'):
+                test_db['NAME'] = os.path.join(workdir, 'audit.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            for alias in connections:
+                if connections[alias].settings_dict.get('TEST', {}).get('MIRROR') == 'default':
+                    connections[alias].creation.set_as_test_mirror(connection.settings_dict)    # Реплика
+            settings.MEDIA_ROOT = os.path.join(workdir, 'uploads')
+            setup_test_environment()
+            try:
+                report = self._audit(options)
+            finally:
+                teardown_test_environment()
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            self._print(report, options['plans'])
+        findings = sum(len(query['full_scans']) for query in report['queries'])
+        findings += len(report['redundant']) + len(report['unused'])
+        if options['fail_on_findings'] and findings:
+            raise CommandError(f'Замечаний аудита: {findings}')
+
+    def _audit(self, options) -> dict:
+        with QueryRecorder() as recorder:
+            self._workload(recorder, options['rows'])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')    # Статистика для планировщика - как у заполненной базы
+        tables = {model._meta.db_table for name in AUDITED_APPS for model in apps.get_app_config(name).get_models()}
+        return audit(recorder.queries.values(), tables, options['min_rows'])
+
+    @staticmethod
+    def _workload(recorder, rows) -> None:
+        """Каноническая нагрузка: те же пути кода, что в работе (сервисы импорта и запросы API)"""
+        from apps.authentication.tokens import CustomRefreshToken
+        from apps.companies.hierarchy import resolve_counterparty_hierarchy
+        from apps.companies.models import Category, CounterpartyStatus, DebtorRanking, ImportJob
+        from apps.companies.services import process_excel_file
+
+        user = get_user_model().objects.create(username='audit_query_plans')
+        for label, seed in (('импорт ОФ-9: создание', 0), ('импорт ОФ-9: обновление', 1)):
+            recorder.label = label
+            process_excel_file(SimpleUploadedFile(f'audit-{seed}.xlsx', build_of9_workbook(rows, seed=seed)), user)
+        recorder.label = 'связывание подразделений'
+        resolve_counterparty_hierarchy()
+
+        recorder.label = None
+        refresh = CustomRefreshToken.for_user(user)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        group = DebtorRanking.objects.order_by('-debt_total').values_list('counterparties_id', flat=True).first()
+        reads = (
+            ('топ должников', '/api/companies/debtors/top/'),
+            ('топ должников района', f'/api/companies/debtors/top/?district={DISTRICTS[0]}'),
+            ('топ должников категории',
+             f'/api/companies/debtors/top/?category={Category.objects.values_list("pk", flat=True).first()}'),
+            ('топ должников по статусу',
+             f'/api/companies/debtors/top/?status={CounterpartyStatus.ACTIVE}&order_by=debt_overdue'),
+            ('задолженность группы', f'/api/companies/groups/{group}/debt/'),
+            ('список импортов', '/api/companies/imports/'),
+            ('статус импорта', f'/api/companies/imports/{ImportJob.objects.values_list("pk", flat=True).first()}/'),
+        )
+        for label, url in reads:
+            recorder.label = label
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{label}: {url} - HTTP {response.status_code}')
+
+        recorder.label = 'обновление токена'
+        client.post('/api/auth/refresh/', {'refresh': str(refresh)}, content_type='application/json')
+        recorder.label = 'выход'
+        client.post('/api/auth/logout/', {'refresh': str(refresh)}, content_type='application/json')
+
+    def _print(self, report, plans) -> None:
+        self.stdout.write(f'База: {report["database"]}, шаблонов запросов: {len(report["queries"])}')
+        for query in report['queries']:
+            if not (plans or query['full_scans'] or query['error']):
+                continue
+            mark = 'ПОЛНЫЙ ПРОСМОТР ' + ', '.join(query['full_scans']) if query['full_scans'] else ''
+            self.stdout.write(f'\n[{query["label"]}] x{query["count"]} {mark}'.rstrip())
+            self.stdout.write(f'  {query["sql"][:300]}')
+            for line in query['plan']:
+                self.stdout.write(f'    {line}')
+            if query['error']:
+                self.stdout.write(self.style.ERROR(f'    EXPLAIN: {query["error"]}'))
+
+        self.stdout.write('\nИндексы:')
+        for index in report['indexes']:
+            flags = ', '.join(flag for flag, on in (('PK', index['primary_key']), ('unique', index['unique']),
+                                                    ('используется', index['used'])) if on)
+            self.stdout.write(f'  {index["table"]}.{index["name"]} ({", ".join(index["columns"])}) {flags}')
+
+        self.stdout.write('\nДублирующие индексы:')
+        for index in report['redundant'] or [None]:
+            if index is None:
+                self.stdout.write('  нет')
+                continue
+            self.stdout.write(self.style.WARNING(
+                f'  {index["table"]}.{index["name"]} ({", ".join(index["columns"])}) - {index["reason"]} индекса '
+                f'{index["covered_by"]} ({", ".join(index["covered_columns"])}); '
+                f'{index["model"]}: убрать {index["declared"] or "индекс"}'
+            ))
+
+        self.stdout.write('\nНе используются нагрузкой:')
+        for index in report['unused'] or [None]:
+            if index is None:
+                self.stdout.write('  нет')
+                continue
+            self.stdout.write(
+                f'  {index["table"]}.{index["name"]} ({", ".join(index["columns"])})'
+                f'{" - " + index["model"] + ": " + index["declared"] if index["model"] else ""}'
+            )
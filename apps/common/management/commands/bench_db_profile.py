@@ -0,0 +1,167 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connection, connections
+
+from apps.common.loadtest import DISTRICTS, build_of9_workbook, percentile
+
+# Варианты профиля БД: переменные окружения прогона (см. DB_PROFILE в core/settings.py)
+VARIANTS = {
+    'sqlite-default': {'DB_PROFILE': 'sqlite', 'SQLITE_TUNING': '0'},
+    'sqlite': {'DB_PROFILE': 'sqlite'},
+    'postgres-direct': {'DB_PROFILE': 'postgres', 'DB_CONN_MAX_AGE': '0'},
+    'postgres': {'DB_PROFILE': 'postgres'},
+    'postgres_pool': {'DB_PROFILE': 'postgres_pool'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Сравнение профилей БД: скорость импорта ОФ-9 (создание и обновление записей), пропускная способность '
+            'чтения рейтинга должников и чтение во время импорта. Каждый профиль - отдельный процесс '
+            'с тестовой БД; PostgreSQL-профили используют POSTGRES_* из окружения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='sqlite-default,sqlite',
+                            help=f'Профили через запятую (доступны: {", ".join(VARIANTS)})')
+        parser.add_argument('--rows', type=int, default=5000, help='Строк ОФ-9 в импортируемом файле')
+        parser.add_argument('--readers', type=int, default=8, help='Потоков чтения')
+        parser.add_argument('--reads', type=int, default=200, help='Запросов на поток чтения')
+        parser.add_argument('--writes', type=int, default=500,
+                            help='Коротких транзакций записи (как части загрузки, прогресс импорта)')
+        parser.add_argument('--run', action='store_true', help='Замер текущего профиля в этом процессе (JSON)')
+
+    def handle(self, *args, **options):
+        if options['run']:
+            self.stdout.write(json.dumps(self._run(options)))
+            return
+
+        results = {}
+        for name in dict.fromkeys(options['profiles'].split(',')):
+            if name not in VARIANTS:
+                raise CommandError(f'Неизвестный профиль: {name} (доступны: {", ".join(VARIANTS)})')
+            self.stdout.write(f'Профиль {name}...')
+            process = subprocess.run(
+                [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_db_profile', '--run',
+                 '--rows', str(options['rows']), '--readers', str(options['readers']),
+                 '--reads', str(options['reads']), '--writes', str(options['writes'])],
+                env={**os.environ, **VARIANTS[name]}, capture_output=True, text=True,
+            )
+            if process.returncode:
+                self.stderr.write(f'{name}: ошибка\n{process.stderr.strip()[-2000:]}')
+                continue
+            results[name] = json.loads(process.stdout.strip().splitlines()[-1])
+        self._print(results)
+
+    def _run(self, options) -> dict:
+        with tempfile.TemporaryDirectory(prefix='bench-db-') as workdir:
+            test_db = connection.settings_dict.setdefault('TEST', {})
+            if connection.vendor == 'sqlite' and not test_db.get('NAME'):
+                test_db['NAME'] = os.path.join(workdir, 'bench.sqlite3')    # Файл: прагмы и WAL как в работе
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            settings.MEDIA_ROOT = os.path.join(workdir, 'uploads')
+            try:
+                return self._measure(options)
+            finally:
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _measure(self, options) -> dict:
+        from apps.companies.services import process_excel_file
+
+        rows = options['rows']
+        user = get_user_model().objects.create(username='bench_db_profile')
+        files = [build_of9_workbook(rows, seed=seed) for seed in range(3)]
+
+        def run_import(seed) -> float:
+            started = time.perf_counter()
+            process_excel_file(SimpleUploadedFile(f'bench-{seed}.xlsx', files[seed]), user)
+            return rows / (time.perf_counter() - started)
+
+        result = {
+            'import_rows_per_s': round(run_import(0), 1),     # Создание записей
+            'reimport_rows_per_s': round(run_import(1), 1),   # Те же договоры, другие суммы: обновление
+            'reads': self._read_load(options['readers'], options['reads']),
+            'writes_per_s': self._write_load(user, options['writes']),
+        }
+
+        importer = threading.Thread(target=run_import, args=(2,))
+        importer.start()
+        result['reads_during_import'] = self._read_load(options['readers'], None, until=importer)
+        importer.join()
+        return result
+
+    @staticmethod
+    def _write_load(user, writes) -> float:
+        """Короткие транзакции записи по одной строке: здесь видна стоимость фиксации (fsync)"""
+        from apps.companies.models import UploadSession
+
+        session = UploadSession.objects.create(uploaded_by=user, file_name='bench.xlsx', size=writes)
+        started = time.perf_counter()
+        for offset in range(1, writes + 1):
+            UploadSession.objects.filter(pk=session.pk).update(offset=offset)
+        return round(writes / (time.perf_counter() - started), 1)
+
+    @staticmethod
+    def _read_load(readers, reads, until=None) -> dict:
+        """Чтение топа должников района потоками, как запросы API: соединения закрываются/возвращаются
+        по сигналу окончания запроса (CONN_MAX_AGE, пул). until - читать, пока идет поток импорта.
+        """
+        from apps.companies.models import DebtorRanking
+
+        latencies, errors, lock = [], [], threading.Lock()
+
+        def reader(index):
+            done = 0
+            while (until.is_alive() if until else done < reads):
+                request_started.send(sender=None)
+                started = time.perf_counter()
+                try:
+                    list(DebtorRanking.objects.filter(district=DISTRICTS[(index + done) % len(DISTRICTS)])
+                         .select_related('counterparties').order_by('-debt_total')[:50])
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e))
+                else:
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+                finally:
+                    request_finished.send(sender=None)
+                done += 1
+            connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'per_s': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        }
+
+    def _print(self, results):
+        self.stdout.write(f'{"Профиль":<16}{"импорт, стр/с":>15}{"обновл., стр/с":>16}{"чтение, зап/с":>15}'
+                          f'{"p95, мс":>10}{"чтение при импорте":>20}{"p95, мс":>10}{"запись, тр/с":>14}'
+                          f'{"ошибок":>8}')
+        for name, result in results.items():
+            reads, during = result['reads'], result['reads_during_import']
+            self.stdout.write(
+                f'{name:<16}{result["import_rows_per_s"]:>15}{result["reimport_rows_per_s"]:>16}{reads["per_s"]:>15}'
+                f'{reads["p95_ms"]:>10}{during["per_s"]:>20}{during["p95_ms"]:>10}{result["writes_per_s"]:>14}'
+                f'{reads["errors"] + during["errors"]:>8}'
+            )
@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.common.utils import uuid7
+
+GENERATORS = {'uuid4': uuid.uuid4, 'uuid7': uuid7}
+
+
+class Command(BaseCommand):
+    help = ('Сравнение uuid4 и uuid7 в первичном ключе: скорость вставки пачками (как bulk_create при импорте) '
+            'и размер индекса. SQLite - во временном файле, PostgreSQL - во временных таблицах текущей БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Количество строк')
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки вставки')
+        parser.add_argument('--preload', type=int, default=0,
+                            help='Строк в таблице до замера (имитация уже накопленных данных)')
+
+    def handle(self, *args, **options):
+        bench = self._bench_postgresql if connection.vendor == 'postgresql' else self._bench_sqlite
+        for name, generator in GENERATORS.items():
+            elapsed, index_size = bench(name, generator, options)
+            self.stdout.write(
+                f'{name}: строк: {options["rows"]}, время: {elapsed:.2f} с '
+                f'({options["rows"] / elapsed:.0f} строк/с), индекс первичного ключа: {index_size / 1024 / 1024:.2f} МБ'
+            )
+
+    @staticmethod
+    def _batches(generator, rows, batch_size, to_db):
+        for start in range(0, rows, batch_size):
+            yield [(to_db(generator()), f'payload {i}') for i in range(start, min(start + batch_size, rows))]
+
+    def _bench_sqlite(self, name, generator, options):
+        with tempfile.TemporaryDirectory() as workdir:
+            db = sqlite3.connect(os.path.join(workdir, f'{name}.sqlite3'))
+            # Как у Django на SQLite: UUID хранится в char(32), первичный ключ - неявный уникальный индекс
+            db.execute('CREATE TABLE bench (id char(32) NOT NULL PRIMARY KEY, payload varchar(100) NOT NULL)')
+            for batch in self._batches(generator, options['preload'], options['batch_size'], lambda u: u.hex):
+                db.executemany('INSERT INTO bench VALUES (?, ?)', batch)
+            db.commit()
+
+            started = time.perf_counter()
+            for batch in self._batches(generator, options['rows'], options['batch_size'], lambda u: u.hex):
+                db.executemany('INSERT INTO bench VALUES (?, ?)', batch)
+                db.commit()
+            elapsed = time.perf_counter() - started
+
+            index_size = db.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = 'sqlite_autoindex_bench_1'"
+            ).fetchone()[0]
+            db.close()
+        return elapsed, index_size
+
+    def _bench_postgresql(self, name, generator, options):
+        table = f'bench_uuid_keys_{name}'
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TEMPORARY TABLE {table} (id uuid PRIMARY KEY, payload varchar(100) NOT NULL)')
+            try:
+                insert = f'INSERT INTO {table} VALUES (%s, %s)'
+                for batch in self._batches(generator, options['preload'], options['batch_size'], str):
+                    cursor.executemany(insert, batch)
+
+                started = time.perf_counter()
+                for batch in self._batches(generator, options['rows'], options['batch_size'], str):
+                    cursor.executemany(insert, batch)
+                elapsed = time.perf_counter() - started
+
+                cursor.execute('SELECT pg_indexes_size(%s::regclass)', [table])
+                index_size = cursor.fetchone()[0]
+            finally:
+                cursor.execute(f'DROP TABLE {table}')
+        return elapsed, index_size
@@ -0,0 +1,117 @@
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from apps.common.loadtest import (
+    DEFAULT_MIX,
+    SCENARIOS,
+    LoadTestServer,
+    build_of9_workbook,
+    compare_reports,
+    load_report,
+    run_load,
+    save_report,
+)
+
+LOADTEST_PASSWORD = 'loadtest'
+
+
+def _parse_mix(value) -> dict:
+    mix = dict.fromkeys(SCENARIOS, 0)
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in mix:
+            raise CommandError(f'Неизвестный сценарий: {name} (доступны: {", ".join(SCENARIOS)})')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон API: отдельная тестовая БД с загруженными данными, локальная замена LDAP, '
+            'WSGI-сервер с пулом потоков и виртуальные пользователи со смесью сценариев')
+
+    def add_arguments(self, parser):
+        default_mix = ','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items())
+        parser.add_argument('--users', type=int, default=50, help='Количество одновременных пользователей')
+        parser.add_argument('--requests', type=int, default=20, help='Количество запросов на пользователя')
+        parser.add_argument('--mix', type=_parse_mix, default=_parse_mix(default_mix),
+                            help=f'Веса сценариев (по умолчанию {default_mix})')
+        parser.add_argument('--seed-rows', type=int, default=2000, help='Строк ОФ-9 в начальных данных')
+        parser.add_argument('--upload-rows', type=int, default=200, help='Строк ОФ-9 в загружаемом файле')
+        parser.add_argument('--ldap-latency', type=float, default=0.02, help='Задержка обращения к LDAP, сек')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора (повторяемость прогона)')
+        parser.add_argument('--output', help='Сохранить отчет в JSON-файл')
+        parser.add_argument('--baseline', help='Сравнить с сохраненным отчетом и завершиться ошибкой при регрессии')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое ухудшение относительно базы')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory(prefix='loadtest-') as workdir:
+            test_db = connection.settings_dict.setdefault('TEST', {})
+            if connection.vendor == 'sqlite' and not test_db.get('NAME'):
+                # Файловая БД вместо in-memory: к ней обращаются потоки сервера
+                test_db['NAME'] = os.path.join(workdir, 'loadtest.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                with override_settings(
+                    DEBUG=False,
+                    ALLOWED_HOSTS=['127.0.0.1', 'localhost'],
+                    MEDIA_ROOT=os.path.join(workdir, 'uploads'),
+                    AUTHENTICATION_BACKENDS=['apps.authentication.fake_ldap.FakeLDAPBackend'],
+                    LDAP_USER_REFRESH_BACKEND='apps.authentication.fake_ldap.FakeLDAPBackend',
+                    FAKE_LDAP_PASSWORD=LOADTEST_PASSWORD,
+                    FAKE_LDAP_LATENCY=options['ldap_latency'],
+                ):
+                    report = self._run(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self._print_report(report)
+        if options['output']:
+            save_report(report, options['output'])
+        if options['baseline']:
+            regressions = compare_reports(report, load_report(options['baseline']), options['tolerance'])
+            if regressions:
+                raise CommandError('Регрессия относительно базового отчета:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно базового отчета нет'))
+
+    def _run(self, options) -> dict:
+        from apps.companies.models import Counterparties
+        from apps.companies.services import process_excel_file
+
+        self.stdout.write(f'Загрузка начальных данных: {options["seed_rows"]} строк ОФ-9')
+        seed_user = get_user_model().objects.create(username='loadtest_seed')
+        seed_file = build_of9_workbook(options['seed_rows'], seed=options['seed'])
+        process_excel_file(SimpleUploadedFile('seed.xlsx', seed_file), seed_user)
+        counterparty_ids = [str(pk) for pk in Counterparties.objects.values_list('id', flat=True)]
+        upload_file = build_of9_workbook(options['upload_rows'], seed=options['seed'])
+
+        server = LoadTestServer().start()
+        self.stdout.write(f'Сервер: {server.url}, пользователей: {options["users"]}, '
+                          f'запросов на пользователя: {options["requests"]}')
+        try:
+            result = run_load(
+                server.url,
+                users=options['users'],
+                requests_per_user=options['requests'],
+                mix=options['mix'],
+                password=LOADTEST_PASSWORD,
+                upload_file=upload_file,
+                counterparty_ids=counterparty_ids,
+                seed=options['seed'],
+            )
+        finally:
+            server.stop()
+        return result.report()
+
+    def _print_report(self, report):
+        self.stdout.write(f'{"Сценарий":<12}{"запросов":>10}{"ошибок":>8}{"запр/с":>9}'
+                          f'{"p50, мс":>10}{"p95, мс":>10}{"p99, мс":>10}')
+        for name, row in {**report['scenarios'], 'total': report['total']}.items():
+            self.stdout.write(f'{name:<12}{row["requests"]:>10}{row["errors"]:>8}{row["throughput"]:>9}'
+                              f'{row["p50"]:>10}{row["p95"]:>10}{row["p99"]:>10}')
+        self.stdout.write(f'Время прогона: {report["elapsed"]} с')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from apps.common.db_routing import REPLICA_DB_ALIAS, replica_configured
+
+
+class Command(BaseCommand):
+    help = ('Копирование основной базы SQLite в файл реплики (DATABASE_REPLICA_NAME) - '
+            'локальная замена репликации для проверки чтения отчетов с реплики')
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError('Реплика не настроена: задайте DATABASE_REPLICA_NAME')
+        primary, replica = connections['default'], connections[REPLICA_DB_ALIAS]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Команда только для SQLite: реплику PostgreSQL обновляет репликация СУБД')
+
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+        self.stdout.write(self.style.SUCCESS(f'Реплика обновлена: {replica.settings_dict["NAME"]}'))
@@ -0,0 +1,197 @@
+import bisect
+import threading
+
+# Границы бакетов гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Базовая метрика с набором меток; значения хранятся в памяти процесса"""
+
+    type = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """Монотонный счетчик; callback (как у Gauge) - значения считаются вне реестра и берутся при выгрузке"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self.callback is not None:
+            items = sorted(self.callback().items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge(Metric):
+    """Метрика, значение которой вычисляется при выгрузке (callback возвращает {метки: значение})"""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            items = sorted(self.callback().items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ((), 0))
+        return sum(counts)
+
+    def total(self, **labels):
+        _, total = self._values.get(self._key(labels), ((), 0))
+        return total
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                le = (('le', _format_value(float(bound))),)
+                yield f'{self.name}_bucket', _format_labels(self.labelnames, key, le), cumulative
+            yield f'{self.name}_sum', _format_labels(self.labelnames, key), total
+            yield f'{self.name}_count', _format_labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    """Набор метрик процесса и их выгрузка в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=(), callback=None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def reset(self):
+        for metric in list(self._metrics.values()):
+            if getattr(metric, 'callback', None) is None:
+                metric.reset()
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+# HTTP-запросы
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Время обработки запроса', ('view', 'method'))
+REQUESTS = registry.counter(
+    'http_requests_total', 'Количество запросов', ('view', 'method', 'status'))
+RESPONSE_SIZE = registry.histogram(
+    'http_response_size_bytes', 'Размер тела ответа', ('view',), SIZE_BUCKETS)
+REQUEST_QUERIES = registry.histogram(
+    'http_request_db_queries', 'Количество SQL-запросов за запрос', ('view',), COUNT_BUCKETS)
+REQUEST_DB_TIME = registry.histogram(
+    'http_request_db_duration_seconds', 'Суммарное время SQL-запросов за запрос', ('view',))
+SLOW_REQUESTS = registry.counter(
+    'http_slow_requests_total', 'Количество медленных запросов', ('view',))
+
+# Импорт ОФ-9
+IMPORT_JOBS = registry.counter(
+    'import_jobs_total', 'Количество импортов Excel-файлов', ('status',))
+IMPORT_DURATION = registry.histogram(
+    'import_duration_seconds', 'Длительность импорта', ('stage',))
+IMPORT_ROWS = registry.counter(
+    'import_rows_total', 'Количество обработанных строк Excel')
+IMPORT_OBJECTS = registry.counter(
+    'import_objects_total', 'Количество созданных и обновленных записей при импорте', ('model', 'action'))
+
+# Аутентификация
+LDAP_AUTH = registry.counter(
+    'ldap_auth_total', 'Количество попыток LDAP-аутентификации', ('result',))
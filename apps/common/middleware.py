@@ -0,0 +1,120 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from apps.common.metrics import (
+    REQUEST_DB_TIME,
+    REQUEST_LATENCY,
+    REQUEST_QUERIES,
+    REQUESTS,
+    RESPONSE_SIZE,
+    SLOW_REQUESTS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """Обертка выполнения SQL (connection.execute_wrapper): количество и время запросов"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - started, context['connection'].alias, sql))
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def duration(self) -> float:
+        return sum(duration for duration, _, _ in self.queries)
+
+    def top(self, limit) -> list:
+        return sorted(self.queries, key=lambda query: query[0], reverse=True)[:limit]
+
+
+def track_request_queries(request) -> ExitStack:
+    """Учет SQL-запросов текущего потока в метриках запроса request.
+        Обертка RequestMetricsMiddleware стоит на соединениях потока запроса (туда же попадает
+        sync_to_async с thread_sensitive=True); код запроса в другом потоке (sync_to_async с
+        thread_sensitive=False, пулы потоков) выполняется внутри этого контекста.
+    """
+    stack = ExitStack()
+    recorder = getattr(request, 'query_recorder', None)
+    if recorder is not None:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+    return stack
+
+
+class RequestMetricsMiddleware:
+    """Метрики запросов для /metrics: время обработки, SQL-запросы, размер ответа.
+
+    Запросы дольше SLOW_REQUEST_THRESHOLD секунд пишутся в лог вместе с самыми долгими SQL-запросами.
+    SQL-запросы считаются в потоке запроса; из других потоков - через track_request_queries.
+    """
+
+    sync_capable = True
+    async_capable = True    # Иначе под ASGI вся цепочка уходит в sync_to_async и запросы выполняются по одному
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = request.query_recorder = QueryRecorder()
+        started = time.perf_counter()
+        with self._record_queries(recorder):
+            response = self.get_response(request)
+        self._observe(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        recorder = request.query_recorder = QueryRecorder()
+        started = time.perf_counter()
+        with self._record_queries(recorder):
+            response = await self.get_response(request)
+        self._observe(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def _record_queries(recorder) -> ExitStack:
+        """Обертка на соединениях запроса: соединения общие для контекста, в т.ч. для sync_to_async"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def _observe(self, request, response, recorder, elapsed) -> None:
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        REQUEST_LATENCY.observe(elapsed, view=view, method=request.method)
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        REQUEST_QUERIES.observe(recorder.count, view=view)
+        REQUEST_DB_TIME.observe(recorder.duration, view=view)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), view=view)
+
+        if elapsed >= settings.SLOW_REQUEST_THRESHOLD:
+            SLOW_REQUESTS.inc(view=view)
+            top = '\n'.join(
+                f'  {duration * 1000:.1f} мс [{alias}] {sql}'
+                for duration, alias, sql in recorder.top(settings.SLOW_REQUEST_TOP_QUERIES)
+            )
+            logger.warning(
+                'Медленный запрос %s %s (%s): %.3f с, SQL-запросов: %d (%.3f с)\n%s',
+                request.method, request.path, view, elapsed, recorder.count, recorder.duration, top,
+            )
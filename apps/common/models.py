@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.db import models
-import uuid
 
 from apps.common.managers import GetOrNoneManager
+from apps.common.utils import uuid7
 
 
 class BaseModel(models.Model):
@@ -9,12 +10,12 @@ class BaseModel(models.Model):
     Базовая абстрактная модель.
 
     Атрибуты:
-        id (UUIDField): уникальный идентификатор экземпляра модели.
+        id (UUIDField): уникальный идентификатор экземпляра модели (UUIDv7, упорядочен по времени создания).
         created_at (DateTimeField): Дата и время создания экземпляра модели.
         updated_at (DateTimeField): Дата и время обновления экземпляра модели.
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -22,3 +23,18 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class PrimaryPin(models.Model):
+    """
+    Закрепление пользователя за основной базой после его записи (apps.common.db_routing.pin_primary).
+    Хранится в основной базе, чтобы закрепление видели все воркеры (кеш процесса виден только своему).
+
+    Атрибуты:
+        user (User): закрепленный пользователь.
+        pinned_until (DateTimeField): до какого момента чтение пользователя идет с основной базы.
+    """
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, on_delete=models.CASCADE,
+                                related_name='+')
+    pinned_until = models.DateTimeField()
@@ -0,0 +1,300 @@
+import json
+import re
+from collections import defaultdict
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+
+from django.apps import apps
+from django.db import DatabaseError, connections
+
+# Запросы, план которых разбирается (вставки, точки сохранения, PRAGMA и служебные запросы - нет)
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+# Список параметров IN (...) любой длины - один шаблон запроса
+_PARAMS_LIST = re.compile(r'(%s|\?)(\s*,\s*(%s|\?))+')
+_TABLE_REF = re.compile(
+    r'\b(?:FROM|JOIN|UPDATE|INTO)\s+"?(\w+)"?(?:\s+(?:AS\s+)?"?(?!(?:WHERE|ON|LEFT|INNER|JOIN|SET|GROUP|ORDER'
+    r'|LIMIT|USING|UNION|CROSS|OUTER|RIGHT)\b)(\w+)"?)?',
+    re.IGNORECASE,
+)
+_SQLITE_STEP = re.compile(r'^(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$')
+_SQLITE_INDEX = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+# Узлы плана PostgreSQL, читающие индекс
+PG_INDEX_NODES = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+
+def query_template(sql) -> str:
+    """Шаблон запроса: пробелы схлопнуты, список параметров IN (...) любой длины одинаков"""
+    return _PARAMS_LIST.sub('%s, ...', ' '.join(sql.split()))
+
+
+def table_aliases(sql) -> dict:
+    """Псевдонимы таблиц запроса (U0, r, c) -> имя таблицы; в планах SQLite таблица указана псевдонимом"""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    return aliases
+
+
+@dataclass
+class CapturedQuery:
+    """Шаблон запроса рабочей нагрузки: первый пример с параметрами для EXPLAIN и число выполнений"""
+    alias: str
+    sql: str
+    params: tuple
+    label: str
+    count: int = 1
+    plan: list = field(default_factory=list)
+    full_scans: set = field(default_factory=set)
+    indexes: set = field(default_factory=set)
+    error: str = ''
+
+
+class QueryRecorder:
+    """Сбор запросов рабочей нагрузки на всех соединениях (execute_wrapper), сгруппированных по шаблону.
+
+    label - подпись текущей части нагрузки (импорт, запрос API); запрос относится к той части,
+    в которой выполнился впервые. При label=None запросы не собираются (подготовка нагрузки).
+    """
+
+    def __init__(self, aliases=None):
+        self.aliases = list(aliases or connections)
+        self.queries = {}
+        self.label = None
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in self.aliases:
+            self._stack.enter_context(connections[alias].execute_wrapper(self._wrapper(alias)))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def _wrapper(self, alias):
+        def wrapper(execute, sql, params, many, context):
+            statement = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+            if self.label is not None and not many and statement in EXPLAINED_STATEMENTS:
+                key = (alias, query_template(sql))
+                if key in self.queries:
+                    self.queries[key].count += 1
+                else:
+                    self.queries[key] = CapturedQuery(alias, sql, tuple(params or ()), self.label)
+            return execute(sql, params, many, context)
+        return wrapper
+
+
+def explain(query) -> None:
+    """План запроса (EXPLAIN QUERY PLAN на SQLite, EXPLAIN (FORMAT JSON) на PostgreSQL):
+    полные просмотры таблиц и использованные индексы
+    """
+    connection = connections[query.alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {query.sql}', query.params)
+                _sqlite_plan(query, [row[3] for row in cursor.fetchall()])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {query.sql}', query.params)
+                plan = cursor.fetchone()[0]
+                _postgres_plan(query, (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan'], 0)
+            else:
+                query.error = f'EXPLAIN для {connection.vendor} не поддерживается'
+    except DatabaseError as e:
+        query.error = str(e)
+
+
+def _sqlite_plan(query, steps) -> None:
+    aliases = table_aliases(query.sql)
+    for detail in steps:
+        query.plan.append(detail)
+        match = _SQLITE_STEP.match(detail)
+        if not match:
+            continue
+        table = aliases.get(match.group(3) or match.group(2), match.group(2))
+        index = _SQLITE_INDEX.search(match.group(4))
+        if index:
+            query.indexes.add((table, index.group(1)))
+        elif match.group(1) == 'SCAN':
+            query.full_scans.add(table)    # Имена CTE тоже сюда попадают: отсеиваются по списку таблиц
+
+
+def _postgres_plan(node, plan, depth) -> None:
+    relation, index = plan.get('Relation Name'), plan.get('Index Name')
+    line = plan['Node Type']
+    if index:
+        line += f' using {index}'
+    if relation:
+        line += f' on {relation}'
+    node.plan.append('  ' * depth + line)
+    if plan['Node Type'] == 'Seq Scan':
+        node.full_scans.add(relation)
+    elif plan['Node Type'] in PG_INDEX_NODES and index:
+        node.indexes.add((relation, index))
+    for child in plan.get('Plans', ()):
+        _postgres_plan(node, child, depth + 1)
+
+
+@dataclass
+class TableIndex:
+    table: str
+    name: str
+    columns: tuple
+    unique: bool
+    primary_key: bool
+    partial: bool = False
+
+
+def table_indexes(connection, table) -> list:
+    """Индексы таблицы под теми именами, которые выводит планировщик (на SQLite - вместе с
+    sqlite_autoindex_* уникальных ограничений, которые интроспекция Django показывает без имени)
+    """
+    indexes = []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'PRAGMA index_list({connection.ops.quote_name(table)})')
+            for _, name, unique, origin, partial in cursor.fetchall():
+                cursor.execute(f'PRAGMA index_info({connection.ops.quote_name(name)})')
+                columns = tuple(row[2] for row in cursor.fetchall())
+                indexes.append(TableIndex(table, name, columns, bool(unique), origin == 'pk', bool(partial)))
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                """
+                SELECT i.relname, ix.indisunique, ix.indisprimary, ix.indpred IS NOT NULL,
+                       array_agg(a.attname ORDER BY k.ord)
+                FROM pg_index ix
+                JOIN pg_class i ON i.oid = ix.indexrelid
+                JOIN pg_class t ON t.oid = ix.indrelid
+                CROSS JOIN LATERAL unnest(ix.indkey) WITH ORDINALITY k(attnum, ord)
+                JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+                WHERE t.relname = %s AND t.relnamespace = current_schema()::regnamespace
+                GROUP BY i.relname, ix.indisunique, ix.indisprimary, ix.indpred IS NOT NULL
+                """,
+                [table],
+            )
+            for name, unique, primary_key, partial, columns in cursor.fetchall():
+                indexes.append(TableIndex(table, name, tuple(columns), unique, primary_key, partial))
+    return indexes
+
+
+def redundant_indexes(indexes) -> list:
+    """Дублирующие индексы: (лишний, покрывающий, причина).
+
+    Неуникальный индекс лишний, если другой индекс той же таблицы имеет те же колонки или начинается
+    с них (B-tree ищет по левому префиксу). Уникальные индексы и первичные ключи - ограничения
+    целостности и лишними не считаются; частичные индексы не сравниваются.
+    """
+    result = []
+    for index in indexes:
+        if index.unique or index.primary_key or index.partial:
+            continue
+        for other in indexes:
+            if other is index or other.partial or other.columns[:len(index.columns)] != index.columns:
+                continue
+            if other.columns == index.columns and not (other.unique or other.primary_key) and other.name < index.name:
+                continue    # Из двух одинаковых неуникальных лишним считается один
+            reason = 'те же колонки' if other.columns == index.columns else 'левый префикс'
+            result.append((index, other, reason))
+            break
+    return result
+
+
+def index_owners(connection) -> dict:
+    """Имя индекса -> (модель, как объявлен): Meta.indexes, db_index поля или ForeignKey.
+    Нужен, чтобы находки аудита переводились в операции миграции.
+    """
+    owners = {}
+    with connection.schema_editor(collect_sql=True, atomic=False) as editor:
+        for model in apps.get_models():
+            for index in model._meta.indexes:
+                owners[index.name] = (model, f'Meta.indexes {index.name}')
+            for model_field in model._meta.local_fields:
+                if model_field.db_index and not model_field.unique:
+                    name = editor._create_index_name(model._meta.db_table, [model_field.column], suffix='')
+                    kind = 'ForeignKey' if model_field.is_relation else 'db_index=True'
+                    owners[name] = (model, f'{model_field.name} ({kind})')
+    return owners
+
+
+def audit(queries, tables_of_interest, min_rows=0) -> dict:
+    """Итог аудита по собранным запросам: планы (EXPLAIN), полные просмотры, лишние и неиспользуемые индексы.
+
+    Полный просмотр таблицы меньше min_rows строк отмечается без замечания: на маленькой таблице
+    планировщик PostgreSQL выбирает его и при наличии индекса. Неиспользуемыми считаются неуникальные
+    индексы таблиц, к которым обращалась нагрузка, не встретившиеся ни в одном плане.
+    """
+    by_alias = defaultdict(list)
+    for query in queries:
+        explain(query)
+        by_alias[query.alias].append(query)
+
+    connection = connections['default']
+    report = {'database': connection.vendor, 'queries': [], 'indexes': [], 'redundant': [], 'unused': []}
+    owners = index_owners(connection)
+    used, touched, row_counts = set(), set(), {}
+    for alias, alias_queries in by_alias.items():
+        alias_connection = connections[alias]
+        tables = set(alias_connection.introspection.table_names()) & set(tables_of_interest)
+        for table in sorted(tables):
+            with alias_connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {alias_connection.ops.quote_name(table)}')
+                row_counts[table] = cursor.fetchone()[0]
+        for query in alias_queries:
+            scans = sorted(table for table in query.full_scans if table in tables)
+            touched.update(table for table in table_aliases(query.sql).values() if table in tables)
+            used.update(query.indexes)
+            report['queries'].append({
+                'label': query.label,
+                'database': alias,
+                'count': query.count,
+                'sql': query_template(query.sql),
+                'plan': query.plan,
+                'full_scans': [table for table in scans if row_counts[table] >= min_rows],
+                'small_table_scans': [table for table in scans if row_counts[table] < min_rows],
+                'indexes': sorted(name for _, name in query.indexes),
+                'error': query.error,
+            })
+
+    for table in sorted(touched):
+        indexes = table_indexes(connection, table)
+        for index in indexes:
+            model, declared = owners.get(index.name, (None, ''))
+            report['indexes'].append({
+                'table': table,
+                'name': index.name,
+                'columns': list(index.columns),
+                'unique': index.unique,
+                'primary_key': index.primary_key,
+                'used': (table, index.name) in used,
+                'model': model._meta.label if model else '',
+                'declared': declared,
+            })
+        for index, other, reason in redundant_indexes(indexes):
+            model, declared = owners.get(index.name, (None, ''))
+            report['redundant'].append({
+                'table': table,
+                'name': index.name,
+                'columns': list(index.columns),
+                'covered_by': other.name,
+                'covered_columns': list(other.columns),
+                'reason': reason,
+                'model': model._meta.label if model else '',
+                'declared': declared,
+            })
+        redundant = {item['name'] for item in report['redundant']}
+        for index in indexes:
+            if index.unique or index.primary_key or (table, index.name) in used or index.name in redundant:
+                continue
+            model, declared = owners.get(index.name, (None, ''))
+            report['unused'].append({
+                'table': table,
+                'name': index.name,
+                'columns': list(index.columns),
+                'model': model._meta.label if model else '',
+                'declared': declared,
+            })
+    return report
@@ -0,0 +1,19 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Рендерер для потоковых ответов text/event-stream (Server-Sent Events).
+
+    Нужен, чтобы запрос EventSource (Accept: text/event-stream) проходил согласование формата DRF.
+    Сам поток отдает StreamingHttpResponse; через рендерер проходят только ответы с ошибкой - как событие error.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return f'event: error\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode(self.charset)
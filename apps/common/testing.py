@@ -0,0 +1,115 @@
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+from apps.common.query_plans import query_template
+
+# Значения в SQL, который сохраняет CaptureQueriesContext (строки, числа) - для сравнения запросов по форме
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Строки VALUES пакетной вставки и имена точек сохранения транзакций
+_VALUES_ROWS = re.compile(r'VALUES \(.*?\)(?:, \(.*?\))*(?= ON CONFLICT| RETURNING|$)')
+_SAVEPOINT = re.compile(r'"s\d+_x\d+"')
+
+
+def query_shape(sql) -> str:
+    """Запрос без значений: один и тот же запрос в цикле с разными параметрами дает одну форму,
+        пакетная вставка любого числа строк - тоже одну
+    """
+    shape = _SAVEPOINT.sub('"savepoint"', _LITERALS.sub('%s', sql))
+    return query_template(_VALUES_ROWS.sub('VALUES (...)', shape))
+
+
+@contextmanager
+def rolled_back():
+    """Блок в точке сохранения, которая откатывается: каждый размер данных проверяется от одного состояния БД"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+class QueryCapture:
+    """Запросы ко всем базам (основная и реплика) за время блока; len() доступен и внутри блока"""
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        self._contexts = [self._stack.enter_context(CaptureQueriesContext(connections[alias]))
+                          for alias in connections]
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def queries(self) -> list:
+        return [query['sql'] for context in self._contexts for query in context.captured_queries]
+
+    def __len__(self):
+        return sum(len(context) for context in self._contexts)
+
+
+def format_queries(queries, limit=50) -> str:
+    """Запросы для сообщения об ошибке: сначала повторяющиеся шаблоны (признак N+1), затем все по порядку"""
+    repeated = [(sql, count) for sql, count in Counter(map(query_shape, queries)).most_common() if count > 1]
+    lines = [f'  x{count} {sql}' for sql, count in repeated]
+    if lines:
+        lines.insert(0, 'Повторяющиеся запросы:')
+        lines.append('Все запросы:')
+    lines.extend(f'  {number}. {sql}' for number, sql in enumerate(queries[:limit], 1))
+    if len(queries) > limit:
+        lines.append(f'  ... еще {len(queries) - limit}')
+    return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    """Проверки числа запросов к БД для TestCase.
+
+    assertQueryBudget - не больше budget запросов в блоке; assertConstantQueries - число запросов не растет
+    с объемом данных (N+1, лишние обращения в цикле). При нарушении в сообщении - SQL проверяемого блока.
+    """
+
+    # Размеры наборов данных, на которых сравнивается число запросов. Наибольший - в пределах одного пакета
+    # bulk_create на SQLite (не больше 999 параметров: 34 строки контрагентов), иначе число INSERT растет с данными
+    QUERY_BUDGET_SIZES = (5, 15, 30)
+
+    @contextmanager
+    def assertQueryBudget(self, budget, label=''):
+        with QueryCapture() as captured:
+            yield captured
+        if len(captured) > budget:
+            self.fail(f'{label or "Блок"}: {len(captured)} запросов при бюджете {budget}\n'
+                      f'{format_queries(captured.queries)}')
+
+    def assertConstantQueries(self, run, budget, prepare=None, sizes=None, label=''):
+        """run(size) выполняется после prepare(size) для каждого размера данных (изменения откатываются);
+        число запросов должно совпадать на всех размерах и не превышать budget. Возвращает число запросов.
+        """
+        counts = {}
+        for size in sizes or self.QUERY_BUDGET_SIZES:
+            with rolled_back():
+                if prepare is not None:
+                    prepare(size)
+                with QueryCapture() as captured:
+                    run(size)
+            counts[size] = captured.queries
+        return self.assertSameQueryCounts(counts, budget, label)
+
+    def assertSameQueryCounts(self, counts, budget, label=''):
+        """counts - {размер данных: список SQL}"""
+        label = label or 'Блок'
+        (first_size, first), *others = counts.items()
+        for size, queries in others:
+            if len(queries) != len(first):
+                extra = Counter(map(query_shape, queries))
+                extra.subtract(Counter(map(query_shape, first)))
+                self.fail(
+                    f'{label}: число запросов растет с объемом данных - {len(first)} при {first_size}, '
+                    f'{len(queries)} при {size}\nРазница по шаблонам:\n'
+                    + '\n'.join(f'  {count:+d} {sql}' for sql, count in extra.items() if count)
+                    + f'\nЗапросы при {size}:\n{format_queries(queries)}'
+                )
+        if len(first) > budget:
+            self.fail(f'{label}: {len(first)} запросов при бюджете {budget}\n{format_queries(first)}')
+        return len(first)
@@ -1,3 +1,258 @@
-from django.test import TestCase
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import time
+import uuid
 
-# Create your tests here.
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from .db_routing import ReplicaReadMixin, pin_primary
+from .fields import MinorUnits, MoneyField, minor_units_column
+from .models import PrimaryPin
+from .utils import uuid7
+
+# Загрузка приложения так же, как при старте воркера или manage.py
+STARTUP_CODE = 'import django; django.setup(); import core.urls'
+
+# Тяжелые зависимости импортируются в месте использования и не должны попадать в старт
+DEFERRED_MODULES = ('pandas', 'numpy', 'openpyxl', 'ldap', 'django_auth_ldap', 'httpx')
+
+# Бюджет времени импорта при старте, сек (лучший из IMPORT_TIME_RUNS запусков)
+IMPORT_TIME_BUDGET = float(os.getenv('IMPORT_TIME_BUDGET', '1.0'))
+IMPORT_TIME_RUNS = 3
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+# Асинхронные представления: одновременные запросы не должны выполняться по очереди
+ASYNC_VIEW_DELAY = 0.2
+ASYNC_CONCURRENT_REQUESTS = 5
+
+
+async def slow_async_view(request):
+    await asyncio.sleep(ASYNC_VIEW_DELAY)
+    return HttpResponse('ok')
+
+
+class ReadDatabaseView(APIView):
+    """База чтения, которую роутер выбирает в обработчике"""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response({'db': router.db_for_read(get_user_model())})
+
+
+class ReplicaReadDatabaseView(ReplicaReadMixin, ReadDatabaseView):
+    pass
+
+
+urlpatterns = [
+    path('slow/', slow_async_view),
+    path('read-db/', ReadDatabaseView.as_view()),
+    path('read-db/replica/', ReplicaReadDatabaseView.as_view()),
+]
+
+# Два файла SQLite (DATABASE_REPLICA_NAME): отчеты читают файл реплики, закрепленный пользователь - основной
+REPLICA_FILES_CODE = '''
+import json
+import django
+django.setup()
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from apps.common.db_routing import pin_primary, replica_reads
+
+call_command('migrate', verbosity=0)
+user = get_user_model().objects.create(username='pinned')
+call_command('sync_replica', verbosity=0)
+Group.objects.create(name='after-sync')
+result = {'primary': Group.objects.count()}
+with replica_reads():
+    result['replica'] = Group.objects.count()
+pin_primary(user.pk)
+with replica_reads(user.pk):
+    result['pinned'] = Group.objects.count()
+print(json.dumps(result))
+'''
+
+
+def measure_startup_imports() -> tuple:
+    """Запуск STARTUP_CODE с -X importtime: (суммарное время импорта, сек; {модуль: cumulative, сек} верхнего уровня;
+        множество всех импортированных модулей)
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+        capture_output=True, text=True, cwd=settings.BASE_DIR, env=os.environ.copy(), check=True,
+    )
+    total, top_level, modules = 0, {}, set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        total += int(self_us)
+        modules.add(name)
+        if len(indent) == 1:
+            top_level[name] = int(cumulative_us) / 1e6
+    return total / 1e6, top_level, modules
+
+
+class StartupImportTests(SimpleTestCase):
+    """Время старта приложения: отложенные импорты и бюджет времени импорта"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.runs = [measure_startup_imports() for _ in range(IMPORT_TIME_RUNS)]
+
+    def test_heavy_modules_are_deferred(self):
+        _, _, modules = self.runs[0]
+        loaded = sorted({name.split('.')[0] for name in modules} & set(DEFERRED_MODULES))
+        if loaded:
+            self.fail(f'При старте импортированы тяжелые модули: {", ".join(loaded)}')
+
+    def test_import_time_budget(self):
+        total, top_level, _ = min(self.runs, key=lambda run: run[0])
+        slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:10]
+        self.assertLessEqual(
+            total, IMPORT_TIME_BUDGET,
+            f'Импорт при старте занял {total:.3f} с (бюджет {IMPORT_TIME_BUDGET} с). Самые долгие:\n'
+            + '\n'.join(f'  {name}: {seconds:.3f} с' for name, seconds in slowest),
+        )
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncMiddlewareTests(SimpleTestCase):
+    """Цепочка middleware не переводит асинхронные представления в sync_to_async"""
+
+    async def test_async_views_run_concurrently(self):
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(self.async_client.get('/slow/') for _ in range(ASYNC_CONCURRENT_REQUESTS)))
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual([response.status_code for response in responses], [200] * ASYNC_CONCURRENT_REQUESTS)
+        self.assertLess(elapsed, ASYNC_VIEW_DELAY * ASYNC_CONCURRENT_REQUESTS / 2)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+@mock.patch('apps.common.db_routing.replica_configured', return_value=True)
+class ReplicaRoutingTests(TestCase):
+    """Выбор базы чтения: реплика только в ReplicaReadMixin и только для незакрепленного пользователя"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def read_db(self, url) -> str:
+        return self.client.get(url).json()['db']
+
+    def test_router_outside_mixin(self, _):
+        self.assertEqual(self.read_db('/read-db/'), 'default')
+
+    def test_router_inside_mixin(self, _):
+        self.assertEqual(self.read_db('/read-db/replica/'), 'replica')
+
+    def test_pinned_user_reads_primary(self, _):
+        pin_primary(self.user.pk)
+        self.assertEqual(self.read_db('/read-db/replica/'), 'default')
+
+        PrimaryPin.objects.filter(user=self.user).update(pinned_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.read_db('/read-db/replica/'), 'replica')
+
+    def test_pin_in_shared_cache(self, _):
+        with mock.patch('apps.common.db_routing.is_shared_cache', return_value=True):
+            pin_primary(self.user.pk)
+            self.assertEqual(self.read_db('/read-db/replica/'), 'default')
+        self.assertFalse(PrimaryPin.objects.exists())
+
+
+class ReplicaFilesTests(SimpleTestCase):
+    """Локальная реплика - второй файл SQLite (DATABASE_REPLICA_NAME), обновляемый sync_replica"""
+
+    def test_two_database_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**os.environ, 'DB_PROFILE': 'sqlite', 'SQLITE_PATH': f'{directory}/primary.sqlite3',
+                   'DATABASE_REPLICA_NAME': f'{directory}/replica.sqlite3',
+                   'CACHE_BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+            result = subprocess.run([sys.executable, '-c', REPLICA_FILES_CODE], capture_output=True, text=True,
+                                    cwd=settings.BASE_DIR, env=env)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1]), {'primary': 1, 'replica': 0, 'pinned': 1})
+
+
+@override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'], METRICS_TOKEN='metrics-token')
+class MetricsViewTests(SimpleTestCase):
+    """Доступ к /metrics: адреса из списка или токен"""
+
+    def test_allowed_ip(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE ldap_user_refresh_events_total counter', response.content.decode())
+
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1',
+                                         HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1',
+                                         HTTP_AUTHORIZATION='Bearer metrics-token').status_code, 200)
+
+
+class MoneyFieldTests(SimpleTestCase):
+    """Перевод сумм в минимальные единицы: колонки файла и запись в БД"""
+
+    def test_minor_units_column(self):
+        import pandas as pd
+
+        values, unparsed = minor_units_column(pd.Series(['1,5', None, 'н/д', ' ', 2.25]), 5)
+        self.assertEqual(values.tolist(), [150000, 0, 0, 0, 225000])
+        self.assertEqual(unparsed, 1)
+
+    def test_oversized_amount_rejected(self):
+        import pandas as pd
+
+        with self.assertRaisesMessage(ValueError, 'строки 1'):
+            minor_units_column(pd.Series([1.5, 10 ** 13], name='Долг'), 5)
+
+    def test_minor_units_written_as_is(self):
+        field = MoneyField(decimal_places=5)
+        self.assertEqual(field.get_db_prep_value(MinorUnits(150000, 5), connection), 150000)
+        self.assertEqual(field.get_db_prep_value(MinorUnits(150, 2), connection), 150000)
+        self.assertEqual(field.get_db_prep_value(Decimal('1.5'), connection), 150000)
+
+
+class UUID7Tests(SimpleTestCase):
+    """UUIDv7 (RFC 9562): версия и вариант, возрастание в пределах одной миллисекунды"""
+
+    def test_version_and_variant(self):
+        value = uuid7()
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, uuid.RFC_4122)
+        self.assertAlmostEqual(value.int >> 80, time.time_ns() // 1_000_000, delta=1000)
+
+    def test_monotonic_within_millisecond(self):
+        frozen = time.time_ns()
+        with mock.patch('apps.common.utils.time.time_ns', return_value=frozen), \
+                mock.patch('apps.common.utils._uuid7_last', (0, 0)):
+            values = [uuid7() for _ in range(5000)]    # Больше, чем вмещает 12-битный счетчик
+        self.assertEqual(values, sorted(values))
+        self.assertEqual(len(set(values)), len(values))
+        self.assertEqual(values[0].int >> 80, frozen // 1_000_000)
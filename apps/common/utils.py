@@ -1,6 +1,48 @@
+import os
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.utils import timezone
 
+# Бэкенды кеша, данные которых видны только своему процессу
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
 
 def upload_log_file_name_of_nine() -> str:
     """Генерация дефолтного имени Excel-файла"""
     return f'of-9-file-{timezone.now():%Y%m%d%H%M%S}.xlsx'
+
+
+def is_shared_cache(alias='default') -> bool:
+    """Кеш общий для всех воркеров (Redis, Memcached, БД, файлы), а не память процесса"""
+    return not isinstance(caches[alias], PROCESS_LOCAL_CACHES)
+
+
+_uuid7_lock = threading.Lock()
+_uuid7_last = (0, 0)    # (миллисекунды, счетчик) последнего выданного значения
+
+
+def uuid7() -> uuid.UUID:
+    """Генерация UUID версии 7 (RFC 9562): 48 бит времени в мс, 12 бит счетчика, 62 случайных бита.
+        Значения возрастают во времени (в пределах процесса - строго), поэтому новые записи
+        добавляются в конец индекса первичного ключа, а не в случайные страницы, как при uuid4.
+    """
+    global _uuid7_last
+    with _uuid7_lock:
+        millis = time.time_ns() // 1_000_000
+        last_millis, counter = _uuid7_last
+        if millis > last_millis:
+            counter = int.from_bytes(os.urandom(2), 'big') & 0x3FF    # Случайное начало с запасом под инкремент
+        else:
+            millis, counter = last_millis, counter + 1
+            if counter > 0xFFF:
+                millis, counter = millis + 1, 0
+        _uuid7_last = (millis, counter)
+
+    rand_b = int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    value = (millis & 0xFFFFFFFFFFFF) << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | rand_b
+    return uuid.UUID(int=value)
@@ -1,3 +1,21 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from apps.common.metrics import registry
+
+
+def _metrics_allowed(request) -> bool:
+    """Адрес клиента из METRICS_ALLOWED_IPS или токен METRICS_TOKEN в заголовке Authorization"""
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return bool(settings.METRICS_TOKEN) and scheme == 'Bearer' and hmac.compare_digest(token, settings.METRICS_TOKEN)
+
+
+def metrics_view(request):
+    """Метрики процесса в текстовом формате Prometheus (только для адресов из списка или по токену)"""
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,23 @@
+import re
+
+# Все, кроме букв и цифр (пунктуация, пробелы, переносы строк, подчеркивание), - один разделитель
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize_address(value) -> str:
+    """Ключ адреса для сопоставления контрагентов: без учета регистра, е/ё, пунктуации и пробелов.
+        Пример:
+            'г. Москва,  ул. Тестовая, д.1' -> 'г москва ул тестовая д 1'
+    """
+    if value is None or value != value:    # None, NaN
+        return ''
+    return _SEPARATORS.sub(' ', str(value).casefold().replace('ё', 'е')).strip()
+
+
+def normalize_address_column(column):
+    """Ключи адресов колонки pandas.Series одним проходом по колонке (те же правила, что normalize_address)"""
+    return (column.astype(object).where(column.notna(), '').astype(str)
+            .str.casefold()
+            .str.replace('ё', 'е', regex=False)
+            .str.replace(_SEPARATORS.pattern, ' ', regex=True)
+            .str.strip())
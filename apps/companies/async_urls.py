@@ -0,0 +1,9 @@
+from django.urls import path
+
+from apps.companies.async_views import AsyncCounterpartyGroupDebtView, AsyncDebtorRankingView, AsyncExcelUploadView
+
+urlpatterns = [
+    path('upload/', AsyncExcelUploadView.as_view(), name='companies-async-excel-upload'),
+    path('debtors/top/', AsyncDebtorRankingView.as_view(), name='companies-async-debtors-top'),
+    path('groups/<uuid:pk>/debt/', AsyncCounterpartyGroupDebtView.as_view(), name='companies-async-group-debt'),
+]
@@ -0,0 +1,107 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, ValidationError
+
+from apps.authentication.authentication import ClaimsJWTAuthentication
+from apps.common.db_routing import reads_from_replica, replica_configured, replica_reads
+from apps.common.middleware import track_request_queries
+from apps.companies.hierarchy import counterparty_group_debt
+from apps.companies.models import Counterparties
+from apps.companies.serializers import (
+    CounterpartyGroupDebtSerializer,
+    DebtorRankingQuerySerializer,
+    DebtorRankingSerializer,
+    ExcelUploadSerializer,
+)
+from apps.companies.services import import_excel_data, read_excel_file, top_debtors
+
+# Отдельный пул для разбора Excel, чтобы парсинг не занимал потоки обработки запросов
+_parse_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_PARSE_WORKERS, thread_name_prefix='excel-parse')
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=DjangoJSONEncoder,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def _import_in_thread(request, data, file_obj) -> int:
+    """Запись в БД в отдельном потоке (SQL-запросы учитываются в метриках запроса) с закрытием его соединения"""
+    try:
+        with track_request_queries(request):
+            return import_excel_data(data, file_obj, request.user)
+    finally:
+        close_old_connections()
+
+
+class AsyncAPIView(View):
+    """Базовое асинхронное представление: JWT-аутентификация (без проверки CSRF) и ошибки в формате DRF.
+    read_from_replica - обработчик читает с реплики (как ReplicaReadMixin).
+    """
+    read_from_replica = False
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Как APIView.as_view: аутентификация по заголовку JWT, cookie-сессия не используется - CSRF не нужен
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            auth = await sync_to_async(ClaimsJWTAuthentication().authenticate)(request)
+        except APIException as exc:
+            return _json(exc.get_full_details(), status=exc.status_code)
+        if auth is None:
+            return _json({'detail': 'Учетные данные не были предоставлены.'}, status=401)
+        request.user, request.auth = auth
+
+        try:
+            if self.read_from_replica:
+                enabled = replica_configured() and await sync_to_async(reads_from_replica)(request.user.pk)
+                with replica_reads(enabled=enabled):
+                    return await super().dispatch(request, *args, **kwargs)
+            return await super().dispatch(request, *args, **kwargs)
+        except ValidationError as exc:
+            return _json(exc.detail, status=400)
+
+
+class AsyncDebtorRankingView(AsyncAPIView):
+    """Асинхронный вариант DebtorRankingView"""
+    read_from_replica = True
+
+    async def get(self, request, *args, **kwargs):
+        query = DebtorRankingQuerySerializer(data=request.GET)
+        query.is_valid(raise_exception=True)
+        rankings = [r async for r in top_debtors(query.validated_data)]
+        return _json(DebtorRankingSerializer(rankings, many=True).data)
+
+
+class AsyncCounterpartyGroupDebtView(AsyncAPIView):
+    """Асинхронный вариант CounterpartyGroupDebtView"""
+    read_from_replica = True
+
+    async def get(self, request, pk, *args, **kwargs):
+        if not await Counterparties.objects.filter(pk=pk).aexists():
+            return _json({'error': 'Контрагент не найден'}, status=404)
+        rollup = await sync_to_async(counterparty_group_debt)(root_ids=[pk])
+        return _json(CounterpartyGroupDebtSerializer(rollup[0]).data)
+
+
+class AsyncExcelUploadView(AsyncAPIView):
+    """Асинхронный вариант ExcelUploadView: разбор файла в пуле потоков, запись в БД вне цикла событий"""
+
+    async def post(self, request, *args, **kwargs):
+        serializer = ExcelUploadSerializer(data=request.FILES)
+        serializer.is_valid(raise_exception=True)
+        file_obj = serializer.validated_data['file']
+
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(_parse_executor, read_excel_file, file_obj)
+        rows = await sync_to_async(_import_in_thread, thread_sensitive=False)(request, data, file_obj)
+        return _json({'rows_processed': rows}, status=201)
@@ -0,0 +1,166 @@
+import os
+import zlib
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File, locks
+from django.db import transaction
+from django.utils import timezone
+
+from apps.companies.jobs import submit_import
+from apps.companies.models import UploadSession
+from apps.companies.services import process_excel_file
+
+# Размер блока чтения тела запроса: часть файла не держится в памяти целиком
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class ChunkedUploadError(Exception):
+    """Ошибка протокола загрузки по частям"""
+
+
+class OffsetMismatch(ChunkedUploadError):
+    """Часть пришла не с того смещения: клиент должен продолжить с session.offset"""
+
+    def __init__(self, session):
+        super().__init__(self.message(session))
+        self.session = session
+
+    @staticmethod
+    def message(session) -> str:
+        return f'Ожидается часть со смещения {session.offset}'
+
+
+class ChunkInProgress(OffsetMismatch):
+    """Другая часть этой сессии еще записывается: клиент повторяет с session.offset после ее завершения"""
+
+    @staticmethod
+    def message(session) -> str:
+        return f'Записывается другая часть файла, текущее смещение {session.offset}'
+
+
+def session_path(session) -> Path:
+    """Путь к собираемому файлу сессии"""
+    return Path(settings.CHUNKED_UPLOAD_DIR) / f'{session.pk}.part'
+
+
+def start_upload_session(user, file_name, size) -> UploadSession:
+    """Функция для создания сессии загрузки и пустого файла под нее"""
+    if size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise ChunkedUploadError(f'Максимальный размер файла - {settings.CHUNKED_UPLOAD_MAX_SIZE // 1024 // 1024} Мб')
+    session = UploadSession.objects.create(uploaded_by_id=user.pk, file_name=file_name, size=size)
+    path = session_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return session
+
+
+def append_chunk(session_id, user, offset, stream, length) -> UploadSession:
+    """Функция для дописывания части файла с указанного смещения.
+        Тело читается блоками и сразу пишется на диск, CRC32 считается по ходу записи.
+        Если offset не совпадает с уже полученным объемом (обрыв, повтор части), возвращается OffsetMismatch -
+        клиент продолжает с session.offset. Часть, выходящая за объявленный размер, отклоняется.
+
+        Чтение тела и запись на диск идут вне транзакции: медленный клиент не держит блокировку БД
+        (на SQLite - блокировку записи всей базы). Одновременную запись частей одной сессии исключает
+        блокировка файла сессии, новое смещение фиксируется сравнением со старым (compare-and-set).
+    """
+    session = UploadSession.objects.get(pk=session_id, uploaded_by_id=user.pk, status=UploadSession.Status.ACTIVE)
+    if length > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+        raise ChunkedUploadError(f'Максимальный размер части - {settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE} байт')
+
+    with open(session_path(session), 'r+b') as file:
+        if not locks.lock(file, locks.LOCK_EX | locks.LOCK_NB):
+            raise ChunkInProgress(session)
+        try:
+            session.refresh_from_db(fields=['offset', 'checksum', 'status'])    # Смещение после чужой записи
+            if session.status != UploadSession.Status.ACTIVE:
+                raise UploadSession.DoesNotExist
+            if offset != session.offset:
+                raise OffsetMismatch(session)
+            if session.offset + length > session.size:
+                raise ChunkedUploadError('Часть выходит за объявленный размер файла')
+
+            checksum, written = session.checksum, 0
+            file.seek(session.offset)
+            file.truncate()    # Хвост от прерванной записи
+            while written < length:
+                block = stream.read(min(READ_BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                file.write(block)
+                checksum = zlib.crc32(block, checksum)
+                written += len(block)
+            file.flush()
+
+            updated_at = timezone.now()
+            saved = UploadSession.objects.filter(
+                pk=session.pk, offset=session.offset, status=UploadSession.Status.ACTIVE,
+            ).update(offset=session.offset + written, checksum=checksum, updated_at=updated_at)
+            if not saved:    # Сессию завершили или удалили во время записи
+                raise UploadSession.DoesNotExist
+        finally:
+            locks.unlock(file)
+
+    session.offset += written
+    session.checksum = checksum
+    session.updated_at = updated_at
+    return session
+
+
+def _close_upload_session(session_id, user, checksum) -> UploadSession:
+    """Проверка размера и CRC32 полученного файла и закрытие сессии"""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(
+            pk=session_id, uploaded_by_id=user.pk, status=UploadSession.Status.ACTIVE
+        )
+        if session.offset != session.size:
+            raise OffsetMismatch(session)
+        if checksum is not None and checksum != session.checksum:
+            raise ChunkedUploadError('Контрольная сумма файла не совпадает')
+        session.status = UploadSession.Status.COMPLETED
+        session.save(update_fields=['status', 'updated_at'])
+    return session
+
+
+def complete_upload_session(session_id, user, checksum=None) -> tuple:
+    """Функция для завершения загрузки: проверка размера и CRC32 и передача файла в импорт ОФ-9.
+        Возвращает (сессия, количество обработанных строк).
+    """
+    session = _close_upload_session(session_id, user, checksum)
+    path = session_path(session)
+    try:
+        with open(path, 'rb') as file:
+            rows = process_excel_file(File(file, name=session.file_name), user)
+    except Exception:
+        session.status = UploadSession.Status.FAILED
+        session.save(update_fields=['status', 'updated_at'])
+        raise
+    finally:
+        path.unlink(missing_ok=True)
+    return session, rows
+
+
+def queue_upload_session(session_id, user, checksum=None) -> tuple:
+    """Функция для завершения загрузки с фоновым импортом собранного файла.
+        Возвращает (сессия, ImportJob).
+    """
+    session = _close_upload_session(session_id, user, checksum)
+    return session, submit_import(user, session.file_name, path=session_path(session))
+
+
+def purge_stale_upload_sessions(max_age_hours=None) -> int:
+    """Функция для удаления незавершенных сессий без активности дольше max_age_hours и их файлов"""
+    max_age_hours = max_age_hours or settings.CHUNKED_UPLOAD_EXPIRE_HOURS
+    stale = UploadSession.objects.filter(
+        status=UploadSession.Status.ACTIVE,
+        updated_at__lt=timezone.now() - timedelta(hours=max_age_hours),
+    )
+    for session in stale.only('pk'):
+        try:
+            os.remove(session_path(session))
+        except FileNotFoundError:
+            pass
+    deleted, _ = stale.delete()
+    return deleted
@@ -0,0 +1,311 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.companies.hierarchy import resolve_counterparty_hierarchy
+from apps.companies.models import Counterparties, CounterpartyStatus, DadataPartyCache
+from apps.companies.services import record_counterparty_states
+
+logger = logging.getLogger(__name__)
+
+# Поля контрагента, которые заполняются из DaData
+DADATA_FIELDS = (
+    'name_from_dadata',
+    'name_full_with_opf',
+    'address_from_dadata',
+    'counterparties_type',
+    'branch_type',
+    'kpp',
+    'ogrn',
+    'ogrn_date',
+    'okved',
+    'opf_full',
+    'opf_short',
+    'registration_date',
+    'liquidation_date',
+    'dadata_updated_at',
+)
+
+# Поля текущего состояния контрагента
+STATE_FIELDS = ('current_state', 'current_state_code', 'current_state_date')
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DadataError(Exception):
+    """Ошибка обращения к API DaData"""
+
+
+@dataclass
+class EnrichmentResult:
+    """Итоги прогона обогащения контрагентов"""
+    processed: int = 0
+    updated: int = 0
+    not_found: int = 0
+    failed: int = 0
+    state_changes: int = 0
+    requests: int = 0
+    elapsed: float = 0.0
+
+
+def retry_after_seconds(value):
+    """Задержка из заголовка Retry-After (RFC 9110): число секунд либо HTTP-дата.
+        None - заголовка нет или он не разобран (повтор с экспоненциальной задержкой).
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return max((moment - timezone.now()).total_seconds(), 0.0)
+
+
+class AsyncRateLimiter:
+    """Ограничитель частоты запросов: не более rate запросов в секунду"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class DadataClient:
+    """Асинхронный клиент метода findById/party с ограничением частоты, конкурентности и повторами"""
+
+    def __init__(self, api_url=None, api_key=None, rate_limit=None, concurrency=None, max_retries=None,
+                 timeout=None, backoff=None):
+        self.api_url = api_url or settings.DADATA_API_URL
+        self.api_key = api_key if api_key is not None else settings.DADATA_API_KEY
+        self.rate_limit = rate_limit if rate_limit is not None else settings.DADATA_RATE_LIMIT
+        self.concurrency = concurrency or settings.DADATA_CONCURRENCY
+        self.max_retries = max_retries if max_retries is not None else settings.DADATA_MAX_RETRIES
+        self.timeout = timeout or settings.DADATA_TIMEOUT
+        self.backoff = backoff if backoff is not None else settings.DADATA_BACKOFF
+        self.requests_sent = 0
+
+    def _headers(self) -> dict:
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Token {self.api_key}'
+        return headers
+
+    async def _find_party(self, http, limiter, semaphore, inn) -> list:
+        """Получение всех подразделений организации по ИНН (головная + филиалы)"""
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                await limiter.wait()
+                self.requests_sent += 1
+                try:
+                    response = await http.post(self.api_url, json={'query': inn, 'count': 20})
+                except Exception as exc:
+                    error, retry_after = exc, None
+                else:
+                    if response.status_code == 200:
+                        return response.json().get('suggestions', [])
+                    if response.status_code not in RETRY_STATUSES:
+                        raise DadataError(f'DaData вернул {response.status_code} для ИНН {inn}')
+                    error = DadataError(f'DaData вернул {response.status_code} для ИНН {inn}')
+                    retry_after = response.headers.get('Retry-After')
+
+            if attempt == self.max_retries:
+                raise DadataError(f'Исчерпаны попытки запроса для ИНН {inn}: {error}')
+            delay = retry_after_seconds(retry_after)
+            if delay is None:
+                delay = self.backoff * 2 ** attempt
+            await asyncio.sleep(delay + random.uniform(0, self.backoff))
+
+    async def find_parties(self, inns) -> dict:
+        """Параллельное получение данных по набору ИНН. Для ИНН с ошибкой возвращается исключение."""
+        import httpx
+
+        limiter = AsyncRateLimiter(self.rate_limit)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        inns = list(inns)
+        async with httpx.AsyncClient(headers=self._headers(), timeout=self.timeout) as http:
+            results = await asyncio.gather(
+                *(self._find_party(http, limiter, semaphore, inn) for inn in inns),
+                return_exceptions=True,
+            )
+        return dict(zip(inns, results))
+
+
+def _from_timestamp(value):
+    """Функция для конвертирования timestamp DaData (в миллисекундах) в дату и время"""
+    if not value:
+        return None
+    return datetime.fromtimestamp(value / 1000, tz=dt_timezone.utc)
+
+
+def _fit(field_name, value) -> str:
+    """Функция для обрезки строки под длину поля модели"""
+    max_length = Counterparties._meta.get_field(field_name).max_length
+    return (value or '')[:max_length]
+
+
+def _select_suggestion(suggestions, kpp):
+    """Выбор подразделения для контрагента: по КПП, иначе головная организация"""
+    if kpp:
+        for suggestion in suggestions:
+            if suggestion.get('data', {}).get('kpp') == kpp:
+                return suggestion
+    for suggestion in suggestions:
+        if suggestion.get('data', {}).get('branch_type') == Counterparties.BranchType.MAIN:
+            return suggestion
+    return suggestions[0] if suggestions else None
+
+
+def suggestion_state(suggestion):
+    """Статус контрагента из ответа DaData: (статус, код, дата актуальности) либо None"""
+    state = (suggestion.get('data') or {}).get('state') or {}
+    if state.get('status') not in CounterpartyStatus.values:
+        return None
+    return state['status'], state.get('code'), _from_timestamp(state.get('actuality_date'))
+
+
+def apply_suggestion(counterparty, suggestion, now) -> None:
+    """Заполнение полей контрагента из ответа DaData"""
+    data = suggestion.get('data') or {}
+    name = data.get('name') or {}
+    opf = data.get('opf') or {}
+    state = data.get('state') or {}
+    address = data.get('address') or {}
+
+    counterparty.name_from_dadata = _fit('name_from_dadata', name.get('short_with_opf') or suggestion.get('value'))
+    counterparty.name_full_with_opf = _fit('name_full_with_opf', name.get('full_with_opf'))
+    counterparty.address_from_dadata = _fit('address_from_dadata', address.get('unrestricted_value')
+                                            or address.get('value'))
+    if data.get('type') in Counterparties.CounterpartyType.values:
+        counterparty.counterparties_type = data['type']
+    if data.get('branch_type') in Counterparties.BranchType.values:
+        counterparty.branch_type = data['branch_type']
+    counterparty.kpp = _fit('kpp', data.get('kpp'))
+    counterparty.ogrn = _fit('ogrn', data.get('ogrn'))
+    counterparty.ogrn_date = _from_timestamp(data.get('ogrn_date'))
+    counterparty.okved = _fit('okved', data.get('okved'))
+    counterparty.opf_full = _fit('opf_full', opf.get('full'))
+    counterparty.opf_short = _fit('opf_short', opf.get('short'))
+    counterparty.registration_date = _from_timestamp(state.get('registration_date'))
+    counterparty.liquidation_date = _from_timestamp(state.get('liquidation_date'))
+    counterparty.dadata_updated_at = now
+
+
+def counterparties_to_enrich(stale_days=None):
+    """Контрагенты без данных DaData либо с данными старше stale_days дней"""
+    stale_days = settings.DADATA_STALE_DAYS if stale_days is None else stale_days
+    threshold = timezone.now() - timedelta(days=stale_days)
+    return (Counterparties.objects
+            .exclude(inn='')
+            .filter(Q(dadata_updated_at__isnull=True) | Q(dadata_updated_at__lt=threshold)))
+
+
+def fetch_parties(inns, client, ttl_days=None, force=False) -> dict:
+    """Функция для получения ответов DaData по ИНН через локальный кеш.
+        Запрашиваются только ИНН без записи в кеше либо с истекшим сроком; свежие ответы сохраняются
+        одним upsert. Если обновление истекшей записи не удалось, используется сохраненный ответ.
+    """
+    ttl_days = settings.DADATA_CACHE_TTL_DAYS if ttl_days is None else ttl_days
+    now = timezone.now()
+    cached = {c.inn: c for c in DadataPartyCache.objects.filter(inn__in=inns)}
+    to_fetch = [inn for inn in inns if force or inn not in cached or cached[inn].expires_at <= now]
+
+    responses = asyncio.run(client.find_parties(to_fetch)) if to_fetch else {}
+    expires_at = now + timedelta(days=ttl_days)
+    DadataPartyCache.objects.bulk_create(
+        [DadataPartyCache(inn=inn, payload=payload, fetched_at=now, expires_at=expires_at)
+         for inn, payload in responses.items() if not isinstance(payload, Exception)],
+        update_conflicts=True,
+        unique_fields=['inn'],
+        update_fields=['payload', 'fetched_at', 'expires_at'],
+        batch_size=500,
+    )
+
+    parties = {}
+    for inn in inns:
+        payload = responses.get(inn)
+        if inn in cached and (payload is None or isinstance(payload, Exception)):
+            payload = cached[inn].payload
+        parties[inn] = payload
+    return parties
+
+
+def enrich_counterparties(batch_size=None, limit=None, stale_days=None, client=None, ttl_days=None,
+                          force_refresh=False) -> EnrichmentResult:
+    """Функция для обогащения контрагентов данными DaData.
+        Обработка идет пачками уникальных ИНН: для пачки один раз получаются ответы (из кеша либо
+        параллельными запросами), затем результат раздается всем контрагентам с этими ИНН
+        и записывается одним bulk_update на пачку.
+    """
+    batch_size = batch_size or settings.DADATA_BATCH_SIZE
+    client = client or DadataClient()
+    result = EnrichmentResult()
+    started = time.monotonic()
+
+    stale = counterparties_to_enrich(stale_days)
+    inns_qs = stale.order_by('inn').values_list('inn', flat=True).distinct()
+    last_inn, inns_done = None, 0
+    while limit is None or inns_done < limit:
+        size = batch_size if limit is None else min(batch_size, limit - inns_done)
+        batch_qs = inns_qs if last_inn is None else inns_qs.filter(inn__gt=last_inn)
+        inns = list(batch_qs[:size])
+        if not inns:
+            break
+        last_inn = inns[-1]
+        inns_done += len(inns)
+
+        parties = fetch_parties(inns, client, ttl_days=ttl_days, force=force_refresh)
+        now = timezone.now()
+        updated, states = [], []
+        counterparties = stale.filter(inn__in=inns).only('id', 'inn', *DADATA_FIELDS, *STATE_FIELDS)
+        for counterparty in counterparties:
+            result.processed += 1
+            suggestions = parties.get(counterparty.inn)
+            if suggestions is None or isinstance(suggestions, Exception):
+                logger.warning('DaData: ИНН %s не обработан: %s', counterparty.inn, suggestions)
+                result.failed += 1
+                continue
+            suggestion = _select_suggestion(suggestions, counterparty.kpp)
+            if suggestion is None:
+                counterparty.dadata_updated_at = now
+                result.not_found += 1
+            else:
+                apply_suggestion(counterparty, suggestion, now)
+                state = suggestion_state(suggestion)
+                if state:
+                    states.append((counterparty, *state))
+                result.updated += 1
+            updated.append(counterparty)
+
+        with transaction.atomic():
+            Counterparties.objects.bulk_update(updated, DADATA_FIELDS, batch_size=500)
+            result.state_changes += record_counterparty_states(states)
+            resolve_counterparty_hierarchy(inns)
+
+    result.requests = client.requests_sent
+    result.elapsed = time.monotonic() - started
+    return result
@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Детерминированные статусы для заглушки: распределение по остатку от деления ИНН
+STUB_STATUSES = ('ACTIVE',) * 7 + ('LIQUIDATING', 'BANKRUPT', 'LIQUIDATED')
+STUB_STATUS_CODES = {'ACTIVE': None, 'LIQUIDATING': 101, 'BANKRUPT': 111, 'LIQUIDATED': 201}
+
+# 01.01.2015 в миллисекундах, как отдает DaData
+STUB_REGISTRATION_DATE = 1420070400000
+
+
+def stub_party(inn) -> list:
+    """Синтетический ответ findById/party для ИНН: головная организация и, для части ИНН, филиал"""
+    digits = int(inn) if inn.isdigit() else sum(map(ord, inn))
+    if digits % 97 == 0:
+        return []
+
+    status = STUB_STATUSES[digits % len(STUB_STATUSES)]
+    is_legal = len(inn) == 10
+    main_kpp = f'{inn[:4]}01001' if is_legal else None
+
+    def party(branch_type, kpp, suffix=''):
+        name = f'ООО "ТЕСТ {inn}"{suffix}' if is_legal else f'ИП ТЕСТОВ {inn}'
+        return {
+            'value': name,
+            'unrestricted_value': name,
+            'data': {
+                'inn': inn,
+                'kpp': kpp,
+                'ogrn': f'1{inn:0>12}'[:13] if is_legal else f'3{inn:0>14}'[:15],
+                'ogrn_date': STUB_REGISTRATION_DATE,
+                'type': 'LEGAL' if is_legal else 'INDIVIDUAL',
+                'branch_type': branch_type if is_legal else None,
+                'okved': '35.12',
+                'name': {'full_with_opf': f'ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ "ТЕСТ {inn}"{suffix}',
+                         'short_with_opf': name},
+                'opf': {'full': 'Общество с ограниченной ответственностью', 'short': 'ООО'} if is_legal
+                else {'full': 'Индивидуальный предприниматель', 'short': 'ИП'},
+                'address': {'value': f'г Астрахань, ул Тестовая, д {digits % 200}{suffix}',
+                            'unrestricted_value': f'414000, г Астрахань, ул Тестовая, д {digits % 200}{suffix}'},
+                'state': {
+                    'status': status,
+                    'code': STUB_STATUS_CODES[status],
+                    'actuality_date': STUB_REGISTRATION_DATE,
+                    'registration_date': STUB_REGISTRATION_DATE,
+                    'liquidation_date': STUB_REGISTRATION_DATE if status == 'LIQUIDATED' else None,
+                },
+            },
+        }
+
+    parties = [party('MAIN', main_kpp)]
+    if is_legal and digits % 5 == 0:
+        parties.append(party('BRANCH', f'{inn[:4]}02001', suffix=' (филиал)'))
+    return parties
+
+
+class DadataStubServer:
+    """Локальная заглушка API DaData для тестов и бенчмарков обогащения.
+
+    Поддерживает искусственную задержку ответа и ограничение частоты (ответ 429 при превышении).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, rate_limit=None):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.throttled = 0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/suggestions/api/4_1/rs/findById/party'
+
+    def _allow(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            if not self.rate_limit:
+                return True
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            if self._window_count > self.rate_limit:
+                self.throttled += 1
+                return False
+            return True
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if not stub._allow():
+                    self._reply(429, {'detail': 'Too many requests'}, {'Retry-After': '1'})
+                    return
+                if stub.latency:
+                    time.sleep(stub.latency)
+                self._reply(200, {'suggestions': stub_party(str(payload.get('query', '')))})
+
+            def _reply(self, status, body, headers=None):
+                data = json.dumps(body, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
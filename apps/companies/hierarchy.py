@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+from django.db import connections, router
+from django.db.models import Case, OuterRef, Subquery, Value, When
+
+from apps.common.fields import from_minor_units
+from apps.companies.models import MONEY_DECIMAL_PLACES, Counterparties, DebtorRanking
+
+# Ограничение глубины обхода на случай ручного создания цикла parent
+MAX_HIERARCHY_DEPTH = 10
+
+
+def resolve_counterparty_hierarchy(inns=None) -> int:
+    """Функция для связывания подразделений с головной организацией одним UPDATE.
+        Головной считается первая (по дате создания) запись с branch_type=MAIN для ИНН; остальные записи
+        этого ИНН, кроме головных (филиалы и прочие адреса), получают ее в parent. У записей MAIN parent
+        очищается: повторная головная запись ИНН не становится подразделением другой. Записи ИНН без
+        головной организации остаются без parent. КПП не сопоставляется: у филиала он свой (по месту учета).
+    """
+    head = (Counterparties.objects
+            .filter(inn=OuterRef('inn'), branch_type=Counterparties.BranchType.MAIN)
+            .order_by('created_at', 'id')
+            .values('id')[:1])
+    queryset = Counterparties.objects.exclude(inn='')
+    if inns is not None:
+        queryset = queryset.filter(inn__in=list(inns))
+    return queryset.update(parent=Case(
+        When(branch_type=Counterparties.BranchType.MAIN, then=Value(None)),
+        default=Subquery(head),
+    ))
+
+
+def _to_amount(value) -> Decimal:
+    """Приведение суммы из сырого SQL (целое число минимальных единиц MoneyField) к Decimal"""
+    return from_minor_units(value or 0, MONEY_DECIMAL_PLACES)
+
+
+def counterparty_group_debt(root_ids=None) -> list:
+    """Функция для расчета задолженности по группам (головная организация + все подразделения).
+        Обход иерархии выполняется рекурсивным CTE (SQLite и PostgreSQL), суммы берутся
+        из предрасчитанного рейтинга должников - итог по всем группам получается одним запросом.
+        Без root_ids корнями считаются контрагенты без parent.
+    """
+    connection = connections[router.db_for_read(DebtorRanking)]    # Сырой SQL: база чтения выбирается явно
+    counterparties_table = connection.ops.quote_name(Counterparties._meta.db_table)
+    ranking_table = connection.ops.quote_name(DebtorRanking._meta.db_table)
+    pk_field = Counterparties._meta.pk
+
+    params = []
+    if root_ids is None:
+        root_filter = 'parent_id IS NULL'
+    else:
+        root_ids = list(root_ids)
+        if not root_ids:
+            return []
+        root_filter = f'id IN ({", ".join(["%s"] * len(root_ids))})'
+        params.extend(pk_field.get_db_prep_value(pk, connection) for pk in root_ids)
+    params.append(MAX_HIERARCHY_DEPTH)
+
+    sql = f'''
+        WITH RECURSIVE tree (root_id, node_id, depth) AS (
+            SELECT id, id, 0 FROM {counterparties_table} WHERE {root_filter}
+            UNION ALL
+            SELECT tree.root_id, c.id, tree.depth + 1
+            FROM {counterparties_table} c
+            JOIN tree ON c.parent_id = tree.node_id
+            WHERE tree.depth < %s
+        )
+        SELECT tree.root_id,
+               COUNT(DISTINCT tree.node_id),
+               SUM(r.debt_total),
+               SUM(r.debt_overdue)
+        FROM tree
+        LEFT JOIN {ranking_table} r ON r.counterparties_id = tree.node_id
+        GROUP BY tree.root_id
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    return [
+        {
+            'counterparty_id': pk_field.to_python(root_id),
+            'members': members,
+            'debt_total': _to_amount(debt_total),
+            'debt_overdue': _to_amount(debt_overdue),
+        }
+        for root_id, members, debt_total, debt_overdue in rows
+    ]
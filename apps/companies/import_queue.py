@@ -0,0 +1,241 @@
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.companies.models import ImportJob, ImportJobDataset
+
+logger = logging.getLogger(__name__)
+
+HOSTNAME = socket.gethostname()
+
+# Все импорты на SQLite: у базы один писатель, поэтому импорты выполняются строго по очереди
+SQLITE_DATASET = '*'
+
+# Ожидание блокировки записи SQLite при попытке получить наборы данных, мс: пока идет другой импорт,
+# попытка быстро отступает, и ожидающий импорт публикует позицию в очереди
+SQLITE_ACQUIRE_BUSY_TIMEOUT = 200
+
+
+def worker_name() -> str:
+    return f'{HOSTNAME}:{os.getpid()}'
+
+
+def dataset_keys(data) -> list:
+    """Наборы данных, которые записывает импорт: районы файла ОФ-9.
+
+    Контрагент относится к одному району, а договор - к одному контрагенту, поэтому импорты разных районов
+    пишут разные строки и выполняются параллельно. Отчетная дата в ключ не входит: номер договора уникален
+    без даты, а контрагент один во всех месяцах, так что файлы разных месяцев одного района пишут
+    те же строки Contract и Counterparties (unique_inn_address_key). На SQLite все импорты попадают
+    в один набор данных.
+    """
+    if connection.vendor == 'sqlite':
+        return [SQLITE_DATASET]
+    return sorted({str(row.get('Район') or '').strip() for row in data.rows})
+
+
+def retry_locked(func, *args, **kwargs):
+    """Повтор записи, если база занята другим импортом (SQLite: database is locked)"""
+    deadline = time.monotonic() + settings.IMPORT_LOCK_TIMEOUT
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except OperationalError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(settings.IMPORT_LOCK_POLL_INTERVAL)
+
+
+def _process_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def worker_alive(worker):
+    """Процесс импорта жив: True/False для процесса на этом хосте, None - процесс на другом хосте"""
+    host, _, pid = worker.rpartition(':')
+    if host != HOSTNAME or not pid.isdigit():
+        return None
+    return _process_alive(int(pid))
+
+
+def is_stale_job(job, now) -> bool:
+    """Импорт, процесс которого завершился, не освободив наборы данных.
+        Процесс на этом хосте проверяется напрямую; на других хостах - по времени: держит наборы данных дольше
+        IMPORT_LOCK_TIMEOUT или ждет очереди без отметок дольше IMPORT_LOCK_WAIT_STALE.
+    """
+    alive = worker_alive(job.worker)
+    if alive is False:
+        return True
+    if alive and not job.lock_acquired_at:
+        return False
+    if job.lock_acquired_at:
+        return now - job.lock_acquired_at > timedelta(seconds=settings.IMPORT_LOCK_TIMEOUT)
+    return now - job.updated_at > timedelta(seconds=settings.IMPORT_LOCK_WAIT_STALE)
+
+
+def _blockers(job, keys) -> list:
+    """Импорты, которые держат пересекающиеся наборы данных или раньше начали их ждать"""
+    return list(
+        ImportJob.objects
+        .filter(datasets__dataset__in=keys)
+        .filter(Q(lock_acquired_at__isnull=False) | Q(pk__lt=job.pk))
+        .exclude(pk=job.pk)
+        .distinct()
+    )
+
+
+def _queue_position(job, keys):
+    """Позиция в очереди без записи в БД; None - нужна попытка получить наборы данных (_try_acquire)"""
+    now = timezone.now()
+    blockers = _blockers(job, keys)
+    if not blockers or any(is_stale_job(blocker, now) for blocker in blockers):
+        return None
+    return len(blockers)
+
+
+@contextmanager
+def _fail_fast_when_locked():
+    """SQLite: короткое ожидание блокировки записи на время попытки (вместо таймаута соединения)"""
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA busy_timeout')
+        busy_timeout = cursor.fetchone()[0]
+        cursor.execute(f'PRAGMA busy_timeout = {SQLITE_ACQUIRE_BUSY_TIMEOUT}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA busy_timeout = {int(busy_timeout)}')
+
+
+def _try_acquire(job, keys) -> int:
+    """Одна попытка получить наборы данных: 0 - получены, иначе позиция в очереди.
+
+    Импорт ждет, пока пересекающиеся наборы данных держит другой импорт или их раньше начал ждать
+    импорт, созданный раньше (ключи uuid7 упорядочены по времени) - так очередь не может зациклиться.
+    """
+    now = timezone.now()
+    with _fail_fast_when_locked(), transaction.atomic():
+        # Первой идет запись: на SQLite она берет блокировку записи, и проверки очереди не пересекаются
+        ImportJob.objects.filter(pk=job.pk).update(updated_at=now, worker=worker_name())
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for key in keys:
+                    cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [key])
+        if not job.datasets.exists():
+            ImportJobDataset.objects.bulk_create([ImportJobDataset(job=job, dataset=key) for key in keys])
+
+        blockers = _blockers(job, keys)
+        stale = [blocker for blocker in blockers if is_stale_job(blocker, now)]
+        if stale:
+            logger.warning('Импорты %s прерваны, наборы данных освобождены', ', '.join(str(b.pk) for b in stale))
+            ImportJobDataset.objects.filter(job__in=stale).delete()
+            ImportJob.objects.filter(pk__in=[b.pk for b in stale]).update(
+                status=ImportJob.Status.FAILED, error='Процесс импорта прервался', finished_at=now,
+                lock_acquired_at=None, queue_position=None,
+            )
+
+        position = len(blockers) - len(stale)
+        if position:
+            ImportJob.objects.filter(pk=job.pk).update(
+                status=ImportJob.Status.WAITING, stage='waiting', queue_position=position
+            )
+        else:
+            ImportJob.objects.filter(pk=job.pk).update(
+                status=ImportJob.Status.RUNNING, stage='categories', queue_position=None, lock_acquired_at=now
+            )
+    return position
+
+
+class DatasetLock:
+    """Блокировка наборов данных импорта на время записи в БД (очередь в таблице ImportJobDataset).
+
+    acquire() ждет своей очереди и публикует позицию в прогресс импорта; release() освобождает наборы данных.
+    Если импорт запущен без ImportJob (синхронная загрузка), запись ImportJob создается здесь
+    и получает итоговый статус при освобождении.
+    """
+
+    def __init__(self, data, user, file_name, progress):
+        self.keys = dataset_keys(data)
+        self.user = user
+        self.file_name = file_name
+        self.progress = progress
+        self.job = None
+        self.owns_job = progress.job_id is None
+
+    def acquire(self):
+        if self.owns_job:
+            self.job = retry_locked(
+                ImportJob.objects.create, uploaded_by_id=self.user.pk, file_name=self.file_name,
+                status=ImportJob.Status.RUNNING, started_at=timezone.now(), worker=worker_name(),
+            )
+        else:
+            self.job = ImportJob.objects.get(pk=self.progress.job_id)
+
+        # Пока очередь не подошла, ожидание только читает БД; запись (регистрация в очереди, отметка ожидания,
+        # получение наборов данных) - когда очередь может подойти и раз в heartbeat
+        heartbeat = settings.IMPORT_LOCK_WAIT_STALE / 3
+        last_position, written_at = None, None
+        while True:
+            position = _queue_position(self.job, self.keys)
+            last_position = self._publish_position(position, last_position)
+            if position is None or written_at is None or time.monotonic() - written_at >= heartbeat:
+                try:
+                    position = _try_acquire(self.job, self.keys)
+                    written_at = time.monotonic()
+                except OperationalError:
+                    position = position or last_position or 1    # База занята импортом, который выполняется
+            if not position:
+                break
+            last_position = self._publish_position(position, last_position)
+            time.sleep(settings.IMPORT_LOCK_POLL_INTERVAL)
+
+        self.progress.status = ImportJob.Status.RUNNING
+        if last_position is not None:
+            self.progress.update(queue_position=None)
+        return self
+
+    def _publish_position(self, position, last_position):
+        if position and position != last_position:
+            self.progress.status = ImportJob.Status.WAITING
+            self.progress.stage('waiting', queue_position=position)
+            return position
+        return last_position
+
+    def release(self, error=None):
+        now = timezone.now()
+        fields = {'lock_acquired_at': None, 'queue_position': None}
+        if self.owns_job:
+            fields.update(
+                status=ImportJob.Status.FAILED if error else ImportJob.Status.COMPLETED,
+                error=str(error or ''),
+                stage=self.progress.stage_code if error else 'done',
+                rows_total=self.progress.rows_total,
+                inserted=self.progress.inserted,
+                updated=self.progress.updated,
+                upload_log_id=self.progress.upload_log_id,
+                finished_at=now,
+            )
+
+        def _release():
+            with transaction.atomic():
+                ImportJobDataset.objects.filter(job=self.job).delete()
+                ImportJob.objects.filter(pk=self.job.pk).update(**fields)
+
+        retry_locked(_release)
@@ -0,0 +1,316 @@
+import asyncio
+import json
+import logging
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.db import OperationalError, connection, connections, transaction
+from django.utils import timezone
+
+from apps.companies.import_queue import is_stale_job, retry_locked, worker_alive, worker_name
+from apps.companies.models import ImportJob, ImportJobDataset
+from apps.companies.progress import STAGE_NAMES, ImportProgress, channel
+from apps.companies.services import process_excel_file
+
+logger = logging.getLogger(__name__)
+
+# Блок копирования загруженного файла в каталог ожидающих импорта
+COPY_BLOCK_SIZE = 1024 * 1024
+
+PROGRESS_FIELDS = ('stage', 'rows_total', 'rows_processed', 'inserted', 'updated')
+
+UNFINISHED_STATUSES = (ImportJob.Status.QUEUED, ImportJob.Status.WAITING, ImportJob.Status.RUNNING)
+
+EVENTS_TOKEN_SALT = 'companies.import-events'
+
+# Опрос канала прогресса процесса в асинхронном потоке событий, сек
+CHANNEL_POLL_INTERVAL = 0.2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            fail_orphaned_jobs()    # Импорты пула прежнего процесса (перезапуск воркера)
+            _executor = ThreadPoolExecutor(max_workers=settings.IMPORT_WORKERS, thread_name_prefix='excel-import')
+        return _executor
+
+
+def _is_orphaned(job, now) -> bool:
+    """Незавершенный импорт, процесс которого завершился (перезапуск воркера с пулом потоков в памяти).
+        Держит наборы данных или ждет очереди - правила очереди импортов (is_stale_job). Иначе (в пуле,
+        чтение файла) процесс на этом хосте проверяется напрямую, на других хостах - без изменений дольше
+        IMPORT_LOCK_TIMEOUT: отметок прогресса до получения наборов данных нет.
+    """
+    if job.lock_acquired_at or job.status == ImportJob.Status.WAITING:
+        return is_stale_job(job, now)
+    alive = worker_alive(job.worker)
+    if alive is not None:
+        return not alive
+    return now - job.updated_at > timedelta(seconds=settings.IMPORT_LOCK_TIMEOUT)
+
+
+def fail_orphaned_jobs(jobs=None) -> int:
+    """Функция для завершения со статусом failed импортов, прерванных вместе с процессом.
+        jobs - проверяемые импорты (по умолчанию все незавершенные). Наборы данных и файлы ожидания удаляются.
+    """
+    now = timezone.now()
+    jobs = ImportJob.objects.all() if jobs is None else jobs
+    orphaned = [job for job in jobs.filter(status__in=UNFINISHED_STATUSES) if _is_orphaned(job, now)]
+    if not orphaned:
+        return 0
+    logger.warning('Импорты %s прерваны вместе с процессом', ', '.join(str(job.pk) for job in orphaned))
+    with transaction.atomic():
+        ImportJobDataset.objects.filter(job__in=orphaned).delete()
+        ImportJob.objects.filter(pk__in=[job.pk for job in orphaned], status__in=UNFINISHED_STATUSES).update(
+            status=ImportJob.Status.FAILED, error='Процесс импорта прервался', finished_at=now,
+            lock_acquired_at=None, queue_position=None,
+        )
+    for job in orphaned:
+        spool_path(job).unlink(missing_ok=True)
+    return len(orphaned)
+
+
+def events_token(job) -> str:
+    """Токен потока прогресса одного импорта на IMPORT_EVENTS_TOKEN_TTL (для EventSource: ?token=)"""
+    return signing.dumps(str(job.pk), salt=EVENTS_TOKEN_SALT)
+
+
+def check_events_token(token, job_id) -> bool:
+    """Токен выдан для потока прогресса этого импорта и не истек"""
+    if not token:
+        return False
+    try:
+        return signing.loads(token, salt=EVENTS_TOKEN_SALT, max_age=settings.IMPORT_EVENTS_TOKEN_TTL) == str(job_id)
+    except signing.BadSignature:
+        return False
+
+
+def spool_path(job) -> Path:
+    """Путь к файлу, ожидающему импорта"""
+    return Path(settings.IMPORT_SPOOL_DIR) / f'{job.pk}.xlsx'
+
+
+def submit_import(user, file_name, file_obj=None, path=None) -> ImportJob:
+    """Функция для постановки файла ОФ-9 в фоновый импорт.
+        Файл переносится в IMPORT_SPOOL_DIR (path - перемещается, file_obj - копируется), так как
+        временный файл запроса удаляется после ответа. Импорт запускается после фиксации транзакции запроса.
+    """
+    job = ImportJob.objects.create(uploaded_by_id=user.pk, file_name=file_name, worker=worker_name())
+    target = spool_path(job)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if path is not None:
+        shutil.move(path, target)
+    else:
+        file_obj.seek(0)
+        with open(target, 'wb') as spool:
+            shutil.copyfileobj(file_obj, spool, COPY_BLOCK_SIZE)
+
+    progress = ImportProgress(job.pk)
+    progress.status = ImportJob.Status.QUEUED
+    progress.update()
+    transaction.on_commit(lambda: _get_executor().submit(run_import_job, job.pk))
+    return job
+
+
+class JobProgressStore:
+    """Сохранение прогресса в ImportJob для других процессов (не чаще IMPORT_PROGRESS_SAVE_INTERVAL).
+
+    Внутри транзакции импорта запись пропускается: до фиксации ее не увидит никто, а на SQLite
+    отдельное соединение заблокировалось бы на время импорта. Живой прогресс этапов внутри транзакции
+    доступен через канал процесса (progress.channel).
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.saved_at = 0.0
+        self.saved_stage = None
+
+    def __call__(self, progress, event):
+        if connection.in_atomic_block or progress.status == ImportJob.Status.WAITING:
+            return    # Состояние ожидания записывает очередь (import_queue)
+        now = time.monotonic()
+        if progress.stage_code == self.saved_stage and now - self.saved_at < settings.IMPORT_PROGRESS_SAVE_INTERVAL:
+            return
+        try:
+            ImportJob.objects.filter(pk=self.job_id).update(**{name: event[name] for name in PROGRESS_FIELDS})
+        except OperationalError:
+            return    # База занята другим импортом: сохраним со следующим событием
+        self.saved_at, self.saved_stage = now, progress.stage_code
+
+
+def run_import_job(job_id) -> None:
+    """Функция для выполнения фонового импорта (в пуле потоков процесса)"""
+    job = ImportJob.objects.select_related('uploaded_by').get(pk=job_id)
+    path = spool_path(job)
+    progress = ImportProgress(job.pk, on_change=JobProgressStore(job.pk))
+    job.status = ImportJob.Status.RUNNING
+    job.started_at = timezone.now()
+    retry_locked(job.save, update_fields=['status', 'started_at', 'updated_at'])
+    try:
+        with open(path, 'rb') as file:
+            process_excel_file(File(file, name=job.file_name), job.uploaded_by, progress)
+    except Exception as e:
+        logger.exception('Ошибка фонового импорта %s', job.pk)
+        _finish_job(job, progress, ImportJob.Status.FAILED, str(e))
+    else:
+        _finish_job(job, progress, ImportJob.Status.COMPLETED)
+    finally:
+        path.unlink(missing_ok=True)
+        connections.close_all()
+
+
+def _finish_job(job, progress, status, error='') -> None:
+    """Итог импорта: сначала в БД, затем событие в канал (подписчики закрывают поток по нему)"""
+    event = progress.event()
+    retry_locked(
+        ImportJob.objects.filter(pk=job.pk).update,
+        status=status,
+        error=error,
+        upload_log_id=progress.upload_log_id,
+        finished_at=timezone.now(),
+        **{name: event[name] for name in PROGRESS_FIELDS if name != 'stage'},
+        stage='done' if status == ImportJob.Status.COMPLETED else progress.stage_code,
+    )
+    progress.finish(status, error)
+
+
+def job_event(job) -> dict:
+    """Событие прогресса по сохраненному состоянию ImportJob (импорт в другом процессе или завершен)"""
+    finished_at = job.finished_at or timezone.now()
+    return {
+        'job_id': str(job.pk),
+        'status': job.status,
+        'stage': job.stage,
+        'stage_name': STAGE_NAMES.get(job.stage, job.stage),
+        'progress': 100.0 if job.status == ImportJob.Status.COMPLETED else None,
+        'rows_total': job.rows_total,
+        'rows_processed': job.rows_processed,
+        'inserted': job.inserted,
+        'updated': job.updated,
+        'elapsed': round((finished_at - job.started_at).total_seconds(), 1) if job.started_at else 0.0,
+        'eta': None,
+        'queue_position': job.queue_position,
+        'error': job.error,
+    }
+
+
+def format_sse(data, event='progress', event_id=None) -> str:
+    """Сообщение в формате text/event-stream"""
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _stored_event(job_id):
+    """Событие по ImportJob (импорт в другом процессе или завершен); прерванный импорт завершается.
+        None - импорта нет.
+    """
+    job = ImportJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return None
+    if job.status in UNFINISHED_STATUSES and fail_orphaned_jobs(ImportJob.objects.filter(pk=job.pk)):
+        job.refresh_from_db()
+    return job_event(job)
+
+
+def _resume_seq(job_id, last_event_id) -> int:
+    """Номер события канала, полученного клиентом до переподключения (заголовок Last-Event-ID).
+        Номера ведет канал процесса: номер из другого процесса (или до перезапуска) не учитывается.
+    """
+    try:
+        seq = int(last_event_id)
+    except (TypeError, ValueError):
+        return 0
+    current = channel.last(job_id)
+    return seq if current and 0 < seq <= current[0] else 0
+
+
+class _EventStream:
+    """Отбор сообщений потока: новое событие, heartbeat при отсутствии событий, признак завершения"""
+
+    def __init__(self, job_id, last_event_id=None):
+        self.seq = _resume_seq(job_id, last_event_id)
+        self.last_event, self.last_sent = None, time.monotonic()
+        self.deadline = self.last_sent + settings.IMPORT_PROGRESS_STREAM_TIMEOUT
+
+    def messages(self, event) -> list:
+        if event is not None and event != self.last_event:
+            self.last_event, self.last_sent = event, time.monotonic()
+            return [format_sse(event, event_id=self.seq or None)]
+        if time.monotonic() - self.last_sent >= settings.IMPORT_PROGRESS_HEARTBEAT:
+            self.last_sent = time.monotonic()
+            return [': ping\n\n']
+        return []
+
+    @property
+    def open(self) -> bool:
+        if self.last_event and self.last_event['status'] in (ImportJob.Status.COMPLETED, ImportJob.Status.FAILED):
+            return False
+        return time.monotonic() < self.deadline
+
+
+def stream_job_events(job_id, last_event_id=None):
+    """Поток событий прогресса импорта (Server-Sent Events) для WSGI: до завершения импорта
+    или IMPORT_PROGRESS_STREAM_TIMEOUT, затем браузер переподключается сам (retry) с Last-Event-ID.
+
+    Если импорт выполняется в этом процессе, события берутся из канала процесса сразу по мере публикации;
+    иначе (другой воркер, импорт уже завершен) состояние читается из ImportJob раз в
+    IMPORT_PROGRESS_POLL_INTERVAL. Каждое событие - полное состояние, поэтому после переподключения
+    клиенту достаточно последнего. Пока новых событий нет, отправляется комментарий-heartbeat.
+    Поток занимает поток воркера, поэтому срок потока короткий; под ASGI - astream_job_events.
+    """
+    interval = settings.IMPORT_PROGRESS_POLL_INTERVAL
+    stream = _EventStream(job_id, last_event_id)
+    yield 'retry: 3000\n\n'
+    while stream.open:
+        if channel.last(job_id) is not None:
+            current = channel.wait(job_id, stream.seq, interval)
+            event = None
+            if current:
+                stream.seq, event = current
+            yield from stream.messages(event)
+        else:
+            event = _stored_event(job_id)
+            if event is None:
+                return
+            yield from stream.messages(event)
+            if stream.open:
+                time.sleep(interval)
+
+
+async def astream_job_events(job_id, last_event_id=None):
+    """Асинхронный вариант stream_job_events для ASGI: ожидание - asyncio.sleep, поток воркера не занят.
+        Канал процесса опрашивается раз в CHANNEL_POLL_INTERVAL, ImportJob - раз в IMPORT_PROGRESS_POLL_INTERVAL.
+    """
+    stream = _EventStream(job_id, last_event_id)
+    yield 'retry: 3000\n\n'
+    while stream.open:
+        current = channel.last(job_id)
+        if current is not None:
+            event = None
+            if current[0] > stream.seq:
+                stream.seq, event = current
+            delay = CHANNEL_POLL_INTERVAL
+        else:
+            event = await sync_to_async(_stored_event)(job_id)
+            if event is None:
+                return
+            delay = settings.IMPORT_PROGRESS_POLL_INTERVAL
+        for message in stream.messages(event):
+            yield message
+        if stream.open:
+            await asyncio.sleep(delay)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.companies.upload_archive import ArchiveInProgress, archive_uploads
+
+
+class Command(BaseCommand):
+    help = 'Перенос файлов старых загрузок ОФ-9 в сжатые архивы по месяцам (UPLOAD_ARCHIVE_DIR)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='Возраст загрузки, дней')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет перенесено')
+
+    def handle(self, *args, **options):
+        try:
+            result = archive_uploads(options['older_than_days'], options['dry_run'])
+        except ArchiveInProgress as e:
+            raise CommandError(str(e))
+        if options['dry_run']:
+            self.stdout.write(f'Будет перенесено файлов: {result.archived}, архивов: {result.archives}')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {result.archived}, архивов: {result.archives}, '
+            f'объем: {result.bytes_before / 1024 / 1024:.2f} -> {result.bytes_after / 1024 / 1024:.2f} Мб'
+        ))
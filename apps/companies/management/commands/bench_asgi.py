@@ -0,0 +1,58 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+
+from apps.authentication.tokens import CustomRefreshToken
+
+
+class Command(BaseCommand):
+    help = ('Сравнение пропускной способности синхронного (WSGI, пул потоков) и асинхронного '
+            '(ASGI, asyncio) обработчиков на одинаковой нагрузке чтения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Количество запросов на каждый вариант')
+        parser.add_argument('--concurrency', type=int, default=20, help='Количество одновременных запросов')
+        parser.add_argument('--limit', type=int, default=100, help='Размер выборки рейтинга должников')
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(username='bench_asgi')
+        headers = {'Authorization': f'Bearer {CustomRefreshToken.for_user(user).access_token}'}
+        query = f'?limit={options["limit"]}'
+
+        wsgi = self._bench_wsgi(f'/api/companies/debtors/top/{query}', headers, options)
+        asgi = asyncio.run(self._bench_asgi(f'/api/async/companies/debtors/top/{query}', headers, options))
+
+        for name, (elapsed, errors) in (('WSGI', wsgi), ('ASGI', asgi)):
+            self.stdout.write(
+                f'{name}: запросов: {options["requests"]}, ошибок: {errors}, время: {elapsed:.2f} с '
+                f'({options["requests"] / elapsed:.0f} запросов/с)'
+            )
+
+    @staticmethod
+    def _bench_wsgi(url, headers, options):
+        client = Client(headers=headers)
+
+        def call(_):
+            return client.get(url).status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            statuses = list(executor.map(call, range(options['requests'])))
+        return time.perf_counter() - started, sum(status != 200 for status in statuses)
+
+    @staticmethod
+    async def _bench_asgi(url, headers, options):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def call():
+            async with semaphore:
+                return (await client.get(url, headers=headers)).status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(call() for _ in range(options['requests'])))
+        return time.perf_counter() - started, sum(status != 200 for status in statuses)
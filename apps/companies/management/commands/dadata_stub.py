@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.companies.dadata_stub import DadataStubServer
+
+
+class Command(BaseCommand):
+    help = 'Запуск локальной заглушки API DaData (findById/party)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа, сек')
+        parser.add_argument('--rate-limit', type=int, help='Ограничение запросов в секунду (иначе 429)')
+
+    def handle(self, *args, **options):
+        stub = DadataStubServer(options['host'], options['port'], options['latency'], options['rate_limit'])
+        self.stdout.write(f'Заглушка DaData: {stub.url}')
+        try:
+            stub.serve_forever()
+        except KeyboardInterrupt:
+            stub.stop()
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from apps.companies.dadata import DadataClient, enrich_counterparties
+from apps.companies.dadata_stub import DadataStubServer
+
+
+class Command(BaseCommand):
+    help = 'Обогащение контрагентов данными DaData (только без данных либо с устаревшими данными)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Количество различных ИНН в пачке (страница выборки по ИНН)')
+        parser.add_argument('--limit', type=int, help='Максимальное количество ИНН за прогон')
+        parser.add_argument('--stale-days', type=int, help='Через сколько дней данные считаются устаревшими')
+        parser.add_argument('--cache-ttl-days', type=int, help='Срок жизни кеша ответов DaData, дней')
+        parser.add_argument('--force-refresh', action='store_true', help='Запрашивать DaData, игнорируя кеш')
+        parser.add_argument('--rate-limit', type=float, help='Ограничение запросов в секунду')
+        parser.add_argument('--concurrency', type=int, help='Количество одновременных запросов')
+        parser.add_argument('--stub', action='store_true',
+                            help='Использовать локальную заглушку DaData (для проверки и бенчмарков)')
+        parser.add_argument('--stub-latency', type=float, default=0.05, help='Задержка ответа заглушки, сек')
+
+    def handle(self, *args, **options):
+        client_options = {'rate_limit': options['rate_limit'], 'concurrency': options['concurrency']}
+        stub = DadataStubServer(latency=options['stub_latency']).start() if options['stub'] else None
+        try:
+            if stub:
+                client_options.update(api_url=stub.url, api_key='')
+            result = enrich_counterparties(
+                batch_size=options['batch_size'],
+                limit=options['limit'],
+                stale_days=options['stale_days'],
+                ttl_days=options['cache_ttl_days'],
+                force_refresh=options['force_refresh'],
+                client=DadataClient(**client_options),
+            )
+        finally:
+            if stub:
+                stub.stop()
+
+        rate = result.requests / result.elapsed if result.elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано: {result.processed}, обновлено: {result.updated}, не найдено: {result.not_found}, '
+            f'ошибок: {result.failed}, изменений статуса: {result.state_changes}, запросов: {result.requests}, '
+            f'время: {result.elapsed:.2f} с ({rate:.1f} запросов/с)'
+        ))
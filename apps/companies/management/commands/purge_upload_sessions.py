@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.companies.chunked_upload import purge_stale_upload_sessions
+
+
+class Command(BaseCommand):
+    help = 'Удаление незавершенных загрузок по частям (сессии и собранные файлы) без активности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-hours', type=int, help='Возраст последней активности, часов')
+
+    def handle(self, *args, **options):
+        deleted = purge_stale_upload_sessions(options['max_age_hours'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено сессий: {deleted}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.companies.models import Contract
+from apps.companies.services import refresh_debtor_ranking
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет рейтинга должников по всем контрагентам с договорами'
+
+    def handle(self, *args, **options):
+        counterparty_ids = Contract.objects.values_list('counterparties_id', flat=True).distinct()
+        with transaction.atomic():
+            refreshed = refresh_debtor_ranking(counterparty_ids)
+        self.stdout.write(self.style.SUCCESS(f'Рейтинг пересчитан: {refreshed} контрагентов'))
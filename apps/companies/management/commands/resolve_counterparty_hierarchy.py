@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.companies.hierarchy import resolve_counterparty_hierarchy
+
+
+class Command(BaseCommand):
+    help = 'Связывание филиалов и прочих подразделений с головной организацией по ИНН'
+
+    def handle(self, *args, **options):
+        updated = resolve_counterparty_hierarchy()
+        self.stdout.write(self.style.SUCCESS(f'Обработано контрагентов: {updated}'))
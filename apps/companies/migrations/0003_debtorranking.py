@@ -0,0 +1,76 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:07
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0002_remove_contract_district_counterparties_district_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DebtorRanking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('district', models.CharField(blank=True, default='', max_length=16)),
+                ('debt_total', models.DecimalField(decimal_places=5, default=Decimal('0.00'), max_digits=21)),
+                ('debt_overdue', models.DecimalField(decimal_places=5, default=Decimal('0.00'), max_digits=21)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Рейтинг должника',
+                'verbose_name_plural': 'Рейтинг должников',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='contract',
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='contract',
+            name='contract_number',
+            field=models.CharField(max_length=32, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='counterparties',
+            name='inn',
+            field=models.CharField(db_index=True, default='', max_length=12),
+        ),
+        migrations.AlterField(
+            model_name='counterparties',
+            name='name_from_excel',
+            field=models.CharField(default='', max_length=512),
+        ),
+        migrations.AlterField(
+            model_name='debtcredit',
+            name='contract',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='debt_credits', to='companies.contract'),
+        ),
+        migrations.AddConstraint(
+            model_name='counterparties',
+            constraint=models.UniqueConstraint(fields=('inn', 'address_from_excel'), name='unique_inn_address_from_excel'),
+        ),
+        migrations.AddField(
+            model_name='debtorranking',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rankings', to='companies.category'),
+        ),
+        migrations.AddField(
+            model_name='debtorranking',
+            name='counterparties',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ranking', to='companies.counterparties'),
+        ),
+        migrations.AddIndex(
+            model_name='debtorranking',
+            index=models.Index(fields=['district', 'category', '-debt_total'], name='ranking_district_cat_total'),
+        ),
+        migrations.AddIndex(
+            model_name='debtorranking',
+            index=models.Index(fields=['district', 'category', '-debt_overdue'], name='ranking_district_cat_overdue'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0003_debtorranking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='counterparties',
+            name='dadata_updated_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0004_counterparties_dadata_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DadataPartyCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inn', models.CharField(max_length=12, unique=True)),
+                ('payload', models.JSONField(blank=True, default=list)),
+                ('fetched_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Кеш DaData',
+                'verbose_name_plural': 'Кеш DaData',
+            },
+        ),
+    ]
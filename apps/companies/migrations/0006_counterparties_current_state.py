@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:11
+
+from django.db import migrations, models
+
+
+def fill_current_state(apps, schema_editor):
+    """Заполнение текущего состояния контрагентов по последней записи истории"""
+    Counterparties = apps.get_model('companies', 'Counterparties')
+    CounterpartiesState = apps.get_model('companies', 'CounterpartiesState')
+
+    latest = {}
+    for state in CounterpartiesState.objects.order_by('counterparties_id', 'actuality_date', 'id').iterator():
+        latest[state.counterparties_id] = state
+
+    counterparties = []
+    for counterparty in Counterparties.objects.filter(id__in=list(latest)).only('id'):
+        state = latest[counterparty.id]
+        counterparty.current_state = state.status
+        counterparty.current_state_code = state.code
+        counterparty.current_state_date = state.actuality_date
+        counterparties.append(counterparty)
+    Counterparties.objects.bulk_update(
+        counterparties, ['current_state', 'current_state_code', 'current_state_date'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0005_dadatapartycache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='counterparties',
+            name='current_state',
+            field=models.CharField(blank=True, choices=[('ACTIVE', 'Действующая'), ('LIQUIDATING', 'Ликвидируется'), ('LIQUIDATED', 'Ликвидирована'), ('BANKRUPT', 'Банкротство'), ('REORGANIZING', 'В процессе присоединения к другому ЮЛ')], db_index=True, default='', max_length=37),
+        ),
+        migrations.AddField(
+            model_name='counterparties',
+            name='current_state_code',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='counterparties',
+            name='current_state_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_current_state, migrations.RunPython.noop),
+    ]
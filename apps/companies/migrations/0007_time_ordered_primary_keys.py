@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:27
+
+import apps.common.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0006_counterparties_current_state'),
+    ]
+
+    # Меняется только генератор значений по умолчанию (на стороне Python): существующие uuid4-ключи
+    # остаются как есть, перестройка таблиц не нужна
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='contract',
+                    name='id',
+                    field=models.UUIDField(default=apps.common.utils.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='counterparties',
+                    name='id',
+                    field=models.UUIDField(default=apps.common.utils.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='counterpartycontact',
+                    name='id',
+                    field=models.UUIDField(default=apps.common.utils.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='uploadlog',
+                    name='id',
+                    field=models.UUIDField(default=apps.common.utils.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
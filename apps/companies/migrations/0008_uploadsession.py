@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:29
+
+import apps.common.utils
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0007_time_ordered_primary_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=apps.common.utils.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('checksum', models.PositiveBigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('active', 'Загружается'), ('completed', 'Импортирован'), ('failed', 'Ошибка импорта')], db_index=True, default='active', max_length=16)),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Сессия загрузки файла',
+                'verbose_name_plural': 'Сессии загрузки файлов',
+            },
+        ),
+    ]
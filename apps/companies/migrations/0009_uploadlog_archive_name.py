@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0008_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadlog',
+            name='archive_name',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='uploadlog',
+            name='file',
+            field=models.FileField(blank=True, upload_to='uploads/%Y/%m'),
+        ),
+    ]
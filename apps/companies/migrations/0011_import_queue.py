@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0010_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='lock_acquired_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='queue_position',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='worker',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'В очереди'), ('waiting', 'Ожидает импорта тех же данных'), ('running', 'Выполняется'), ('completed', 'Завершен'), ('failed', 'Ошибка')], db_index=True, default='queued', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='ImportJobDataset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dataset', models.CharField(db_index=True, max_length=255)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='datasets', to='companies.importjob')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('job', 'dataset'), name='unique_import_job_dataset')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-19 20:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0011_import_queue'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='contract',
+            name='companies_c_contrac_a924ab_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='counterparties',
+            name='companies_c_inn_7967df_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='uploadlog',
+            name='companies_u_uploade_4a82e4_idx',
+        ),
+        migrations.AlterField(
+            model_name='counterparties',
+            name='inn',
+            field=models.CharField(default='', max_length=12),
+        ),
+        migrations.AlterField(
+            model_name='importjobdataset',
+            name='job',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='datasets', to='companies.importjob'),
+        ),
+    ]
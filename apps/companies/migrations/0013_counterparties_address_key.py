@@ -0,0 +1,91 @@
+# Generated by Django 5.2.4 on 2026-10-19 20:03
+
+import re
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Max, Sum
+
+# Копия apps.companies.addresses на момент миграции: правка нормализации не должна менять уже выполненное слияние
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize_address(value) -> str:
+    if value is None or value != value:    # None, NaN
+        return ''
+    return _SEPARATORS.sub(' ', str(value).casefold().replace('ё', 'е')).strip()
+
+
+def merge_states(Counterparties, CounterpartiesState, counterparty_id):
+    """История состояний объединенного контрагента: без соседних одинаковых записей (хранятся только
+        изменения), текущее состояние (current_state*) - по последней записи
+    """
+    previous, duplicates = None, []
+    states = CounterpartiesState.objects.filter(counterparties_id=counterparty_id).order_by('actuality_date', 'id')
+    for state in states:
+        if previous is not None and (state.status, state.code) == (previous.status, previous.code):
+            duplicates.append(state.id)
+            continue
+        previous = state
+    CounterpartiesState.objects.filter(id__in=duplicates).delete()
+    if previous is not None:
+        Counterparties.objects.filter(id=counterparty_id).update(
+            current_state=previous.status,
+            current_state_code=previous.code,
+            current_state_date=previous.actuality_date,
+        )
+
+
+def fill_address_key(apps, schema_editor):
+    """Заполнение ключа адреса и слияние контрагентов, у которых совпали ИНН и ключ адреса.
+        Остается первая (по дате создания) запись; договоры, история состояний и подразделения
+        переходят к ней, текущее состояние пересчитывается по объединенной истории,
+        рейтинг должника - сумма рейтингов объединенных записей.
+    """
+    Counterparties = apps.get_model('companies', 'Counterparties')
+    CounterpartiesState = apps.get_model('companies', 'CounterpartiesState')
+    Contract = apps.get_model('companies', 'Contract')
+    DebtorRanking = apps.get_model('companies', 'DebtorRanking')
+
+    groups, batch = defaultdict(list), []
+    queryset = Counterparties.objects.order_by('created_at', 'id').only('id', 'inn', 'address_from_excel')
+    for counterparty in queryset.iterator(chunk_size=2000):
+        counterparty.address_key = normalize_address(counterparty.address_from_excel)
+        groups[(counterparty.inn, counterparty.address_key)].append(counterparty.id)
+        batch.append(counterparty)
+        if len(batch) >= 500:
+            Counterparties.objects.bulk_update(batch, ['address_key'])
+            batch = []
+    Counterparties.objects.bulk_update(batch, ['address_key'])
+
+    for survivor, *duplicates in (ids for ids in groups.values() if len(ids) > 1):
+        Contract.objects.filter(counterparties_id__in=duplicates).update(counterparties_id=survivor)
+        CounterpartiesState.objects.filter(counterparties_id__in=duplicates).update(counterparties_id=survivor)
+        merge_states(Counterparties, CounterpartiesState, survivor)
+        Counterparties.objects.filter(parent_id__in=duplicates).update(parent_id=survivor)
+        Counterparties.objects.filter(id=survivor, parent_id=survivor).update(parent_id=None)
+
+        rankings = DebtorRanking.objects.filter(counterparties_id__in=[survivor, *duplicates])
+        if rankings.exists():
+            totals = rankings.aggregate(debt_total=Sum('debt_total'), debt_overdue=Sum('debt_overdue'),
+                                        date=Max('date'))
+            rankings.filter(counterparties_id__in=duplicates).delete()
+            head = Counterparties.objects.values('district', 'category_id').get(id=survivor)
+            DebtorRanking.objects.update_or_create(counterparties_id=survivor, defaults={**head, **totals})
+        Counterparties.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0012_drop_redundant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='counterparties',
+            name='address_key',
+            field=models.CharField(default='', editable=False, max_length=1024),
+        ),
+        migrations.RunPython(fill_address_key, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-19 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0013_counterparties_address_key'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='counterparties',
+            name='unique_inn_address_from_excel',
+        ),
+        migrations.AddConstraint(
+            model_name='counterparties',
+            constraint=models.UniqueConstraint(fields=('inn', 'address_key'), name='unique_inn_address_key'),
+        ),
+    ]
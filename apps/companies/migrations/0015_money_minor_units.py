@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-19 20:07
+
+import apps.common.fields
+from decimal import Decimal
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Round
+
+# Суммы в минимальных единицах: 10^5 единиц в рубле (decimal_places=5)
+SCALE = 10 ** 5
+
+MONEY_FIELDS = {
+    'DebtCredit': ('debt_total', 'debt_acts', 'debt_current', 'debt_overdue', 'credit_total'),
+    'DebtorRanking': ('debt_total', 'debt_overdue'),
+}
+
+
+def to_minor_units(apps, schema_editor):
+    """Суммы -> целые числа минимальных единиц в тех же колонках; смена типа колонки на BIGINT ниже их не меняет"""
+    for model_name, fields in MONEY_FIELDS.items():
+        model = apps.get_model('companies', model_name)
+        model.objects.update(**{name: Round(F(name) * SCALE) for name in fields})
+
+
+def from_minor_units(apps, schema_editor):
+    for model_name, fields in MONEY_FIELDS.items():
+        model = apps.get_model('companies', model_name)
+        model.objects.update(**{name: Round(F(name) * (Decimal(1) / SCALE), 5) for name in fields})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0014_unique_inn_address_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_minor_units, from_minor_units),
+        migrations.AlterField(
+            model_name='debtcredit',
+            name='credit_total',
+            field=apps.common.fields.MoneyField(blank=True, decimal_places=5, default=Decimal('0.00'), max_digits=18, null=True),
+        ),
+        migrations.AlterField(
+            model_name='debtcredit',
+            name='debt_acts',
+            field=apps.common.fields.MoneyField(blank=True, decimal_places=5, default=Decimal('0.00'), max_digits=18, null=True),
+        ),
+        migrations.AlterField(
+            model_name='debtcredit',
+            name='debt_current',
+            field=apps.common.fields.MoneyField(blank=True, decimal_places=5, default=Decimal('0.00'), max_digits=18, null=True),
+        ),
+        migrations.AlterField(
+            model_name='debtcredit',
+            name='debt_overdue',
+            field=apps.common.fields.MoneyField(blank=True, decimal_places=5, default=Decimal('0.00'), max_digits=18, null=True),
+        ),
+        migrations.AlterField(
+            model_name='debtcredit',
+            name='debt_total',
+            field=apps.common.fields.MoneyField(blank=True, decimal_places=5, default=Decimal('0.00'), max_digits=18, null=True),
+        ),
+        migrations.AlterField(
+            model_name='debtorranking',
+            name='debt_overdue',
+            field=apps.common.fields.MoneyField(decimal_places=5, default=Decimal('0.00'), max_digits=18),
+        ),
+        migrations.AlterField(
+            model_name='debtorranking',
+            name='debt_total',
+            field=apps.common.fields.MoneyField(decimal_places=5, default=Decimal('0.00'), max_digits=18),
+        ),
+    ]
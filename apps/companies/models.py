@@ -3,8 +3,13 @@ from django.contrib.auth import get_user_model
 from django.conf import settings
 from decimal import Decimal
 
+from apps.common.fields import MoneyField
 from apps.common.models import BaseModel
 from apps.common.utils import upload_log_file_name_of_nine
+from apps.companies.addresses import normalize_address
+
+# Точность денежных сумм: хранятся целыми числами в единицах 10^-5 рубля (MoneyField)
+MONEY_DECIMAL_PLACES = 5
 
 
 class Category(models.Model):
@@ -41,6 +46,15 @@ class BusinessPlanCategory(models.Model):
         return self.name
 
 
+class CounterpartyStatus(models.TextChoices):
+    """Статусы контрагента по справочнику DaData"""
+    ACTIVE = 'ACTIVE', 'Действующая'
+    LIQUIDATING = 'LIQUIDATING', 'Ликвидируется'
+    LIQUIDATED = 'LIQUIDATED', 'Ликвидирована'
+    BANKRUPT = 'BANKRUPT', 'Банкротство'
+    REORGANIZING = 'REORGANIZING', 'В процессе присоединения к другому ЮЛ'
+
+
 class Counterparties(BaseModel):
     """
     Основная модель приложения - модель для контрагентов (основные данные из ОФ-9 (СТЕК)) и DaData).
@@ -50,6 +64,7 @@ class Counterparties(BaseModel):
         name_from_excel (str): Наименование из ОФ-9 (СТЕК).
         name_from_dadata (str): Наименование из DaData.
         address_from_excel (str): Адрес из ОФ-9 (СТЕК).
+        address_key (str): нормализованный адрес из ОФ-9 - вместе с ИНН определяет контрагента.
         address_from_dadata (str): Адрес из DaData.
         district (str): район, в котором располагается контрагент.
         counterparties_type (str): Тип организации (ЮЛ либо ИП).
@@ -68,6 +83,10 @@ class Counterparties(BaseModel):
         counterparties (Counterparties): контрагент, по которому получены данные из сервиса DaData.
         registration_date (DateTimeField): дата регистрации контрагента.
         liquidation_date (DateTimeField): дата ликвидации контрагента.
+        dadata_updated_at (DateTimeField): дата и время последнего обновления данных из DaData.
+        current_state (str): текущий статус контрагента (копия последней записи CounterpartiesState).
+        current_state_code (int): текущий детальный статус контрагента из справочника DaData.
+        current_state_date (DateTimeField): дата актуальности текущего статуса.
     """
 
     class CounterpartyType(models.TextChoices):
@@ -79,10 +98,11 @@ class Counterparties(BaseModel):
         BRANCH = 'BRANCH', 'Филиал'
 
 
-    inn = models.CharField(max_length=12, db_index=True, default='')
+    inn = models.CharField(max_length=12, default='')    # Поиск по ИНН - индекс unique_inn_address_key
     name_from_excel = models.CharField(max_length=512, default='')
     name_from_dadata = models.CharField(max_length=512, blank=True, default='')
     address_from_excel = models.CharField(max_length=1024)
+    address_key = models.CharField(max_length=1024, default='', editable=False)
     address_from_dadata = models.CharField(max_length=1024, blank=True, default='')
     district = models.CharField(max_length=16, blank=True, default='')
     counterparties_type = models.CharField(max_length=10, choices=CounterpartyType.choices, blank=True, default='')
@@ -102,24 +122,35 @@ class Counterparties(BaseModel):
     opf_short = models.CharField(max_length=8, blank=True, default='')
     registration_date = models.DateTimeField(blank=True, null=True)
     liquidation_date = models.DateTimeField(blank=True, null=True)
+    dadata_updated_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    current_state = models.CharField(max_length=37, choices=CounterpartyStatus.choices, blank=True, default='',
+                                     db_index=True)
+    current_state_code = models.IntegerField(blank=True, null=True)
+    current_state_date = models.DateTimeField(blank=True, null=True)
 
     class Meta:
-        indexes = [
-            models.Index(fields=['inn', 'counterparties_type', 'branch_type', 'liquidation_date']),
-        ]
         constraints = [
             models.UniqueConstraint(
-                fields=['inn', 'address_from_excel'], name='unique_inn_address_from_excel'
+                fields=['inn', 'address_key'], name='unique_inn_address_key'
             ),
         ]
 
     def __str__(self):
         return f'{self.name_from_excel} | {self.inn} | {self.address_from_excel}'
 
+    def save(self, *args, **kwargs):
+        # Импорт заполняет ключ сам (bulk_create), здесь - для изменений через админку и сервисы
+        self.address_key = normalize_address(self.address_from_excel)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'address_from_excel' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'address_key'}
+        super().save(*args, **kwargs)
+
 
 class CounterpartiesState(models.Model):
     """
     Модель для состояния контрагентов. Необходимо для отслеживания изменений.
+    Запись добавляется только при изменении статуса или кода (см. services.record_counterparty_states).
 
     Атрибуты:
         actuality_date (DateTimeField): дата последних изменений контрагента.
@@ -128,12 +159,7 @@ class CounterpartiesState(models.Model):
         counterparties (Counterparties): контрагент, к которому относится экземпляр модели.
     """
 
-    class Status(models.TextChoices):
-        ACTIVE = 'ACTIVE', 'Действующая'
-        LIQUIDATING = 'LIQUIDATING', 'Ликвидируется'
-        LIQUIDATED = 'LIQUIDATED', 'Ликвидирована'
-        BANKRUPT = 'BANKRUPT', 'Банкротство'
-        REORGANIZING = 'REORGANIZING', 'В процессе присоединения к другому ЮЛ'
+    Status = CounterpartyStatus
 
     actuality_date = models.DateTimeField()
     status = models.CharField(max_length=37, choices=Status.choices, default=Status.ACTIVE)
@@ -149,6 +175,31 @@ class CounterpartiesState(models.Model):
         return f'{self.counterparties.name_from_excel} | {self.status}'
 
 
+class DadataPartyCache(models.Model):
+    """
+    Модель для локального кеша ответов DaData по ИНН. Один ИНН встречается у многих контрагентов
+    (с разными адресами), поэтому ответ запрашивается один раз и переиспользуется до истечения срока.
+
+    Атрибуты:
+        inn (str): ИНН, по которому получен ответ.
+        payload (JSONField): необработанный список подразделений (suggestions) из ответа DaData.
+        fetched_at (DateTimeField): дата и время получения ответа.
+        expires_at (DateTimeField): дата и время, после которых ответ требует обновления.
+    """
+
+    inn = models.CharField(max_length=12, unique=True)
+    payload = models.JSONField(default=list, blank=True)
+    fetched_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Кеш DaData'
+        verbose_name_plural = 'Кеш DaData'
+
+    def __str__(self):
+        return f'{self.inn} | {self.fetched_at:%Y-%m-%d %H:%M}'
+
+
 class UploadLog(BaseModel):
     """
     Модель для отслеживания загрузок Excel-файлов с данными из ОФ-9.
@@ -157,21 +208,131 @@ class UploadLog(BaseModel):
         uploaded_by (auth.User): пользователь, который загрузил файл.
         file_name (str): наименование загруженного файла.
         rows_processed (int): количество строк в загруженном файле.
-        file (ExcelFiled): загруженный Excel-файл.
+        file (ExcelFiled): загруженный Excel-файл (сжат gzip; пусто после переноса в архив).
+        archive_name (str): архив, в который перенесен файл (archive_uploads).
     """
 
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     file_name = models.CharField(max_length=255, default=upload_log_file_name_of_nine, blank=True, null=True)
     rows_processed = models.PositiveIntegerField(default=0)
-    file = models.FileField(upload_to='uploads/%Y/%m')
+    file = models.FileField(upload_to='uploads/%Y/%m', blank=True)
+    archive_name = models.CharField(max_length=64, blank=True, default='')
+
+    def __str__(self):
+        return f'{self.uploaded_by} - {self.file_name}'
+
+
+class UploadSession(BaseModel):
+    """
+    Модель для сессии загрузки Excel-файла ОФ-9 по частям (init -> chunk -> complete).
+
+    Атрибуты:
+        uploaded_by (auth.User): пользователь, который загружает файл.
+        file_name (str): исходное имя файла.
+        size (int): ожидаемый размер файла, байт.
+        offset (int): количество уже полученных байт (с этого места продолжается загрузка).
+        checksum (int): CRC32 полученных байт (накопительно).
+        status (str): состояние сессии.
+    """
+
+    class Status(models.TextChoices):
+        ACTIVE = 'active', 'Загружается'
+        COMPLETED = 'completed', 'Импортирован'
+        FAILED = 'failed', 'Ошибка импорта'
+
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    file_name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    checksum = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.ACTIVE, db_index=True)
 
     class Meta:
-        indexes = [
-            models.Index(fields=['uploaded_by']),
+        verbose_name = 'Сессия загрузки файла'
+        verbose_name_plural = 'Сессии загрузки файлов'
+
+    def __str__(self):
+        return f'{self.file_name} | {self.offset}/{self.size}'
+
+
+class ImportJob(BaseModel):
+    """
+    Модель для фонового импорта Excel-файла ОФ-9 и его прогресса.
+
+    Атрибуты:
+        uploaded_by (auth.User): пользователь, который загрузил файл.
+        file_name (str): исходное имя файла.
+        status (str): состояние импорта.
+        stage (str): текущий этап импорта (apps.companies.progress.STAGES).
+        rows_total (int): количество строк в файле.
+        rows_processed (int): количество обработанных строк.
+        inserted (int): создано записей.
+        updated (int): обновлено записей.
+        error (str): текст ошибки импорта.
+        upload_log (UploadLog): запись журнала загрузок после успешного импорта.
+        queue_position (int): количество импортов тех же наборов данных, которые выполняются раньше этого.
+        worker (str): процесс, выполняющий импорт (хост:pid).
+        lock_acquired_at (DateTimeField): время получения блокировки наборов данных (apps.companies.import_queue).
+        started_at (DateTimeField): начало импорта.
+        finished_at (DateTimeField): окончание импорта.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'В очереди'
+        WAITING = 'waiting', 'Ожидает импорта тех же данных'
+        RUNNING = 'running', 'Выполняется'
+        COMPLETED = 'completed', 'Завершен'
+        FAILED = 'failed', 'Ошибка'
+
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='import_jobs')
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.QUEUED, db_index=True)
+    stage = models.CharField(max_length=32, default='queued')
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    inserted = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    upload_log = models.ForeignKey(UploadLog, on_delete=models.SET_NULL, null=True, blank=True)
+    queue_position = models.PositiveIntegerField(null=True, blank=True)
+    worker = models.CharField(max_length=128, blank=True, default='')
+    lock_acquired_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Импорт файла ОФ-9'
+        verbose_name_plural = 'Импорты файлов ОФ-9'
+
+    def __str__(self):
+        return f'{self.file_name} | {self.status}'
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.Status.COMPLETED, self.Status.FAILED)
+
+
+class ImportJobDataset(models.Model):
+    """
+    Модель для набора данных (район), который записывает импорт.
+    Строки существуют, пока импорт ждет очереди или выполняется: пересекающиеся импорты выполняются по очереди.
+
+    Атрибуты:
+        job (ImportJob): импорт.
+        dataset (str): ключ набора данных.
+    """
+
+    # Поиск по импорту - индекс unique_import_job_dataset (job, dataset)
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='datasets', db_index=False)
+    dataset = models.CharField(max_length=255, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'dataset'], name='unique_import_job_dataset'),
         ]
 
     def __str__(self):
-        return f'{self.uploaded_by} - {self.file_name}'
+        return f'{self.job_id} | {self.dataset}'
 
 
 class Contract(BaseModel):
@@ -190,11 +351,6 @@ class Contract(BaseModel):
     termination_date = models.DateField(blank=True, null=True)
     counterparties = models.ForeignKey(Counterparties, related_name='contracts', on_delete=models.CASCADE)
 
-    class Meta:
-        indexes = [
-            models.Index(fields=['contract_number']),
-        ]
-
     def __str__(self):
         return f'{self.counterparties.name_from_excel} - {self.contract_number}'
 
@@ -214,12 +370,12 @@ class DebtCredit(models.Model):
         contract (Contract): договор, по котором присутствуют дебиторская и/или кредиторская задолженности.
     """
 
-    debt_total = models.DecimalField(max_digits=21, decimal_places=5, default=Decimal('0.00'), blank=True, null=True)
-    debt_acts = models.DecimalField(max_digits=21, decimal_places=5, default=Decimal('0.00'), blank=True, null=True)
-    debt_current = models.DecimalField(max_digits=21, decimal_places=5, default=Decimal('0.00'), blank=True, null=True)
-    debt_overdue = models.DecimalField(max_digits=21, decimal_places=5, default=Decimal('0.00'), blank=True, null=True)
+    debt_total = MoneyField(decimal_places=MONEY_DECIMAL_PLACES, default=Decimal('0.00'), blank=True, null=True)
+    debt_acts = MoneyField(decimal_places=MONEY_DECIMAL_PLACES, default=Decimal('0.00'), blank=True, null=True)
+    debt_current = MoneyField(decimal_places=MONEY_DECIMAL_PLACES, default=Decimal('0.00'), blank=True, null=True)
+    debt_overdue = MoneyField(decimal_places=MONEY_DECIMAL_PLACES, default=Decimal('0.00'), blank=True, null=True)
     debt_origin_date = models.DateField(blank=True, null=True)
-    credit_total = models.DecimalField(max_digits=21, decimal_places=5, default=Decimal('0.00'), blank=True, null=True)
+    credit_total = MoneyField(decimal_places=MONEY_DECIMAL_PLACES, default=Decimal('0.00'), blank=True, null=True)
     date = models.DateField()
     contract = models.ForeignKey(Contract, on_delete=models.CASCADE, related_name='debt_credits')
 
@@ -227,6 +383,41 @@ class DebtCredit(models.Model):
         return f'{self.contract.contract_number}: {self.debt_total:.2f}'
 
 
+class DebtorRanking(models.Model):
+    """
+    Модель для предрасчитанного рейтинга должников (суммы по последним данным всех договоров контрагента).
+    Обновляется инкрементально при загрузке ОФ-9 и используется для топ-N запросов.
+
+    Атрибуты:
+        counterparties (Counterparties): контрагент, к которому относится строка рейтинга.
+        district (str): район контрагента (копия для индекса).
+        category (Category): категория контрагента (копия для индекса).
+        debt_total (Decimal): дебиторская задолженность контрагента по всем договорам.
+        debt_overdue (Decimal): просроченная дебиторская задолженность контрагента по всем договорам.
+        date (DateField): дата последних данных о задолженности.
+        updated_at (DateTimeField): дата и время пересчета строки рейтинга.
+    """
+
+    counterparties = models.OneToOneField(Counterparties, on_delete=models.CASCADE, related_name='ranking')
+    district = models.CharField(max_length=16, blank=True, default='')
+    category = models.ForeignKey(Category, blank=True, null=True, on_delete=models.SET_NULL, related_name='rankings')
+    debt_total = MoneyField(decimal_places=MONEY_DECIMAL_PLACES, default=Decimal('0.00'))
+    debt_overdue = MoneyField(decimal_places=MONEY_DECIMAL_PLACES, default=Decimal('0.00'))
+    date = models.DateField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Рейтинг должника'
+        verbose_name_plural = 'Рейтинг должников'
+        indexes = [
+            models.Index(fields=['district', 'category', '-debt_total'], name='ranking_district_cat_total'),
+            models.Index(fields=['district', 'category', '-debt_overdue'], name='ranking_district_cat_overdue'),
+        ]
+
+    def __str__(self):
+        return f'{self.counterparties_id}: {self.debt_total:.2f}'
+
+
 class CounterpartyContact(BaseModel):
     """
     Модель для представителя юридического лица либо индивидуального предпринимателя.
@@ -0,0 +1,162 @@
+import threading
+import time
+
+# Этапы импорта ОФ-9 и их примерная доля во времени импорта (для расчета ETA)
+STAGES = (
+    ('queued', 'В очереди', 0.0),
+    ('read', 'Чтение файла', 0.30),
+    ('waiting', 'Ожидание импорта тех же данных', 0.0),
+    ('categories', 'Категории', 0.02),
+    ('counterparties', 'Контрагенты', 0.25),
+    ('contracts', 'Договоры', 0.15),
+    ('debt_credit', 'Дебиторская/кредиторская задолженность', 0.20),
+    ('ranking', 'Рейтинг должников', 0.06),
+    ('store', 'Сохранение файла', 0.02),
+    ('done', 'Завершено', 0.0),
+)
+STAGE_NAMES = {code: name for code, name, _ in STAGES}
+_STAGE_DONE_WEIGHT = {}
+_total = 0.0
+for _code, _, _weight in STAGES:
+    _STAGE_DONE_WEIGHT[_code] = _total
+    _total += _weight
+_STAGE_WEIGHT = {code: weight for code, _, weight in STAGES}
+
+
+class ProgressChannel:
+    """Канал событий прогресса импорта в пределах процесса (без внешнего брокера).
+
+    Хранит последнее событие по каждому импорту с порядковым номером; подписчики ждут нового номера
+    на Condition. Завершенные импорты удаляются из канала через retention секунд - их итог хранится в ImportJob.
+    """
+
+    def __init__(self, retention=300):
+        self.retention = retention
+        self._events = {}
+        self._finished = {}
+        self._condition = threading.Condition()
+
+    def publish(self, job_id, event, finished=False):
+        with self._condition:
+            seq = self._events.get(job_id, (0, None))[0] + 1
+            self._events[job_id] = (seq, event)
+            if finished:
+                self._finished[job_id] = time.monotonic()
+            self._expire()
+            self._condition.notify_all()
+
+    def last(self, job_id):
+        with self._condition:
+            return self._events.get(job_id)
+
+    def wait(self, job_id, after_seq, timeout):
+        """Ожидание события с номером больше after_seq: (номер, событие) или None по таймауту"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                current = self._events.get(job_id)
+                if current and current[0] > after_seq:
+                    return current
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _expire(self):
+        now = time.monotonic()
+        for job_id, finished_at in list(self._finished.items()):
+            if now - finished_at > self.retention:
+                self._finished.pop(job_id)
+                self._events.pop(job_id, None)
+
+
+channel = ProgressChannel()
+
+
+class ImportProgress:
+    """Прогресс импорта ОФ-9: этап, строки, созданные/обновленные записи, оценка оставшегося времени.
+
+    Каждое изменение публикуется в channel; вне транзакции импорта состояние сохраняется в ImportJob
+    (см. apps.companies.jobs), чтобы его видели другие процессы.
+    """
+
+    def __init__(self, job_id=None, on_change=None):
+        self.job_id = job_id
+        self.on_change = on_change
+        self.started = time.monotonic()
+        self.status = 'running'
+        self.stage_code = 'queued'
+        self.stage_fraction = 0.0
+        self.rows_total = 0
+        self.rows_processed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.error = ''
+        self.extra = {}
+        self.upload_log_id = None
+        self.queue_position = None
+
+    def stage(self, code, **counters):
+        self.stage_code = code
+        self.stage_fraction = 0.0
+        self.update(**counters)
+
+    def update(self, fraction=None, **counters):
+        if fraction is not None:
+            self.stage_fraction = min(max(fraction, 0.0), 1.0)
+        for name, value in counters.items():
+            setattr(self, name, value)
+        self._publish()
+
+    def finish(self, status, error=''):
+        self.status = status
+        self.error = error
+        self.stage_code = 'done' if status == 'completed' else self.stage_code
+        self._publish(finished=True)
+
+    @property
+    def fraction(self) -> float:
+        if self.stage_code == 'done':
+            return 1.0
+        done = _STAGE_DONE_WEIGHT[self.stage_code] + _STAGE_WEIGHT[self.stage_code] * self.stage_fraction
+        return done / _total
+
+    def eta(self):
+        """Оценка оставшегося времени, сек (по доле пройденных этапов)"""
+        fraction = self.fraction
+        if self.status != 'running' or fraction <= 0:
+            return None
+        elapsed = time.monotonic() - self.started
+        return round(elapsed * (1 - fraction) / fraction, 1)
+
+    def event(self) -> dict:
+        return {
+            'job_id': str(self.job_id) if self.job_id else None,
+            'status': self.status,
+            'stage': self.stage_code,
+            'stage_name': STAGE_NAMES[self.stage_code],
+            'progress': round(self.fraction * 100, 1),
+            'rows_total': self.rows_total,
+            'rows_processed': self.rows_processed,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'elapsed': round(time.monotonic() - self.started, 1),
+            'eta': self.eta(),
+            'queue_position': self.queue_position,
+            'error': self.error,
+            **self.extra,
+        }
+
+    def _publish(self, finished=False):
+        event = self.event()
+        if self.job_id is not None:
+            channel.publish(self.job_id, event, finished=finished)
+        if self.on_change is not None:
+            self.on_change(self, event)
+
+
+class NullProgress(ImportProgress):
+    """Прогресс без публикации (импорт без отслеживания)"""
+
+    def _publish(self, finished=False):
+        pass
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.core.validators import FileExtensionValidator
 
-from apps.companies.models import UploadLog
+from apps.companies.models import CounterpartyStatus, DebtorRanking, ImportJob, UploadLog, UploadSession
 
 
 class ExcelUploadSerializer(serializers.ModelSerializer):
@@ -9,10 +9,13 @@ class ExcelUploadSerializer(serializers.ModelSerializer):
         validators=[FileExtensionValidator(allowed_extensions=['xlsx', 'xls'])],
         help_text="Excel-файл с данными контрагентов (XLSX/XLS)"
     )
+    background = serializers.BooleanField(
+        required=False, default=False, help_text='Импорт в фоне: ответ 202 с импортом и потоком прогресса'
+    )
 
     class Meta:
         model = UploadLog
-        fields = ('file',)
+        fields = ('file', 'background')
 
     def validate_file(self, value):
         """Ограничение размера файла (для безопасности)"""
@@ -20,3 +23,67 @@ class ExcelUploadSerializer(serializers.ModelSerializer):
         if value.size > max_size:
             raise serializers.ValidationError("Максимальный размер файла - 30 Мб")
         return value
+
+
+class DebtorRankingQuerySerializer(serializers.Serializer):
+    """Параметры запроса рейтинга должников"""
+    district = serializers.CharField(required=False, allow_blank=True)
+    category = serializers.IntegerField(required=False)
+    status = serializers.ChoiceField(choices=CounterpartyStatus.choices, required=False)
+    order_by = serializers.ChoiceField(choices=['debt_total', 'debt_overdue'], default='debt_total')
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+
+
+class DebtorRankingSerializer(serializers.ModelSerializer):
+    counterparty_id = serializers.UUIDField(source='counterparties_id')
+    inn = serializers.CharField(source='counterparties.inn')
+    name = serializers.CharField(source='counterparties.name_from_excel')
+    address = serializers.CharField(source='counterparties.address_from_excel')
+    category = serializers.CharField(source='category.name', default=None)
+
+    class Meta:
+        model = DebtorRanking
+        fields = ('counterparty_id', 'inn', 'name', 'address', 'district', 'category',
+                  'debt_total', 'debt_overdue', 'date')
+
+
+class CounterpartyGroupDebtSerializer(serializers.Serializer):
+    counterparty_id = serializers.UUIDField()
+    members = serializers.IntegerField()
+    debt_total = serializers.DecimalField(max_digits=21, decimal_places=5)
+    debt_overdue = serializers.DecimalField(max_digits=21, decimal_places=5)
+
+
+class UploadSessionCreateSerializer(serializers.ModelSerializer):
+    """Начало загрузки по частям: имя файла и его полный размер"""
+    file_name = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = UploadSession
+        fields = ('file_name', 'size')
+
+    def validate_file_name(self, value):
+        if not value.lower().endswith(('.xlsx', '.xls')):
+            raise serializers.ValidationError('Допустимы только файлы XLSX/XLS')
+        return value
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'file_name', 'size', 'offset', 'checksum', 'status', 'created_at', 'updated_at')
+
+
+class UploadSessionCompleteSerializer(serializers.Serializer):
+    checksum = serializers.IntegerField(required=False, min_value=0, help_text='CRC32 всего файла (необязательно)')
+    background = serializers.BooleanField(
+        required=False, default=False, help_text='Импорт в фоне: ответ 202 с импортом и потоком прогресса'
+    )
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'file_name', 'status', 'stage', 'rows_total', 'rows_processed', 'inserted', 'updated',
+                  'queue_position', 'error', 'upload_log', 'created_at', 'started_at', 'finished_at')
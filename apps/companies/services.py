@@ -1,18 +1,49 @@
-from datetime import datetime
-from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+from datetime import date, datetime
+from decimal import Decimal
+import logging
 import re
-import pandas as pd
+import sys
+import time
+from typing import NamedTuple
 
 from django.db import transaction
+from django.utils import timezone
+from django.db.models import Max, OuterRef, Subquery, Sum
 
+from apps.common.db_routing import pin_primary
+from apps.common.fields import MinorUnits, minor_units_column, to_minor_units
+from apps.common.metrics import IMPORT_DURATION, IMPORT_JOBS, IMPORT_OBJECTS, IMPORT_ROWS
+from apps.companies.addresses import normalize_address, normalize_address_column
 from apps.companies.models import (
+    MONEY_DECIMAL_PLACES,
     Category,
     BusinessPlanCategory,
     Counterparties,
+    CounterpartiesState,
     Contract,
     DebtCredit,
+    DebtorRanking,
     UploadLog
 )
+from apps.companies.import_queue import DatasetLock
+from apps.companies.progress import NullProgress
+from apps.companies.upload_archive import store_upload
+
+logger = logging.getLogger(__name__)
+
+RANKING_BATCH_SIZE = 500
+
+# Размер пачки ИНН при поиске существующих контрагентов (ограничение числа параметров запроса)
+COUNTERPARTY_LOOKUP_BATCH_SIZE = 1000
+
+# Колонка строки ОФ-9 с ключом адреса (считается при чтении файла для всей колонки 'Адрес')
+ADDRESS_KEY_COLUMN = 'address_key'
+
+# Колонки сумм ОФ-9 с постоянным названием (названия колонок дебиторской и кредиторской задолженности содержат дату)
+AMOUNT_COLUMNS = ('В т.ч. по актам недоучета.1', '     текущая       (до 30 дней).1', 'просроченная.1')
+
+# Частота публикации прогресса внутри этапа, строк
+PROGRESS_EVERY = 1000
 
 
 def _extract_column(columns, prefix) -> tuple:
@@ -30,67 +61,281 @@ def _extract_column(columns, prefix) -> tuple:
     return None, None
 
 
+def _is_missing(value) -> bool:
+    """Проверка пустой ячейки (None, NaN, NaT, pd.NA) без импорта pandas.
+        pd.NA проверяется явно: сравнение с ним возвращает pd.NA, и bool() от результата вызывает TypeError.
+        Если pandas не импортирован, значений pd.NA быть не может.
+    """
+    if value is None:
+        return True
+    pandas = sys.modules.get('pandas')
+    if pandas is not None and value is pandas.NA:
+        return True
+    return value != value
+
+
 def _get_date(value) -> datetime:
     """Функция для конвертирования объектов в формат Date."""
-    if pd.isna(value):
+    if _is_missing(value):
         return None
-    if isinstance(value, pd.Timestamp):
-        return value.to_pydatetime().date()
-    if isinstance(value, datetime):
+    if isinstance(value, datetime):    # В т.ч. pd.Timestamp
         return value.date()
     return value
 
 
-def _get_decimal(value) -> Decimal:
-    """Функция для получения корректного значения суммы"""
-    if pd.isna(value):
-        return Decimal('0.00000')
-
-    clean_str = str(value).replace(',', '.')
-
-    try:
-        return Decimal(clean_str).quantize(Decimal('0.00000'), rounding=ROUND_HALF_UP)
-    except InvalidOperation:
-        return Decimal('0.00000')
+def _get_amount(value) -> MinorUnits:
+    """Функция для получения суммы: колонки сумм переведены в минимальные единицы при чтении файла
+        и передаются в MoneyField без перевода в Decimal.
+    """
+    if _is_missing(value):
+        return MinorUnits(0, MONEY_DECIMAL_PLACES)
+    return MinorUnits(value, MONEY_DECIMAL_PLACES)
 
 
 def _value_changed(old, new) -> bool:
     """Функция для старого и нового параметров"""
+    if isinstance(new, MinorUnits) and old is not None:
+        return to_minor_units(old, new.decimal_places) != new
     return old != new
 
 
 def _clean_inn(value) -> str:
     """Функция для нормализации ИНН"""
-    if pd.isna(value):
+    if _is_missing(value):
         return ''
     return re.sub(r'\D', '', str(value).rstrip('0')) or ''
 
 
-def _addr_key(value) -> str:
-    if pd.isna(value):
+def _clean_address(value) -> str:
+    if _is_missing(value):
         return ''
     return str(value).strip()
 
 
-def process_excel_file(file_obj, user) -> int:
-    """Функция для обработки входящего Excel-файла"""
-    try:
-        df = pd.read_excel(
-            file_obj,
-            header=0,
-            skiprows=[0, 1, 2, 4, 5, 6],
-            usecols=[1, 2, 3, 4, 5, 6, 7, 8, 10, 11, 27, 28, 29, 30, 37, 38],
-            decimal=',',
-            engine='openpyxl',
+def _address_key(row) -> str:
+    """Ключ адреса строки: посчитан при чтении файла, для строк не из read_excel_file - здесь"""
+    key = row.get(ADDRESS_KEY_COLUMN)
+    return normalize_address(row.get('Адрес')) if key is None else key
+
+
+def _find_counterparties(keys) -> dict:
+    """Существующие контрагенты по ключам (ИНН, ключ адреса) - поиск по индексу unique_inn_address_key"""
+    addresses_by_inn = {}
+    for inn, address_key in keys:
+        addresses_by_inn.setdefault(inn, set()).add(address_key)
+    inns = list(addresses_by_inn)
+
+    found = {}
+    for start in range(0, len(inns), COUNTERPARTY_LOOKUP_BATCH_SIZE):
+        batch = inns[start:start + COUNTERPARTY_LOOKUP_BATCH_SIZE]
+        address_keys = set().union(*(addresses_by_inn[inn] for inn in batch))
+        counterparties = Counterparties.objects.filter(inn__in=batch, address_key__in=address_keys).select_related(
+            'category', 'business_plan_category')    # Категории сравниваются при обновлении - без запроса на строку
+        for c in counterparties:
+            if (c.inn, c.address_key) in keys:
+                found[(c.inn, c.address_key)] = c
+    return found
+
+
+def _track(items, progress):
+    """Перебор строк этапа с публикацией прогресса каждые PROGRESS_EVERY строк"""
+    total = len(items)
+    for i, item in enumerate(items, 1):
+        yield item
+        if i % PROGRESS_EVERY == 0 or i == total:
+            progress.update(fraction=i / total, rows_processed=i)
+
+
+def _count_stage(stats, progress, name) -> None:
+    """Добавление созданных/обновленных записей этапа к прогрессу"""
+    created, updated = stats[name]
+    progress.update(inserted=progress.inserted + created, updated=progress.updated + updated)
+
+
+def refresh_debtor_ranking(counterparty_ids) -> int:
+    """Функция для пересчета рейтинга должников по указанным контрагентам.
+        Суммирует последние (по дате) данные о задолженности всех договоров контрагента
+        и обновляет строки DebtorRanking. Контрагенты без задолженности удаляются из рейтинга.
+    """
+    ids = list(dict.fromkeys(counterparty_ids))
+    refreshed = 0
+    for start in range(0, len(ids), RANKING_BATCH_SIZE):
+        batch = ids[start:start + RANKING_BATCH_SIZE]
+        latest_dc = (DebtCredit.objects
+                     .filter(contract_id=OuterRef('contract_id'))
+                     .order_by('-date', '-id')
+                     .values('id')[:1])
+        totals = {
+            t['contract__counterparties_id']: t for t in
+            DebtCredit.objects
+            .filter(contract__counterparties_id__in=batch, id=Subquery(latest_dc))
+            .values('contract__counterparties_id')
+            .annotate(debt_total=Sum('debt_total'), debt_overdue=Sum('debt_overdue'), date=Max('date'))
+        }
+        rankings = [
+            DebtorRanking(
+                counterparties_id=cp_id,
+                district=district,
+                category_id=category_id,
+                debt_total=totals[cp_id]['debt_total'] or Decimal('0.00000'),
+                debt_overdue=totals[cp_id]['debt_overdue'] or Decimal('0.00000'),
+                date=totals[cp_id]['date'],
+            )
+            for cp_id, district, category_id in
+            Counterparties.objects.filter(id__in=list(totals)).values_list('id', 'district', 'category_id')
+        ]
+        DebtorRanking.objects.filter(counterparties_id__in=batch).exclude(counterparties_id__in=list(totals)).delete()
+        DebtorRanking.objects.bulk_create(
+            rankings,
+            update_conflicts=True,
+            unique_fields=['counterparties'],
+            update_fields=['district', 'category', 'debt_total', 'debt_overdue', 'date', 'updated_at'],
+            batch_size=RANKING_BATCH_SIZE,
+        )
+        refreshed += len(rankings)
+    return refreshed
+
+
+def top_debtors(params):
+    """Запрос топ-N должников из рейтинга по параметрам DebtorRankingQuerySerializer
+        (район, категория, статус контрагента, порядок, лимит)
+    """
+    rankings = DebtorRanking.objects.select_related('counterparties', 'category')
+    if 'district' in params:
+        rankings = rankings.filter(district=params['district'])
+    if 'category' in params:
+        rankings = rankings.filter(category_id=params['category'])
+    if 'status' in params:
+        rankings = rankings.filter(counterparties__current_state=params['status'])
+    return rankings.order_by(f'-{params["order_by"]}')[:params['limit']]
+
+
+def record_counterparty_states(states) -> int:
+    """Функция для записи состояний контрагентов только при изменении.
+        states - набор кортежей (контрагент, статус, код, дата актуальности). Запись истории добавляется,
+        только если статус или код отличаются от текущих; текущее состояние контрагента
+        (current_state*) обновляется в той же транзакции. Текущее состояние перечитывается из БД
+        с блокировкой строк (select_for_update): экземпляры могли устареть, а параллельное обогащение
+        иначе записало бы тот же переход дважды.
+    """
+    states = list(states)
+    if not states:
+        return 0
+    new_states, changed = [], []
+    with transaction.atomic():
+        current = {
+            pk: (state, code)
+            for pk, state, code in Counterparties.objects.select_for_update()
+            .filter(pk__in=[counterparty.pk for counterparty, *_ in states])
+            .values_list('pk', 'current_state', 'current_state_code')
+        }
+        for counterparty, status, code, actuality_date in states:
+            if current.get(counterparty.pk) == (status, code):
+                counterparty.current_state, counterparty.current_state_code = status, code
+                continue
+            actuality_date = actuality_date or timezone.now()
+            counterparty.current_state = status
+            counterparty.current_state_code = code
+            counterparty.current_state_date = actuality_date
+            current[counterparty.pk] = (status, code)
+            new_states.append(CounterpartiesState(
+                counterparties=counterparty,
+                status=status,
+                code=code,
+                actuality_date=actuality_date,
+            ))
+            changed.append(counterparty)
+
+        CounterpartiesState.objects.bulk_create(new_states, batch_size=500)
+        Counterparties.objects.bulk_update(
+            changed,
+            ['current_state', 'current_state_code', 'current_state_date'],
+            batch_size=500
         )
+    return len(new_states)
+
+
+class ExcelData(NamedTuple):
+    """Прочитанные из Excel-файла ОФ-9 строки и найденные колонки задолженностей.
+        Суммы в строках - целые числа минимальных единиц MoneyField (10^-MONEY_DECIMAL_PLACES).
+    """
+    rows: list
+    debt_col: str
+    debt_date: date
+    credit_col: str
+
+
+def read_excel_file(file_obj) -> ExcelData:
+    """Функция для чтения Excel-файла ОФ-9 (ресурсоемкая часть обработки, без обращений к БД)"""
+    import pandas as pd    # Тяжелый импорт только при загрузке файла, а не при старте воркера
+
+    df = pd.read_excel(
+        file_obj,
+        header=0,
+        skiprows=[0, 1, 2, 4, 5, 6],
+        usecols=[1, 2, 3, 4, 5, 6, 7, 8, 10, 11, 27, 28, 29, 30, 37, 38],
+        decimal=',',
+        engine='openpyxl',
+    )
+
+    debt_col, debt_date = _extract_column(df.columns, 'Дебиторская задолженность')
+    credit_col, _ = _extract_column(df.columns, 'Кредиторская задолженность')
+    df[ADDRESS_KEY_COLUMN] = normalize_address_column(df['Адрес'])
+    for column in (debt_col, credit_col, *AMOUNT_COLUMNS):
+        if column in df.columns:
+            df[column], unparsed = minor_units_column(df[column], MONEY_DECIMAL_PLACES)
+            if unparsed:
+                logger.warning('Колонка "%s": %d нечисловых сумм записаны как 0', column.strip(), unparsed)
+
+    return ExcelData(df.to_dict('records'), debt_col, debt_date, credit_col)
+
+
+def _store_upload_file(log, file_obj) -> None:
+    """Сохранение файла загрузки в журнал (вне транзакции импорта); ошибка сохранения не отменяет импорт"""
+    try:
+        store_upload(log, file_obj)
+    except Exception:
+        logger.exception('Не удалось сохранить файл загрузки %s', log.pk)
 
-        debt_col, debt_date = _extract_column(df.columns, 'Дебиторская задолженность')
-        credit_col, _ = _extract_column(df.columns, 'Кредиторская задолженность')
 
-        rows = df.to_dict('records')
+def _save_failed_upload(file_obj, user) -> None:
+    """Сохранение файла неудачной загрузки для разбора"""
+    try:
+        log = UploadLog.objects.create(uploaded_by_id=user.pk, rows_processed=0)
+    except Exception:
+        logger.exception('Не удалось записать неудачную загрузку в журнал')
+        return
+    _store_upload_file(log, file_obj)
 
+
+def process_excel_file(file_obj, user, progress=None) -> int:
+    """Функция для обработки входящего Excel-файла.
+        progress (ImportProgress) - получатель событий прогресса по этапам импорта.
+    """
+    progress = progress or NullProgress()
+    started = time.perf_counter()
+    progress.stage('read')
+    try:
+        data = read_excel_file(file_obj)
+    except Exception:
+        IMPORT_JOBS.inc(status='failed')
+        _save_failed_upload(file_obj, user)
+        raise
+    IMPORT_DURATION.observe(time.perf_counter() - started, stage='read')
+    return import_excel_data(data, file_obj, user, progress)
+
+
+def import_excel_data(data, file_obj, user, progress=None) -> int:
+    """Функция для записи прочитанных данных ОФ-9 в БД"""
+    rows, debt_col, debt_date, credit_col = data
+    progress = progress or NullProgress()
+    lock = DatasetLock(data, user, getattr(file_obj, 'name', None) or '', progress).acquire()
+    started = time.perf_counter()
+    stats, error = {}, None
+    try:
         with (transaction.atomic()):
             # Категории
+            progress.stage('categories', rows_total=len(rows), rows_processed=0)
             category_names = {r['Категория'] for r in rows if r.get('Категория')}
             categories = {c.name: c for c in Category.objects.filter(name__in=category_names)}
             missing_categories = [Category(name=name) for name in category_names if name not in categories]
@@ -108,27 +353,21 @@ def process_excel_file(file_obj, user) -> int:
                 bp_categories.update({c.name: c for c in new_bp_categories})
 
             # Контрагенты
+            progress.stage('counterparties', rows_processed=0)
             counterparties_rows, failed_counterparties = {}, []
-            count = 0
-            for r in rows:
-                inn = _clean_inn(r.get('ИНН'))
-                count += 1
-                print('*' * 10)
-                print(count)
-                print(inn)
-                address = _addr_key(r.get('Адрес'))
-                key = (inn, address)
+            for r in _track(rows, progress):
+                # Адреса, отличающиеся только регистром, пробелами или пунктуацией, - один контрагент
+                key = (_clean_inn(r.get('ИНН')), _address_key(r))
 
                 if key not in counterparties_rows:
                     counterparties_rows[key] = r
 
-            inns = {inn for inn, _ in counterparties_rows.keys()}
-            existing_counterparties_qs = Counterparties.objects.filter(inn__in=inns)
-            existing_counterparties = {(c.inn, _addr_key(c.address_from_excel)): c for c in existing_counterparties_qs}
+            existing_counterparties = _find_counterparties(counterparties_rows.keys())
             new_counterparties, update_counterparties_groups = [], {}
-            for (inn, address), r in counterparties_rows.items():
+            for (inn, address_key), r in counterparties_rows.items():
                 cat = categories.get(r.get('Категория'))
                 bp_cat = bp_categories.get(r.get('Категория по бизнес плану'))
+                address = _clean_address(r.get('Адрес'))
                 defaults = {
                     'name_from_excel': r.get('Наименование предприятия', ''),
                     'address_from_excel': address,
@@ -137,12 +376,13 @@ def process_excel_file(file_obj, user) -> int:
                     'business_plan_category': bp_cat,
                 }
 
-                counterparties = existing_counterparties.get((inn, address))
+                counterparties = existing_counterparties.get((inn, address_key))
 
                 if counterparties is None:
                     try:
                         new_counterparties.append(Counterparties(
                             inn=inn,
+                            address_key=address_key,
                             **defaults
                         ))
                     except Exception as e:
@@ -177,27 +417,27 @@ def process_excel_file(file_obj, user) -> int:
                             'Ошибка': str(e)
                         })
 
-            if failed_counterparties:
-                print("Не удалось добавить следующие контрагенты:")
-                for failed in failed_counterparties:
-                    print(f"ИНН: {failed['ИНН']}")
-                    print(f"Адрес: {failed['Адрес']}")
-                    print(f"Наименование предприятия: {failed['Наименование предприятия']}")
-                    print(f"Ошибка: {failed['Ошибка']}")
-                    print("-" * 40)
+            for failed in failed_counterparties:
+                logger.warning(
+                    'Не удалось добавить контрагента: ИНН %s, адрес %s, наименование %s: %s',
+                    failed['ИНН'], failed['Адрес'], failed['Наименование предприятия'], failed['Ошибка'],
+                )
 
+            stats['counterparties'] = (len(new_counterparties) - len(failed_counterparties),
+                                       sum(map(len, update_counterparties_groups.values())))
+            _count_stage(stats, progress, 'counterparties')
             for fields_tuple, counterparties in update_counterparties_groups.items():
                 Counterparties.objects.bulk_update(
                     counterparties,
                     list(fields_tuple),
                     batch_size=500
                 )
-            counterparties_qs = Counterparties.objects.filter(inn__in=inns)
-            counterparties_map = {(c.inn, _addr_key(c.address_from_excel)): c for c in counterparties_qs}
+            counterparties_map = _find_counterparties(counterparties_rows.keys())
 
             # Договоры
+            progress.stage('contracts', rows_processed=0)
             contract_rows = {}
-            for r in rows:
+            for r in _track(rows, progress):
                 contract_number = str(r.get('№ Договора')).strip()
                 if not contract_number:
                     continue
@@ -207,13 +447,13 @@ def process_excel_file(file_obj, user) -> int:
             existing_contracts = {c.contract_number: c for c in
                                   Contract.objects.filter(contract_number__in=contracts_numbers).select_related(
                                       'counterparties')}
+            previous_counterparty_ids = {c.counterparties_id for c in existing_contracts.values()}
             new_contracts, update_contracts_groups = [], {}
             for cn, r in contract_rows.items():
                 inn = _clean_inn(r.get('ИНН'))
                 if not inn:
                     continue
-                address = _addr_key(r.get('Адрес'))
-                counterparties = counterparties_map.get((inn, address))
+                counterparties = counterparties_map.get((inn, _address_key(r)))
                 if not counterparties:
                     continue
                 defaults = {
@@ -244,6 +484,8 @@ def process_excel_file(file_obj, user) -> int:
             if new_contracts:
                 Contract.objects.bulk_create(new_contracts, batch_size=500)
 
+            stats['contracts'] = (len(new_contracts), sum(map(len, update_contracts_groups.values())))
+            _count_stage(stats, progress, 'contracts')
             for fields_tuple, contracts in update_contracts_groups.items():
                 Contract.objects.bulk_update(
                     contracts,
@@ -255,20 +497,21 @@ def process_excel_file(file_obj, user) -> int:
             contracts_map = {c.contract_number: c for c in contracts_qs}
 
             # Дебиторка/кредиторка
+            progress.stage('debt_credit', rows_processed=0)
             existing_dc_qs = DebtCredit.objects.filter(contract_id__in=[c.id for c in contracts_map.values()])
             existing_dc = {dc.contract_id: dc for dc in existing_dc_qs}
             new_dc, update_dc_groups = [], {}
-            for cn, r in contract_rows.items():
+            for cn, r in _track(list(contract_rows.items()), progress):
                 contract = contracts_map.get(cn)
                 if not contract:
                     continue
                 defaults = {
-                    'debt_total': _get_decimal(r.get(debt_col)),
-                    'debt_acts': _get_decimal(r.get('В т.ч. по актам недоучета.1')),
-                    'debt_current': _get_decimal(r.get('     текущая       (до 30 дней).1')),
-                    'debt_overdue': _get_decimal(r.get('просроченная.1')),
+                    'debt_total': _get_amount(r.get(debt_col)),
+                    'debt_acts': _get_amount(r.get('В т.ч. по актам недоучета.1')),
+                    'debt_current': _get_amount(r.get('     текущая       (до 30 дней).1')),
+                    'debt_overdue': _get_amount(r.get('просроченная.1')),
                     'debt_origin_date': _get_date(r.get('Дата возникновения задолженности')),
-                    'credit_total': _get_decimal(r.get(credit_col)),
+                    'credit_total': _get_amount(r.get(credit_col)),
                     'date': debt_date,
                 }
 
@@ -294,6 +537,8 @@ def process_excel_file(file_obj, user) -> int:
             if new_dc:
                 DebtCredit.objects.bulk_create(new_dc, batch_size=500)
 
+            stats['debt_credit'] = (len(new_dc), sum(map(len, update_dc_groups.values())))
+            _count_stage(stats, progress, 'debt_credit')
             for fields_tuple, items in update_dc_groups.items():
                 DebtCredit.objects.bulk_update(
                     items,
@@ -301,16 +546,30 @@ def process_excel_file(file_obj, user) -> int:
                     batch_size=500
                 )
 
-            log = UploadLog.objects.create(uploaded_by=user, rows_processed=len(rows))
-            file_obj.seek(0)
-            log.file.save(file_obj.name, file_obj)
+            # Рейтинг должников
+            progress.stage('ranking')
+            refresh_debtor_ranking(
+                previous_counterparty_ids | {c.counterparties_id for c in contracts_map.values()}
+            )
 
-        return len(rows)
+            log = UploadLog.objects.create(uploaded_by_id=user.pk, rows_processed=len(rows))
+        progress.upload_log_id = log.pk
     except Exception as exc:
-        try:
-            log = UploadLog.objects.create(uploaded_by=user, rows_processed=0)
-            file_obj.seek(0)
-            log.file.save(getattr(file_obj, 'name', 'upload.xlsx'), file_obj)
-        except Exception:
-            pass
+        error = exc
+        IMPORT_JOBS.inc(status='failed')
+        _save_failed_upload(file_obj, user)
         raise exc
+    finally:
+        lock.release(error)    # Наборы данных свободны сразу после фиксации, сохранение файла - вне очереди
+
+    pin_primary(user.pk)    # Свои данные пользователь читает с основной базы, пока реплика догоняет
+    progress.stage('store', rows_processed=len(rows))
+    _store_upload_file(log, file_obj)
+
+    IMPORT_JOBS.inc(status='success')
+    IMPORT_ROWS.inc(len(rows))
+    IMPORT_DURATION.observe(time.perf_counter() - started, stage='import')
+    for model, (created, updated) in stats.items():
+        IMPORT_OBJECTS.inc(created, model=model, action='created')
+        IMPORT_OBJECTS.inc(updated, model=model, action='updated')
+    return len(rows)
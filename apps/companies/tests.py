@@ -1,3 +1,786 @@
-from django.test import TestCase
+import asyncio
+import functools
+import io
+import os
+import shutil
+import time
+import subprocess
+import tempfile
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from email.utils import format_datetime
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import locks
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.authentication.tokens import CustomRefreshToken
+from apps.common.db_routing import primary_pinned
+from apps.common.loadtest import DISTRICTS, build_of9_workbook
+from apps.common.metrics import REQUEST_QUERIES
+from apps.common.testing import QueryBudgetMixin, QueryCapture, rolled_back
+from apps.companies.addresses import normalize_address, normalize_address_column
+from apps.companies.chunked_upload import (
+    ChunkInProgress,
+    OffsetMismatch,
+    append_chunk,
+    session_path,
+    start_upload_session,
+)
+from apps.companies.dadata import (
+    AsyncRateLimiter,
+    DadataClient,
+    DadataError,
+    enrich_counterparties,
+    fetch_parties,
+    retry_after_seconds,
+)
+from apps.companies.dadata_stub import DadataStubServer
+from apps.companies.hierarchy import resolve_counterparty_hierarchy
+from apps.companies.import_queue import HOSTNAME, _try_acquire, dataset_keys, worker_name
+from apps.companies.jobs import events_token, spool_path
+from apps.companies.models import (
+    Category,
+    Contract,
+    Counterparties,
+    CounterpartiesState,
+    CounterpartyStatus,
+    DadataPartyCache,
+    DebtCredit,
+    DebtorRanking,
+    ImportJob,
+    ImportJobDataset,
+    UploadLog,
+    UploadSession,
+)
+from apps.companies.progress import NullProgress, channel
+from apps.companies.services import (
+    ExcelData,
+    _clean_inn,
+    _get_amount,
+    _get_date,
+    _is_missing,
+    process_excel_file,
+    record_counterparty_states,
+    refresh_debtor_ranking,
+    top_debtors,
+)
+from apps.companies.upload_archive import (
+    ARCHIVE_LOCK_NAME,
+    ArchiveInProgress,
+    archive_uploads,
+    open_upload_file,
+    store_upload,
+)
+
+# Бюджеты запросов: число запросов не зависит от объема данных (размеры - QueryBudgetMixin.QUERY_BUDGET_SIZES)
+IMPORT_STAGE_BUDGETS = {
+    'read': 13,             # Очередь импорта (DatasetLock): ImportJob, наборы данных, ожидание блокировки
+    'categories': 6,
+    'counterparties': 3,
+    'contracts': 3,
+    'debt_credit': 2,
+    'ranking': 10,          # Рейтинг, запись журнала загрузок и освобождение наборов данных
+    'store': 1,             # Файл в журнал загрузок
+}
+UPLOAD_BUDGET = 38
+BACKGROUND_UPLOAD_BUDGET = 1
+DEBTORS_BUDGET = 1
+GROUP_DEBT_BUDGET = 2
+IMPORT_JOBS_BUDGET = 1
+IMPORT_JOB_BUDGET = 1
+UPLOAD_SESSION_BUDGET = 1
+
+
+class StageQueries(NullProgress):
+    """Прогресс импорта, который отмечает границы этапов в захваченных запросах"""
+
+    def __init__(self, capture):
+        super().__init__()
+        self.capture = capture
+        self.marks = []
+
+    def stage(self, code, **counters):
+        self.marks.append((code, len(self.capture)))
+        super().stage(code, **counters)
+
+    def split(self) -> dict:
+        """Запросы по этапам: {этап: [SQL]}"""
+        queries = self.capture.queries
+        bounds = [position for _, position in self.marks[1:]] + [len(queries)]
+        return {code: queries[start:end] for (code, start), end in zip(self.marks, bounds)}
+
+
+class CompaniesTestCase(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp(prefix='companies-tests-')
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root, IMPORT_SPOOL_DIR=f'{cls.media_root}/spool')
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='budget')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {CustomRefreshToken.for_user(self.user).access_token}')
+
+    def of9_file(self, rows, seed=0):
+        return SimpleUploadedFile('of9.xlsx', build_of9_workbook(rows, seed=seed))
+
+    def seed(self, rows):
+        """Данные ОФ-9 на rows строк"""
+        process_excel_file(self.of9_file(rows), self.user)
+
+
+class ImportQueryBudgetTests(CompaniesTestCase):
+    """Число запросов импорта ОФ-9 по этапам не зависит от числа строк файла"""
+
+    def import_by_stage(self, rows, seed) -> dict:
+        with QueryCapture() as capture:
+            progress = StageQueries(capture)
+            process_excel_file(self.of9_file(rows, seed=seed), self.user, progress)
+        return progress.split()
+
+    def check_stages(self, runs, action):
+        for stage, budget in IMPORT_STAGE_BUDGETS.items():
+            with self.subTest(stage=stage, action=action):
+                self.assertSameQueryCounts(
+                    {size: stages[stage] for size, stages in runs.items()}, budget, f'Импорт ({action}), этап {stage}',
+                )
+
+    def test_import_stages_create(self):
+        runs = {}
+        for size in self.QUERY_BUDGET_SIZES:
+            with rolled_back():
+                runs[size] = self.import_by_stage(size, seed=0)
+        self.check_stages(runs, 'создание')
+
+    def test_import_stages_update(self):
+        runs = {}
+        for size in self.QUERY_BUDGET_SIZES:
+            with rolled_back():
+                self.import_by_stage(size, seed=0)
+                runs[size] = self.import_by_stage(size, seed=1)
+        self.check_stages(runs, 'обновление')
+
+    def test_upload_endpoint(self):
+        def upload(size):
+            response = self.client.post('/api/companies/upload/', {'file': self.of9_file(size)})
+            self.assertEqual(response.status_code, 201, response.content)
+
+        self.assertConstantQueries(upload, UPLOAD_BUDGET, label='POST upload/')
+
+    def test_background_upload_endpoint(self):
+        def upload(size):
+            response = self.client.post('/api/companies/upload/',
+                                        {'file': self.of9_file(size), 'background': True})
+            self.assertEqual(response.status_code, 202, response.content)
+
+        self.assertConstantQueries(upload, BACKGROUND_UPLOAD_BUDGET, prepare=self.seed,
+                                   label='POST upload/ (background)')
+
+
+class ReadQueryBudgetTests(CompaniesTestCase):
+    """Число запросов чтения отчетов не зависит от объема данных"""
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_debtor_ranking(self):
+        params = {
+            'все': '',
+            'район': f'?district={DISTRICTS[0]}',
+            'статус': f'?status={CounterpartyStatus.ACTIVE}&order_by=debt_overdue',
+        }
+        for name, query in params.items():
+            with self.subTest(filter=name):
+                self.assertConstantQueries(lambda size: self.get(f'/api/companies/debtors/top/{query}'),
+                                           DEBTORS_BUDGET, prepare=self.seed, label=f'GET debtors/top/ ({name})')
+
+    def test_debtor_ranking_category(self):
+        def prepare(size):
+            self.seed(size)
+            self.category = Category.objects.order_by('name').first()
+
+        self.assertConstantQueries(lambda size: self.get(f'/api/companies/debtors/top/?category={self.category.pk}'),
+                                   DEBTORS_BUDGET, prepare=prepare, label='GET debtors/top/ (категория)')
+
+    def test_group_debt(self):
+        def prepare(size):
+            self.seed(size)
+            root = DebtorRanking.objects.order_by('counterparties__created_at').first().counterparties
+            Counterparties.objects.exclude(pk=root.pk).update(parent=root)
+            self.root = root
+
+        self.assertConstantQueries(lambda size: self.get(f'/api/companies/groups/{self.root.pk}/debt/'),
+                                   GROUP_DEBT_BUDGET, prepare=prepare, label='GET groups/<pk>/debt/')
+
+    def test_import_jobs(self):
+        def prepare(size):
+            jobs = ImportJob.objects.bulk_create([
+                ImportJob(uploaded_by=self.user, file_name=f'{i}.xlsx', status=ImportJob.Status.WAITING,
+                          queue_position=i + 1)
+                for i in range(size)
+            ])
+            self.job = jobs[0]
+
+        self.assertConstantQueries(lambda size: self.get('/api/companies/imports/'),
+                                   IMPORT_JOBS_BUDGET, prepare=prepare, label='GET imports/')
+        self.assertConstantQueries(lambda size: self.get(f'/api/companies/imports/{self.job.pk}/'),
+                                   IMPORT_JOB_BUDGET, prepare=prepare, label='GET imports/<pk>/')
+
+    def test_upload_session(self):
+        session = UploadSession.objects.create(uploaded_by=self.user, file_name='of9.xlsx', size=1024)
+        self.assertConstantQueries(lambda size: self.get(f'/api/companies/upload/sessions/{session.pk}/'),
+                                   UPLOAD_SESSION_BUDGET, prepare=self.seed, label='GET upload/sessions/<pk>/')
+
+
+class ImportPinTests(CompaniesTestCase):
+    """После импорта пользователь читает с основной базы (реплика может отставать)"""
+
+    @mock.patch('apps.common.db_routing.replica_configured', return_value=True)
+    def test_pin_after_import(self, _):
+        other = get_user_model().objects.create(username='other')
+        self.seed(5)
+        self.assertTrue(primary_pinned(self.user.pk))
+        self.assertFalse(primary_pinned(other.pk))
+
+
+class AddressKeyTests(SimpleTestCase):
+    """Ключ адреса: регистр, е/ё, пунктуация и пробелы не различаются"""
+
+    ADDRESSES = ['г. Москва,  ул. Тестовая, д.1', 'Г МОСКВА УЛ ТЕСТОВАЯ Д 1', 'г.Москва,\nул.Тестовая,д.1',
+                 'ул. Зелёная_2', None, float('nan')]
+
+    def test_normalize_address(self):
+        self.assertEqual([normalize_address(value) for value in self.ADDRESSES], [
+            'г москва ул тестовая д 1', 'г москва ул тестовая д 1', 'г москва ул тестовая д 1',
+            'ул зеленая 2', '', '',
+        ])
+
+    def test_column_matches_scalar(self):
+        import pandas as pd
+
+        self.assertEqual(normalize_address_column(pd.Series(self.ADDRESSES)).tolist(),
+                         [normalize_address(value) for value in self.ADDRESSES])
+
+
+class CellValueTests(SimpleTestCase):
+    """Пустые ячейки строк ОФ-9, в т.ч. pd.NA"""
+
+    def test_is_missing(self):
+        import pandas as pd
+
+        for value in (None, float('nan'), pd.NaT, pd.NA):
+            with self.subTest(value=value):
+                self.assertTrue(_is_missing(value))
+        for value in (0, '', '7700000001', date(2025, 1, 1)):
+            with self.subTest(value=value):
+                self.assertFalse(_is_missing(value))
+
+    def test_na_cells(self):
+        import pandas as pd
+
+        self.assertEqual((_clean_inn(pd.NA), _get_date(pd.NA), _get_amount(pd.NA)), ('', None, 0))
+
+
+class AddressKeyMigrationTests(TransactionTestCase):
+    """Миграция 0013: слияние контрагентов с одинаковыми ИНН и ключом адреса"""
+    migrate_from = [('companies', '0012_drop_redundant_indexes')]
+    migrate_to = [('companies', '0013_counterparties_address_key')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_merge_recomputes_current_state(self):
+        old_apps = self.migrate(self.migrate_from)
+        Counterparties = old_apps.get_model('companies', 'Counterparties')
+        CounterpartiesState = old_apps.get_model('companies', 'CounterpartiesState')
+        day = [datetime(2025, 5, d, tzinfo=timezone.utc) for d in (1, 2, 3)]
+        survivor = Counterparties.objects.create(inn='7700000001', address_from_excel='г. Москва, ул. Тестовая, д.1',
+                                                 current_state='ACTIVE', current_state_date=day[0])
+        duplicate = Counterparties.objects.create(inn='7700000001', address_from_excel='г Москва ул Тестовая д 1',
+                                                  current_state='LIQUIDATING', current_state_code=101,
+                                                  current_state_date=day[2])
+        CounterpartiesState.objects.bulk_create([
+            CounterpartiesState(counterparties=survivor, status='ACTIVE', actuality_date=day[0]),
+            CounterpartiesState(counterparties=duplicate, status='ACTIVE', actuality_date=day[1]),
+            CounterpartiesState(counterparties=duplicate, status='LIQUIDATING', code=101, actuality_date=day[2]),
+        ])
+
+        new_apps = self.migrate(self.migrate_to)
+        Counterparties = new_apps.get_model('companies', 'Counterparties')
+        CounterpartiesState = new_apps.get_model('companies', 'CounterpartiesState')
+        merged = Counterparties.objects.get()
+        self.assertEqual(merged.pk, survivor.pk)
+        self.assertEqual((merged.current_state, merged.current_state_code, merged.current_state_date),
+                         ('LIQUIDATING', 101, day[2]))
+        self.assertEqual(list(CounterpartiesState.objects.order_by('actuality_date').values_list('status', flat=True)),
+                         ['ACTIVE', 'LIQUIDATING'])
+
+
+class DadataClientTests(SimpleTestCase):
+    """Клиент DaData: ограничение частоты, повторы с Retry-After и экспоненциальной задержкой"""
+
+    def find_parties(self, responses, inns=('7700000001',), **options):
+        """Запросы к API с ответами responses по порядку; (результаты, задержки повторов, клиент)"""
+        import httpx
+
+        responses, delays = list(responses), []
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        client = DadataClient(api_url='http://dadata.test/party', api_key='', rate_limit=0, backoff=0.01,
+                              max_retries=3, **options)
+        transport = httpx.MockTransport(lambda request: responses.pop(0))
+        with mock.patch('httpx.AsyncClient', functools.partial(httpx.AsyncClient, transport=transport)), \
+                mock.patch('apps.companies.dadata.asyncio.sleep', sleep):
+            results = asyncio.run(client.find_parties(inns))
+        return results, delays, client
+
+    def test_retry_after_seconds(self):
+        self.assertEqual(retry_after_seconds('3'), 3.0)
+        in_five = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=5), usegmt=True)
+        self.assertAlmostEqual(retry_after_seconds(in_five), 5, delta=1.5)
+        self.assertEqual(retry_after_seconds('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+        self.assertIsNone(retry_after_seconds('скоро'))
+        self.assertIsNone(retry_after_seconds(None))
+
+    def test_retry_after_http_date_and_backoff(self):
+        import httpx
+
+        in_two = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=2), usegmt=True)
+        results, delays, client = self.find_parties([
+            httpx.Response(429, headers={'Retry-After': in_two}),
+            httpx.Response(503, headers={'Retry-After': 'soon'}),
+            httpx.Response(200, json={'suggestions': [{'value': 'ООО "ТЕСТ"'}]}),
+        ])
+        self.assertEqual(results, {'7700000001': [{'value': 'ООО "ТЕСТ"'}]})
+        self.assertEqual(client.requests_sent, 3)
+        self.assertAlmostEqual(delays[0], 2, delta=1.5)
+        self.assertTrue(0.02 <= delays[1] <= 0.03)    # backoff * 2 ** 1 + случайная добавка до backoff
+
+    def test_retries_exhausted(self):
+        import httpx
+
+        results, delays, client = self.find_parties([httpx.Response(503)] * 4)
+        self.assertIsInstance(results['7700000001'], DadataError)
+        self.assertEqual(client.requests_sent, 4)
+        self.assertEqual(len(delays), 3)
+
+    def test_client_error_not_retried(self):
+        import httpx
+
+        results, delays, client = self.find_parties([httpx.Response(403)])
+        self.assertIsInstance(results['7700000001'], DadataError)
+        self.assertEqual((client.requests_sent, delays), (1, []))
+
+    def test_rate_limiter(self):
+        async def run():
+            limiter = AsyncRateLimiter(50)
+            started = time.monotonic()
+            await asyncio.gather(*(limiter.wait() for _ in range(6)))
+            return time.monotonic() - started
+
+        self.assertGreaterEqual(asyncio.run(run()), 5 / 50 - 0.01)
+
+
+class FakeDadataClient:
+    """Клиент DaData без сети: ответ по ИНН либо исключение для ИНН из failing"""
+
+    def __init__(self, failing=()):
+        self.requested, self.failing = [], set(failing)
+
+    async def find_parties(self, inns):
+        self.requested.append(sorted(inns))
+        return {inn: DadataError('нет ответа') if inn in self.failing else [{'value': f'fresh {inn}'}]
+                for inn in inns}
+
+
+class DadataCacheTests(CompaniesTestCase):
+    """Кеш ответов DaData по ИНН и раздача ответа всем контрагентам ИНН"""
+
+    INNS = ['7700000001', '7700000002']
+
+    def test_cache_ttl(self):
+        client = FakeDadataClient()
+        fetch_parties(self.INNS, client)
+        fetch_parties(self.INNS, client)
+        self.assertEqual(client.requested, [self.INNS])
+
+        DadataPartyCache.objects.filter(inn=self.INNS[0]).update(expires_at=datetime.now(timezone.utc))
+        fetch_parties(self.INNS, client)
+        fetch_parties(self.INNS, client, force=True)
+        self.assertEqual(client.requested, [self.INNS, self.INNS[:1], self.INNS])
+
+    def test_expired_entry_used_when_refresh_fails(self):
+        DadataPartyCache.objects.create(inn=self.INNS[0], payload=[{'value': 'cached'}],
+                                        fetched_at=datetime.now(timezone.utc),
+                                        expires_at=datetime.now(timezone.utc) - timedelta(days=1))
+        parties = fetch_parties(self.INNS, FakeDadataClient(failing=self.INNS))
+        self.assertEqual(parties[self.INNS[0]], [{'value': 'cached'}])
+        self.assertIsInstance(parties[self.INNS[1]], DadataError)
+
+    def test_fan_out(self):
+        Counterparties.objects.bulk_create([
+            Counterparties(inn=inn, address_from_excel=f'Адрес {i}', address_key=f'адрес {i}')
+            for inn in ('7700000010', '7700000011') for i in range(3)
+        ])
+        with DadataStubServer() as stub:
+            result = enrich_counterparties(client=DadataClient(api_url=stub.url, api_key='', rate_limit=0))
+        self.assertEqual(stub.requests, 2)
+        self.assertEqual((result.processed, result.updated, result.failed), (6, 6, 0))
+        self.assertFalse(Counterparties.objects.filter(dadata_updated_at__isnull=True).exists())
+        self.assertEqual(Counterparties.objects.filter(name_from_dadata='ООО "ТЕСТ 7700000010"').count(), 3)
+
+
+class UploadArchiveTests(CompaniesTestCase):
+    """Хранение файлов загрузок: сжатие, перенос в архив по месяцам и чтение из архива"""
+
+    CONTENT = b'of9 workbook ' * 1000
+
+    def setUp(self):
+        super().setUp()
+        self.archive_override = override_settings(UPLOAD_ARCHIVE_DIR=f'{self.media_root}/archive')
+        self.archive_override.enable()
+        self.addCleanup(self.archive_override.disable)
+
+    def stored_log(self, days_ago=100):
+        log = UploadLog.objects.create(uploaded_by=self.user)
+        store_upload(log, SimpleUploadedFile('of9.xlsx', self.CONTENT))
+        UploadLog.objects.filter(pk=log.pk).update(created_at=datetime.now(timezone.utc) - timedelta(days=days_ago))
+        return UploadLog.objects.get(pk=log.pk)
+
+    def test_store_archive_open(self):
+        logs = [self.stored_log(), self.stored_log(), self.stored_log(days_ago=1)]
+        result = archive_uploads(older_than_days=90)
+        self.assertEqual((result.archived, result.archives), (2, 1))
+
+        for log in logs:
+            log.refresh_from_db()
+            with open_upload_file(log) as file:
+                self.assertEqual(file.read(), self.CONTENT)
+        self.assertEqual([bool(log.archive_name) for log in logs], [True, True, False])
+        self.assertEqual(archive_uploads(older_than_days=90).archived, 0)
+
+    def test_missing_archive_member(self):
+        log = self.stored_log()
+        archive_uploads(older_than_days=90)
+        log.refresh_from_db()
+        other = UploadLog.objects.create(uploaded_by=self.user, archive_name=log.archive_name)
+        self.assertIsNone(open_upload_file(other))
+        self.assertEqual(self.client.get(f'/api/companies/uploads/{other.pk}/file/').status_code, 404)
+
+        UploadLog.objects.filter(pk=other.pk).update(archive_name='uploads-1999-01.tar')
+        self.assertEqual(self.client.get(f'/api/companies/uploads/{other.pk}/file/').status_code, 404)
+
+    def test_concurrent_runs(self):
+        self.stored_log()
+        archive_dir = settings.UPLOAD_ARCHIVE_DIR
+        os.makedirs(archive_dir, exist_ok=True)
+        with open(os.path.join(archive_dir, ARCHIVE_LOCK_NAME), 'a') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            with self.assertRaises(ArchiveInProgress):
+                archive_uploads(older_than_days=90)
+            locks.unlock(lock_file)
+        self.assertEqual(archive_uploads(older_than_days=90).archived, 1)
+
+
+class DebtorRankingTests(TestCase):
+    """Рейтинг должников: суммы по последним данным договоров, фильтры, порядок и удаление"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Бюджет')
+        self.first, self.second, self.paid = Counterparties.objects.bulk_create([
+            Counterparties(inn=f'770000000{i}', address_from_excel=f'Адрес {i}', address_key=f'адрес {i}',
+                           district=district, category=category, current_state=state)
+            for i, (district, category, state) in enumerate([
+                ('Центр', None, CounterpartyStatus.ACTIVE),
+                ('Север', self.category, CounterpartyStatus.LIQUIDATING),
+                ('Центр', None, CounterpartyStatus.ACTIVE),
+            ])
+        ])
+        self.debts(self.first, 'A-1', (date(2025, 1, 1), 100, 10), (date(2025, 2, 1), 300, 30))
+        self.debts(self.first, 'A-2', (date(2025, 2, 1), 50, 40))
+        self.debts(self.second, 'B-1', (date(2025, 1, 1), 200, 100))
+        self.debts(self.paid, 'C-1')
+        refresh_debtor_ranking([self.first.pk, self.second.pk, self.paid.pk])
+
+    def debts(self, counterparty, number, *rows):
+        contract = Contract.objects.create(contract_number=number, counterparties=counterparty)
+        DebtCredit.objects.bulk_create([
+            DebtCredit(contract=contract, date=day, debt_total=Decimal(total), debt_overdue=Decimal(overdue))
+            for day, total, overdue in rows
+        ])
+
+    def top(self, **params):
+        params = {'order_by': 'debt_total', 'limit': 100, **params}
+        return [ranking.counterparties_id for ranking in top_debtors(params)]
+
+    def test_totals(self):
+        """Суммируется только последняя запись каждого договора"""
+        rankings = {ranking.counterparties_id: ranking for ranking in DebtorRanking.objects.all()}
+        self.assertEqual(set(rankings), {self.first.pk, self.second.pk})
+        first = rankings[self.first.pk]
+        self.assertEqual((first.debt_total, first.debt_overdue, first.date),
+                         (Decimal(350), Decimal(70), date(2025, 2, 1)))
+        self.assertEqual((first.district, first.category_id), ('Центр', None))
+        self.assertEqual(rankings[self.second.pk].category_id, self.category.pk)
+
+    def test_filters_and_ordering(self):
+        self.assertEqual(self.top(), [self.first.pk, self.second.pk])
+        self.assertEqual(self.top(order_by='debt_overdue'), [self.second.pk, self.first.pk])
+        self.assertEqual(self.top(limit=1), [self.first.pk])
+        self.assertEqual(self.top(district='Север'), [self.second.pk])
+        self.assertEqual(self.top(category=self.category.pk), [self.second.pk])
+        self.assertEqual(self.top(status=CounterpartyStatus.ACTIVE), [self.first.pk])
+
+    def test_paid_debt_removed(self):
+        DebtCredit.objects.filter(contract__counterparties=self.second).delete()
+        self.assertEqual(refresh_debtor_ranking([self.second.pk]), 0)
+        self.assertEqual(self.top(), [self.first.pk])
+
+
+class CounterpartyStateTests(TestCase):
+    """История состояний контрагента: запись только при изменении статуса или кода"""
+
+    def setUp(self):
+        self.counterparty = Counterparties.objects.create(inn='7700000001', address_from_excel='Адрес',
+                                                          address_key='адрес')
+        self.day = datetime(2025, 5, 1, tzinfo=timezone.utc)
+
+    def record(self, counterparty, status, code=None):
+        return record_counterparty_states([(counterparty, status, code, self.day)])
+
+    def test_changed_status_updates_current_state(self):
+        self.assertEqual(self.record(self.counterparty, CounterpartyStatus.LIQUIDATING, 101), 1)
+        self.counterparty.refresh_from_db()
+        self.assertEqual(
+            (self.counterparty.current_state, self.counterparty.current_state_code,
+             self.counterparty.current_state_date),
+            (CounterpartyStatus.LIQUIDATING, 101, self.day),
+        )
+
+    def test_unchanged_status_writes_no_history(self):
+        self.record(self.counterparty, CounterpartyStatus.ACTIVE)
+        self.assertEqual(self.record(self.counterparty, CounterpartyStatus.ACTIVE), 0)
+        self.assertEqual(CounterpartiesState.objects.count(), 1)
+
+    def test_stale_instance(self):
+        """Экземпляр прочитан до записи того же перехода другим процессом"""
+        stale = Counterparties.objects.get(pk=self.counterparty.pk)
+        self.record(self.counterparty, CounterpartyStatus.BANKRUPT, 111)
+        self.assertEqual(self.record(stale, CounterpartyStatus.BANKRUPT, 111), 0)
+        self.assertEqual(CounterpartiesState.objects.count(), 1)
+
+
+class HierarchyTests(TestCase):
+    """Связывание подразделений с головной организацией по ИНН"""
+
+    def test_resolve_hierarchy(self):
+        branch_type = Counterparties.BranchType
+        head, other_head, branch, address = Counterparties.objects.bulk_create([
+            Counterparties(inn='7700000001', address_from_excel=f'Адрес {i}', address_key=f'адрес {i}',
+                           branch_type=kind, kpp=kpp)
+            for i, (kind, kpp) in enumerate([
+                (branch_type.MAIN, '770001001'), (branch_type.MAIN, '770001001'),
+                (branch_type.BRANCH, '780001001'), ('', ''),
+            ])
+        ])
+        Counterparties.objects.filter(pk=other_head.pk).update(parent=head)
+
+        resolve_counterparty_hierarchy()
+
+        parents = dict(Counterparties.objects.values_list('pk', 'parent_id'))
+        self.assertEqual(parents, {head.pk: None, other_head.pk: None, branch.pk: head.pk, address.pk: head.pk})
+
+
+class AsyncUploadTests(TransactionTestCase):
+    """Асинхронная загрузка с JWT проходит при включенной проверке CSRF (как у представлений DRF)"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='companies-tests-')
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        user = get_user_model().objects.create(username='async')
+        self.client = Client(enforce_csrf_checks=True,
+                             HTTP_AUTHORIZATION=f'Bearer {CustomRefreshToken.for_user(user).access_token}')
+
+    def test_upload(self):
+        file = SimpleUploadedFile('of9.xlsx', build_of9_workbook(5))
+        response = self.client.post('/api/async/companies/upload/', {'file': file})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json(), {'rows_processed': 5})
+        self.assertEqual(Counterparties.objects.count(), 5)
+        # Запросы импорта в отдельном потоке учтены в метриках запроса
+        self.assertGreater(REQUEST_QUERIES.total(view='companies-async-excel-upload'), 0)
+
+
+class ChunkStream(io.BytesIO):
+    """Тело запроса части файла, которое отмечает, была ли открыта транзакция во время чтения"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.read_in_transaction = False
+
+    def read(self, size=-1):
+        self.read_in_transaction |= connection.in_atomic_block
+        return super().read(size)
+
+
+class ChunkedUploadTests(TransactionTestCase):
+    """Прием частей файла: без транзакции во время передачи, одна запись на сессию, смещение по compare-and-set"""
+
+    def setUp(self):
+        chunks_dir = tempfile.mkdtemp(prefix='companies-chunks-')
+        self.addCleanup(shutil.rmtree, chunks_dir, ignore_errors=True)
+        dir_override = override_settings(CHUNKED_UPLOAD_DIR=chunks_dir)
+        dir_override.enable()
+        self.addCleanup(dir_override.disable)
+        self.user = get_user_model().objects.create(username='chunks')
+        self.data = bytes(range(256)) * 4
+        self.session = start_upload_session(self.user, 'of9.xlsx', len(self.data))
+
+    def append(self, offset, data):
+        stream = ChunkStream(data)
+        session = append_chunk(self.session.pk, self.user, offset, stream, len(data))
+        self.assertFalse(stream.read_in_transaction)
+        return session
+
+    def test_chunks(self):
+        self.append(0, self.data[:600])
+        session = self.append(600, self.data[600:])
+
+        session.refresh_from_db()
+        self.assertEqual(session.offset, len(self.data))
+        self.assertEqual(session.checksum, zlib.crc32(self.data))
+        self.assertEqual(session_path(session).read_bytes(), self.data)
+
+    def test_offset_mismatch(self):
+        self.append(0, self.data[:600])
+        with self.assertRaises(OffsetMismatch) as error:
+            self.append(0, self.data[:600])
+        self.assertEqual(error.exception.session.offset, 600)
+
+    def test_chunk_in_progress(self):
+        with open(session_path(self.session), 'r+b') as file:
+            locks.lock(file, locks.LOCK_EX)
+            try:
+                with self.assertRaises(ChunkInProgress):
+                    self.append(0, self.data[:600])
+            finally:
+                locks.unlock(file)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.offset, 0)
+
+
+class ImportJobEventsTests(CompaniesTestCase):
+    """Поток прогресса импорта: токен в адресе для EventSource, прерванные импорты завершаются"""
+
+    def events(self, job, token):
+        return Client().get(f'/api/companies/imports/{job.pk}/events/', {'token': token})
+
+    def read_events(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_stream_token(self):
+        job = ImportJob.objects.create(uploaded_by=self.user, file_name='of9.xlsx', status=ImportJob.Status.COMPLETED)
+        other = ImportJob.objects.create(uploaded_by=self.user, file_name='of9.xlsx')
+
+        events_url = self.client.get(f'/api/companies/imports/{job.pk}/').json()['events_url']
+        self.assertIn('?token=', events_url)
+        self.assertIn('"status": "completed"', self.read_events(Client().get(events_url)))
+        self.assertEqual(self.events(job, events_token(other)).status_code, 401)
+        self.assertEqual(self.events(job, 'invalid').status_code, 401)
+
+    def test_orphaned_job(self):
+        process = subprocess.Popen(['true'])
+        process.wait()
+        job = ImportJob.objects.create(uploaded_by=self.user, file_name='of9.xlsx', status=ImportJob.Status.QUEUED,
+                                       worker=f'{HOSTNAME}:{process.pid}')
+        spool = spool_path(job)
+        spool.parent.mkdir(parents=True, exist_ok=True)
+        spool.touch()
+
+        self.assertIn('"status": "failed"', self.read_events(self.events(job, events_token(job))))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.FAILED)
+        self.assertFalse(spool.exists())
+
+    @override_settings(IMPORT_PROGRESS_STREAM_TIMEOUT=0.3, IMPORT_PROGRESS_HEARTBEAT=0.1,
+                       IMPORT_PROGRESS_POLL_INTERVAL=0.1)
+    def test_last_event_id(self):
+        job = ImportJob.objects.create(uploaded_by=self.user, file_name='of9.xlsx', status=ImportJob.Status.RUNNING)
+        for rows in (1, 2):
+            channel.publish(job.pk, {'status': ImportJob.Status.RUNNING, 'rows_processed': rows})
+        url = f'/api/companies/imports/{job.pk}/events/'
+
+        self.assertIn('id: 2\n', self.read_events(Client().get(url, {'token': events_token(job)})))
+        resumed = self.read_events(Client().get(url, {'token': events_token(job)}, HTTP_LAST_EVENT_ID='2'))
+        self.assertNotIn('event: progress', resumed)
+        self.assertIn(': ping', resumed)
+
+    async def test_async_stream(self):
+        job = await ImportJob.objects.acreate(uploaded_by=self.user, file_name='of9.xlsx',
+                                              status=ImportJob.Status.COMPLETED)
+        response = await AsyncClient().get(f'/api/companies/imports/{job.pk}/events/', {'token': events_token(job)})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('"status": "completed"', content)
+
+
+class ImportQueueTests(CompaniesTestCase):
+    """Очередь импортов: пересекающиеся по наборам данных импорты выполняются по очереди, остальные - параллельно"""
+
+    def job(self):
+        return ImportJob.objects.create(uploaded_by=self.user, file_name='of9.xlsx', worker=worker_name())
+
+    def test_dataset_keys(self):
+        def of9(report_date, *districts):
+            return ExcelData([{'Район': district} for district in districts], 'debt', report_date, 'credit')
+
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            march = dataset_keys(of9(date(2025, 3, 31), 'Центральный', ' Центральный', 'Северный'))
+            april = dataset_keys(of9(date(2025, 4, 30), 'Центральный'))
+            south = dataset_keys(of9(date(2025, 4, 30), 'Южный'))
+        self.assertEqual(march, ['Северный', 'Центральный'])
+        self.assertTrue(set(march) & set(april))    # Месяцы одного района пишут те же договоры и контрагентов
+        self.assertFalse(set(march) & set(south))
+
+    def test_overlapping_imports_serialize(self):
+        first, second, other = self.job(), self.job(), self.job()
+        self.assertEqual(_try_acquire(first, ['Центральный', 'Северный']), 0)
+        self.assertEqual(_try_acquire(second, ['Центральный']), 1)
+        self.assertEqual(_try_acquire(other, ['Южный']), 0)
+
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.queue_position), (ImportJob.Status.WAITING, 1))
+
+        ImportJobDataset.objects.filter(job=first).delete()    # Первый импорт освободил наборы данных
+        ImportJob.objects.filter(pk=first.pk).update(lock_acquired_at=None, status=ImportJob.Status.COMPLETED)
+        self.assertEqual(_try_acquire(second, ['Центральный']), 0)
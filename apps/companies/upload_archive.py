@@ -0,0 +1,166 @@
+import gzip
+import io
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File, locks
+from django.utils import timezone
+
+from apps.companies.models import UploadLog
+
+logger = logging.getLogger(__name__)
+
+COMPRESSED_SUFFIX = '.gz'
+
+# Файл блокировки каталога архивов: архивацию выполняет один процесс
+ARCHIVE_LOCK_NAME = '.archive.lock'
+
+
+class ArchiveInProgress(Exception):
+    """Архивация уже выполняется другим процессом"""
+
+
+@dataclass
+class ArchiveResult:
+    archived: int = 0
+    archives: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+
+def _compress(file_obj) -> tempfile.SpooledTemporaryFile:
+    """Сжатие файла gzip во временный файл (в памяти до 8 Мб, дальше на диске)"""
+    compressed = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    file_obj.seek(0)
+    with gzip.GzipFile(fileobj=compressed, mode='wb', compresslevel=settings.UPLOAD_COMPRESS_LEVEL) as gz:
+        shutil.copyfileobj(file_obj, gz, 1024 * 1024)
+    compressed.seek(0)
+    return compressed
+
+
+def _decompress(file_obj) -> tempfile.SpooledTemporaryFile:
+    """Распаковка gzip во временный файл (в памяти до 8 Мб, дальше на диске)"""
+    content = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    with gzip.GzipFile(fileobj=file_obj) as gz:
+        shutil.copyfileobj(gz, content, 1024 * 1024)
+    content.seek(0)
+    return content
+
+
+def store_upload(log, file_obj) -> None:
+    """Функция для сохранения загруженного файла в журнал загрузок в сжатом виде.
+        Вызывается после завершения транзакции импорта: дисковые операции не удерживают транзакцию.
+    """
+    name = os.path.basename(getattr(file_obj, 'name', None) or 'upload.xlsx')
+    with _compress(file_obj) as compressed:
+        log.file.save(name + COMPRESSED_SUFFIX, File(compressed), save=False)
+    UploadLog.objects.filter(pk=log.pk).update(file=log.file.name)
+
+
+def open_upload_file(log):
+    """Функция для получения исходного (распакованного) содержимого файла загрузки.
+        Поддерживает файлы в архиве (archive_uploads), сжатые и несжатые (загруженные ранее) файлы.
+        Возвращает файловый объект или None, если файла нет.
+    """
+    if log.archive_name:
+        return _open_archived(log)
+    if not log.file:
+        return None
+    if log.file.name.endswith(COMPRESSED_SUFFIX):
+        with log.file.open('rb') as compressed:
+            return _decompress(compressed)
+    return log.file.open('rb')
+
+
+def _archive_member(log) -> str:
+    return f'{log.pk}{COMPRESSED_SUFFIX}'
+
+
+def _open_archived(log):
+    """Файл загрузки из архива: заголовки tar читаются только до нужного файла. None - архива или файла в нем нет"""
+    path = Path(settings.UPLOAD_ARCHIVE_DIR) / log.archive_name
+    name = _archive_member(log)
+    try:
+        with tarfile.open(path) as archive:
+            for member in archive:
+                if member.name == name:
+                    return _decompress(archive.extractfile(member))
+    except FileNotFoundError:
+        pass
+    logger.warning('Файл загрузки %s не найден в архиве %s', log.pk, path)
+    return None
+
+
+def archive_uploads(older_than_days=None, dry_run=False) -> ArchiveResult:
+    """Функция для переноса файлов загрузок старше older_than_days дней в архивы по месяцам.
+        Архив - tar-файл uploads-ГГГГ-ММ.tar в UPLOAD_ARCHIVE_DIR с gzip-сжатыми файлами (несжатые
+        файлы старых загрузок сжимаются при переносе); повторные запуски дописывают в существующий архив.
+        Исходный файл удаляется только после записи в архив и сохранения archive_name в журнале.
+        Одновременный запуск (ArchiveInProgress) не допускается: иначе оба процесса дописали бы одни и те же
+        загрузки в архив.
+    """
+    if dry_run:
+        return _archive_uploads(older_than_days, dry_run)
+    archive_dir = Path(settings.UPLOAD_ARCHIVE_DIR)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    with open(archive_dir / ARCHIVE_LOCK_NAME, 'a') as lock_file:
+        if not locks.lock(lock_file, locks.LOCK_EX | locks.LOCK_NB):
+            raise ArchiveInProgress('Архивация загрузок уже выполняется')
+        try:
+            return _archive_uploads(older_than_days, dry_run)
+        finally:
+            locks.unlock(lock_file)
+
+
+def _archive_uploads(older_than_days, dry_run) -> ArchiveResult:
+    older_than_days = older_than_days if older_than_days is not None else settings.UPLOAD_ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    logs = (UploadLog.objects
+            .filter(created_at__lt=cutoff, archive_name='')
+            .exclude(file='')
+            .order_by('created_at'))
+
+    by_month = {}
+    for log in logs.iterator():
+        by_month.setdefault(f'uploads-{log.created_at:%Y-%m}.tar', []).append(log)
+
+    result = ArchiveResult()
+    archive_dir = Path(settings.UPLOAD_ARCHIVE_DIR)
+    for archive_name, month_logs in by_month.items():
+        if dry_run:
+            result.archives += 1
+            result.archived += len(month_logs)
+            continue
+        archived = []
+        with tarfile.open(archive_dir / archive_name, 'a') as archive:
+            for log in month_logs:
+                if not log.file.storage.exists(log.file.name):
+                    continue
+                info = tarfile.TarInfo(_archive_member(log))
+                info.mtime = int(log.created_at.timestamp())
+                with log.file.open('rb') as source:
+                    if log.file.name.endswith(COMPRESSED_SUFFIX):
+                        info.size = log.file.size
+                        archive.addfile(info, source)
+                    else:
+                        with _compress(source) as compressed:
+                            info.size = compressed.seek(0, io.SEEK_END)
+                            compressed.seek(0)
+                            archive.addfile(info, compressed)
+                result.bytes_before += log.file.size
+                result.bytes_after += info.size
+                archived.append(log)
+
+        UploadLog.objects.filter(pk__in=[log.pk for log in archived]).update(archive_name=archive_name, file='')
+        for log in archived:
+            log.file.storage.delete(log.file.name)
+        result.archived += len(archived)
+        result.archives += bool(archived)
+    return result
@@ -1,7 +1,28 @@
 from django.urls import path
 
-from apps.companies.views import ExcelUploadView
+from apps.companies.views import (
+    CounterpartyGroupDebtView,
+    DebtorRankingView,
+    ExcelUploadView,
+    ImportJobEventsView,
+    ImportJobListView,
+    ImportJobView,
+    UploadLogFileView,
+    UploadSessionCompleteView,
+    UploadSessionCreateView,
+    UploadSessionView,
+)
 
 urlpatterns = [
     path('upload/', ExcelUploadView.as_view(), name='companies-excel-upload'),
+    path('upload/sessions/', UploadSessionCreateView.as_view(), name='companies-upload-session-create'),
+    path('upload/sessions/<uuid:pk>/', UploadSessionView.as_view(), name='companies-upload-session'),
+    path('upload/sessions/<uuid:pk>/complete/', UploadSessionCompleteView.as_view(),
+         name='companies-upload-session-complete'),
+    path('imports/', ImportJobListView.as_view(), name='companies-imports'),
+    path('imports/<uuid:pk>/', ImportJobView.as_view(), name='companies-import'),
+    path('imports/<uuid:pk>/events/', ImportJobEventsView.as_view(), name='companies-import-events'),
+    path('uploads/<uuid:pk>/file/', UploadLogFileView.as_view(), name='companies-upload-file'),
+    path('debtors/top/', DebtorRankingView.as_view(), name='companies-debtors-top'),
+    path('groups/<uuid:pk>/debt/', CounterpartyGroupDebtView.as_view(), name='companies-group-debt'),
 ]
\ No newline at end of file
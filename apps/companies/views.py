@@ -1,12 +1,61 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import urlencode
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.companies.serializers import ExcelUploadSerializer
-from apps.companies.services import process_excel_file
+from apps.common.db_routing import ReplicaReadMixin
+from apps.common.renderers import EventStreamRenderer
+from apps.companies.chunked_upload import (
+    ChunkedUploadError,
+    OffsetMismatch,
+    append_chunk,
+    complete_upload_session,
+    queue_upload_session,
+    start_upload_session,
+)
+from apps.companies.hierarchy import counterparty_group_debt
+from apps.companies.jobs import (
+    astream_job_events,
+    check_events_token,
+    events_token,
+    stream_job_events,
+    submit_import,
+)
+from apps.companies.models import Counterparties, ImportJob, UploadLog, UploadSession
+from apps.companies.serializers import (
+    CounterpartyGroupDebtSerializer,
+    DebtorRankingQuerySerializer,
+    DebtorRankingSerializer,
+    ExcelUploadSerializer,
+    ImportJobSerializer,
+    UploadSessionCompleteSerializer,
+    UploadSessionCreateSerializer,
+    UploadSessionSerializer,
+)
+from apps.companies.services import process_excel_file, top_debtors
+from apps.companies.upload_archive import open_upload_file
 
-from datetime import datetime
+
+def _import_job_data(request, job) -> dict:
+    """Импорт и адрес потока прогресса с токеном (для EventSource, который не передает заголовок Authorization)"""
+    data = ImportJobSerializer(job).data
+    url = reverse('companies-import-events', args=[job.pk])
+    data['events_url'] = request.build_absolute_uri(f'{url}?{urlencode({"token": events_token(job)})}')
+    return data
+
+
+def _import_job_response(request, job) -> Response:
+    """Ответ на постановку файла в фоновый импорт: импорт и адрес потока прогресса"""
+    return Response(_import_job_data(request, job), status=status.HTTP_202_ACCEPTED)
+
+
+def _user_import_jobs(user):
+    return ImportJob.objects.all() if user.is_staff else ImportJob.objects.filter(uploaded_by_id=user.pk)
 
 
 class ExcelUploadView(APIView):
@@ -16,10 +65,164 @@ class ExcelUploadView(APIView):
         serializer = ExcelUploadSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         file_obj = serializer.validated_data['file']
-        start = datetime.now()
-        print(f'Время старта: {start}')
+        if serializer.validated_data['background']:
+            return _import_job_response(request, submit_import(request.user, file_obj.name, file_obj=file_obj))
         rows = process_excel_file(file_obj, request.user)
-        finish = datetime.now()
-        print(f'Время окончания: {finish}')
-        print(f'Время работы: {finish - start}')
         return Response({'rows_processed': rows}, status=status.HTTP_201_CREATED)
+
+
+class ImportJobListView(APIView):
+    """Незавершенные импорты (в очереди, ожидают импорта тех же данных, выполняются) с позицией в очереди"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        jobs = (_user_import_jobs(request.user)
+                .exclude(status__in=[ImportJob.Status.COMPLETED, ImportJob.Status.FAILED])
+                .order_by('created_at'))
+        return Response(ImportJobSerializer(jobs, many=True).data, status=status.HTTP_200_OK)
+
+
+class ImportJobView(APIView):
+    """Состояние фонового импорта и адрес потока прогресса с новым токеном (для переподключения)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, *args, **kwargs):
+        job = _user_import_jobs(request.user).filter(pk=pk).first()
+        if job is None:
+            return Response({'error': 'Импорт не найден'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_import_job_data(request, job), status=status.HTTP_200_OK)
+
+
+class ImportJobEventsView(APIView):
+    """Поток прогресса фонового импорта (Server-Sent Events): этап, строки, созданные/обновленные записи, ETA.
+
+    Поток закрывается после события со статусом completed/failed. Браузер подключается по events_url
+    из ответа на загрузку или GET imports/<id>/: new EventSource(events_url) - адрес содержит токен
+    этого импорта на IMPORT_EVENTS_TOKEN_TTL, так как EventSource не передает заголовок Authorization.
+    Скрипты могут передать JWT в заголовке, как для остальных запросов.
+    Под ASGI поток - асинхронный генератор (не занимает поток воркера); под WSGI поток закрывается
+    через IMPORT_PROGRESS_STREAM_TIMEOUT, браузер переподключается с Last-Event-ID.
+    """
+    permission_classes = [AllowAny]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def get(self, request, pk, *args, **kwargs):
+        if request.user.is_authenticated:
+            jobs = _user_import_jobs(request.user)
+        elif check_events_token(request.query_params.get('token'), pk):
+            jobs = ImportJob.objects.all()
+        else:
+            return Response({'error': 'Нужен JWT в заголовке или токен потока (?token=)'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+        if not jobs.filter(pk=pk).exists():
+            return Response({'error': 'Импорт не найден'}, status=status.HTTP_404_NOT_FOUND)
+        last_event_id = request.headers.get('Last-Event-ID')
+        stream = astream_job_events if isinstance(request._request, ASGIRequest) else stream_job_events
+        response = StreamingHttpResponse(stream(pk, last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'    # Без буферизации в nginx
+        return response
+
+
+class UploadLogFileView(APIView):
+    """Исходный файл загрузки (распаковывается из сжатого хранения или архива)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, *args, **kwargs):
+        logs = UploadLog.objects.all() if request.user.is_staff else UploadLog.objects.filter(uploaded_by_id=request.user.pk)
+        log = logs.filter(pk=pk).first()
+        file = open_upload_file(log) if log else None
+        if file is None:
+            return Response({'error': 'Файл загрузки не найден'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(file, as_attachment=True, filename=log.file_name or f'{log.pk}.xlsx')
+
+
+class UploadSessionCreateView(APIView):
+    """Начало загрузки Excel-файла по частям"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            session = start_upload_session(request.user, **serializer.validated_data)
+        except ChunkedUploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionView(APIView):
+    """Состояние сессии (GET - с какого смещения продолжать) и прием очередной части (PATCH).
+
+    Тело PATCH - байты части файла, смещение части передается в заголовке Upload-Offset.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, *args, **kwargs):
+        session = UploadSession.objects.filter(pk=pk, uploaded_by_id=request.user.pk).first()
+        if session is None:
+            return Response({'error': 'Сессия загрузки не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+    def patch(self, request, pk, *args, **kwargs):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return Response({'error': 'Нужны заголовки Upload-Offset и Content-Length'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session = append_chunk(pk, request.user, offset, request.stream, length)
+        except UploadSession.DoesNotExist:
+            return Response({'error': 'Сессия загрузки не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        except OffsetMismatch as e:
+            return Response({'error': str(e), 'offset': e.session.offset}, status=status.HTTP_409_CONFLICT)
+        except ChunkedUploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+
+class UploadSessionCompleteView(APIView):
+    """Завершение загрузки по частям и импорт собранного файла"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk, *args, **kwargs):
+        serializer = UploadSessionCompleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        checksum = serializer.validated_data.get('checksum')
+        try:
+            if serializer.validated_data['background']:
+                _, job = queue_upload_session(pk, request.user, checksum)
+                return _import_job_response(request, job)
+            _, rows = complete_upload_session(pk, request.user, checksum)
+        except UploadSession.DoesNotExist:
+            return Response({'error': 'Сессия загрузки не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        except OffsetMismatch as e:
+            return Response({'error': 'Файл получен не полностью', 'offset': e.session.offset},
+                            status=status.HTTP_409_CONFLICT)
+        except ChunkedUploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'rows_processed': rows}, status=status.HTTP_201_CREATED)
+
+
+class DebtorRankingView(ReplicaReadMixin, APIView):
+    """Топ-N должников по району и/или категории из предрасчитанного рейтинга"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        query = DebtorRankingQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        rankings = top_debtors(query.validated_data)
+        return Response(DebtorRankingSerializer(rankings, many=True).data, status=status.HTTP_200_OK)
+
+
+class CounterpartyGroupDebtView(ReplicaReadMixin, APIView):
+    """Задолженность группы: контрагент и все его подразделения (рекурсивно)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, *args, **kwargs):
+        if not Counterparties.objects.filter(pk=pk).exists():
+            return Response({'error': 'Контрагент не найден'}, status=status.HTTP_404_NOT_FOUND)
+        rollup = counterparty_group_debt(root_ids=[pk])
+        return Response(CounterpartyGroupDebtSerializer(rollup[0]).data, status=status.HTTP_200_OK)
@@ -12,20 +12,20 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
-from django_auth_ldap.config import LDAPSearch, LDAPSearchUnion, ActiveDirectoryGroupType
 from dotenv import load_dotenv
-from ldap.ldapobject import LDAPObject
-import ldap
 import os
 import logging
 
+from django.core.exceptions import ImproperlyConfigured
+
+from apps.authentication.ldap_config import lazy_connection_options, lazy_instance, lazy_search_union
+from apps.common.db_profile import check_pool_connection
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 load_dotenv(os.path.join(BASE_DIR, '.env'))
 
-LDAPObject.bytes_mode = False
-
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -62,6 +62,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.common.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,14 +91,89 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
+
+# Потоки для разбора Excel в асинхронных представлениях (api/async/...)
+ASYNC_PARSE_WORKERS = int(os.getenv('ASYNC_PARSE_WORKERS', '2'))
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# Профиль БД (DB_PROFILE), сравнение профилей - manage.py bench_db_profile:
+#   sqlite        - файл SQLite (SQLITE_PATH) с WAL и прагмами SQLITE_PRAGMAS (apps.common.db_profile);
+#   postgres      - PostgreSQL с постоянными соединениями (DB_CONN_MAX_AGE) и проверкой перед запросом;
+#   postgres_pool - PostgreSQL с пулом соединений psycopg (psycopg[pool]) и проверкой соединения из пула.
+DB_PROFILE = os.getenv('DB_PROFILE', 'sqlite')
+
+if DB_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH') or BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Транзакция сразу берет блокировку записи: конкурирующие записи ждут ее, а не падают
+                # с database is locked при повышении блокировки чтения до записи
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', '5')),
+            },
+        }
+    }
+elif DB_PROFILE in ('postgres', 'postgres_pool'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'portal'),
+            'USER': os.getenv('POSTGRES_USER', 'portal'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if DB_PROFILE == 'postgres_pool':
+        DATABASES['default']['CONN_MAX_AGE'] = 0    # Соединения переиспользует пул
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            'check': check_pool_connection,
+        }
+else:
+    raise ImproperlyConfigured(f'Неизвестный профиль БД DB_PROFILE={DB_PROFILE}')
+
+# Прагмы SQLite для каждого соединения (SQLITE_TUNING=0 - без них, как у sqlite3 по умолчанию):
+# WAL - чтение не ждет записи импорта; synchronous=NORMAL - без fsync на каждую фиксацию (в WAL безопасно);
+# кеш страниц и mmap - меньше системных вызовов чтения
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': -int(os.getenv('SQLITE_CACHE_SIZE_KB', str(64 * 1024))),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'temp_store': 'MEMORY',
+} if os.getenv('SQLITE_TUNING', '1') == '1' else {}
+
+# Реплика для чтения отчетов и списков (apps.common.db_routing); локально - второй файл SQLite,
+# который обновляет manage.py sync_replica. Запись, аутентификация и импорт всегда идут в default.
+DATABASE_REPLICA_NAME = os.getenv('DATABASE_REPLICA_NAME')
+if DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = {**DATABASES['default'], 'NAME': DATABASE_REPLICA_NAME, 'TEST': {'MIRROR': 'default'}}
+DATABASE_ROUTERS = ['apps.common.db_routing.PrimaryReplicaRouter']
+
+# Чтение пользователя после его импорта идет с основной базы столько секунд (отставание реплики);
+# закрепление - в общем кеше, а при кеше процесса - в основной базе (apps.common.models.PrimaryPin)
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '30'))
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Для нескольких воркеров нужен общий кеш (например, django.core.cache.backends.redis.RedisCache): в нем отзыв
+# сессий при выходе и обновление пользователей из LDAP; без него - предупреждение authentication.W001 (check --deploy)
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
@@ -142,7 +218,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.authentication.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
@@ -161,12 +237,15 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ACCESS_TOKEN_CLASS': 'apps.authentication.tokens.CustomAccessToken',
+    'TOKEN_REFRESH_SERIALIZER': 'apps.authentication.serializers.CustomTokenRefreshSerializer',
 }
 
+# Доверять подписанным данным токена (группы, подразделение, флаги) без загрузки пользователя из БД
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv('AUTH_TRUST_TOKEN_CLAIMS', 'True') == 'True'
+
 AUTHENTICATION_BACKENDS = (
-    'django_auth_ldap.backend.LDAPBackend',
-    'django.contrib.auth.backends.ModelBackend',
     'apps.authentication.backends.LDAPJWTBackend',
+    'django.contrib.auth.backends.ModelBackend',
 )
 
 # Параметры подключения к серверу
@@ -175,22 +254,18 @@ AUTH_LDAP_BIND_DN = os.getenv('AUTH_LDAP_BIND_DN')
 AUTH_LDAP_BIND_PASSWORD = os.getenv('AUTH_LDAP_BIND_PASSWORD')
 # os.getenv('AUTH_LDAP_BIND_DN')
 
-AUTH_LDAP_CONNECTION_OPTIONS = {
-    ldap.OPT_REFERRALS: 0
-}
+AUTH_LDAP_CONNECTION_OPTIONS = lazy_connection_options(OPT_REFERRALS=0)
+
+# Пул соединений служебной учетной записи (0 - без пула) и кеш результатов поиска в каталоге
+AUTH_LDAP_POOL_SIZE = int(os.getenv('AUTH_LDAP_POOL_SIZE', '10'))
+AUTH_LDAP_POOL_MAX_AGE = int(os.getenv('AUTH_LDAP_POOL_MAX_AGE', '300'))               # сек
+AUTH_LDAP_CACHE_TIMEOUT = int(os.getenv('AUTH_LDAP_CACHE_TIMEOUT', '300'))             # DN пользователя, сек
+AUTH_LDAP_GROUP_SEARCH_CACHE_TIMEOUT = int(os.getenv('AUTH_LDAP_GROUP_SEARCH_CACHE_TIMEOUT', '120'))  # сек
 
-# параметры поиска пользователей
-AUTH_LDAP_USER_SEARCH = LDAPSearchUnion(
-    LDAPSearch(
-        "OU=Пользователи Бакинская,DC=astsbyt,DC=ru",
-        ldap.SCOPE_SUBTREE,
-        "(sAMAccountName=%(user)s)",
-    ),
-    LDAPSearch(
-        "OU=Районные отделы сбыта,DC=astsbyt,DC=ru",
-        ldap.SCOPE_SUBTREE,
-        "(sAMAccountName=%(user)s)",
-    ),
+# параметры поиска пользователей (LDAPSearchUnion из пар base_dn, filterstr; область поиска - SCOPE_SUBTREE)
+AUTH_LDAP_USER_SEARCH = lazy_search_union(
+    ("OU=Пользователи Бакинская,DC=astsbyt,DC=ru", "(sAMAccountName=%(user)s)"),
+    ("OU=Районные отделы сбыта,DC=astsbyt,DC=ru", "(sAMAccountName=%(user)s)"),
 )
 AUTH_LDAP_USER_ATTR_MAP = {
     'first_name': 'givenName',
@@ -199,30 +274,45 @@ AUTH_LDAP_USER_ATTR_MAP = {
 }
 
 # Параметры поиска групп
-AUTH_LDAP_GROUP_SEARCH = LDAPSearchUnion(
-    LDAPSearch(
-        'OU=Районные отделы сбыта,DC=astsbyt,DC=ru',
-        ldap.SCOPE_SUBTREE,
-        '(objectClass=group)',
-    ),
-    LDAPSearch(
-        'OU=Пользователи Бакинская,DC=astsbyt,DC=ru',
-        ldap.SCOPE_SUBTREE,
-        '(objectClass=group)',
-    ),
-    LDAPSearch(
-        'DC=astsbyt,DC=ru',
-        ldap.SCOPE_SUBTREE,
-        '(objectClass=group)',
-    ),
+AUTH_LDAP_GROUP_SEARCH = lazy_search_union(
+    ('OU=Районные отделы сбыта,DC=astsbyt,DC=ru', '(objectClass=group)'),
+    ('OU=Пользователи Бакинская,DC=astsbyt,DC=ru', '(objectClass=group)'),
+    ('DC=astsbyt,DC=ru', '(objectClass=group)'),
 )
-AUTH_LDAP_GROUP_TYPE = ActiveDirectoryGroupType()
+AUTH_LDAP_GROUP_TYPE = lazy_instance('apps.authentication.ldap_groups.CachedActiveDirectoryGroupType')
 AUTH_LDAP_MIRROR_GROUPS = True
 AUTH_LDAP_USER_FLAGS_BY_GROUP = {
     'is_staff': 'CN=CPortal_staff,DC=astsbyt,DC=ru',
     'is_superuser': 'CN=CPortal_superuser,DC=astsbyt,DC=ru'
 }
 
+# Обновление пользователя из LDAP в LDAPUserRefreshMiddleware: не чаще раза в TTL секунд
+LDAP_USER_REFRESH_TTL = int(os.getenv('LDAP_USER_REFRESH_TTL', '300'))
+LDAP_USER_REFRESH_BACKGROUND = os.getenv('LDAP_USER_REFRESH_BACKGROUND', 'True') == 'True'
+LDAP_USER_REFRESH_WORKERS = int(os.getenv('LDAP_USER_REFRESH_WORKERS', '2'))
+LDAP_USER_REFRESH_BACKEND = os.getenv('LDAP_USER_REFRESH_BACKEND', 'apps.authentication.backends.LDAPJWTBackend')
+
+# Срок жизни кеша справочника DN группы LDAP -> роль (сбрасывается при изменении DepartmentRole)
+ROLE_MAP_CACHE_TTL = int(os.getenv('ROLE_MAP_CACHE_TTL', '3600'))
+
+# Локальная замена LDAP (apps.authentication.fake_ldap.FakeLDAPBackend) для тестов и нагрузочных прогонов
+FAKE_LDAP_PASSWORD = os.getenv('FAKE_LDAP_PASSWORD', 'password')
+FAKE_LDAP_LATENCY = float(os.getenv('FAKE_LDAP_LATENCY', '0.02'))     # задержка обращения к каталогу, сек
+
+# Параметры обогащения контрагентов из DaData
+DADATA_API_URL = os.getenv(
+    'DADATA_API_URL', 'https://suggestions.dadata.ru/suggestions/api/4_1/rs/findById/party'
+)
+DADATA_API_KEY = os.getenv('DADATA_API_KEY', '')
+DADATA_RATE_LIMIT = float(os.getenv('DADATA_RATE_LIMIT', '20'))       # запросов в секунду
+DADATA_CONCURRENCY = int(os.getenv('DADATA_CONCURRENCY', '10'))
+DADATA_MAX_RETRIES = int(os.getenv('DADATA_MAX_RETRIES', '3'))
+DADATA_BACKOFF = float(os.getenv('DADATA_BACKOFF', '0.5'))             # базовая задержка повтора, сек
+DADATA_TIMEOUT = float(os.getenv('DADATA_TIMEOUT', '10'))
+DADATA_BATCH_SIZE = int(os.getenv('DADATA_BATCH_SIZE', '200'))
+DADATA_STALE_DAYS = int(os.getenv('DADATA_STALE_DAYS', '30'))
+DADATA_CACHE_TTL_DAYS = int(os.getenv('DADATA_CACHE_TTL_DAYS', '7'))  # срок жизни кеша ответов по ИНН
+
 # print("\n" + "="*50)
 # print("LDAP CONFIGURATION:")
 # print(f"SERVER_URI: {AUTH_LDAP_SERVER_URI}")
@@ -251,8 +341,54 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'WARNING',
         },
+        'apps.authentication.backends': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'apps.common.middleware': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+        'apps.companies': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
     },
 }
 
+# Телеметрия запросов (/metrics): порог медленного запроса, сек, и число SQL-запросов в логе
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', '1.0'))
+SLOW_REQUEST_TOP_QUERIES = int(os.getenv('SLOW_REQUEST_TOP_QUERIES', '5'))
+# Доступ к /metrics: адреса клиента (REMOTE_ADDR) через запятую и/или токен (Authorization: Bearer <токен>)
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 MEDIA_URL = '/uploads/'
 MEDIA_ROOT = BASE_DIR / 'uploads'
+
+# Хранение загруженных файлов: сжатие gzip и перенос старых файлов в архивы по месяцам (archive_uploads)
+UPLOAD_COMPRESS_LEVEL = int(os.getenv('UPLOAD_COMPRESS_LEVEL', '6'))
+UPLOAD_ARCHIVE_DIR = os.getenv('UPLOAD_ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+UPLOAD_ARCHIVE_AFTER_DAYS = int(os.getenv('UPLOAD_ARCHIVE_AFTER_DAYS', '90'))
+
+# Загрузка Excel-файлов по частям (api/companies/upload/sessions/)
+CHUNKED_UPLOAD_DIR = os.getenv('CHUNKED_UPLOAD_DIR', str(BASE_DIR / 'uploads' / 'chunks'))
+CHUNKED_UPLOAD_MAX_SIZE = int(os.getenv('CHUNKED_UPLOAD_MAX_SIZE', str(1024 * 1024 * 1024)))       # байт
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = int(os.getenv('CHUNKED_UPLOAD_MAX_CHUNK_SIZE', str(16 * 1024 * 1024)))  # байт
+CHUNKED_UPLOAD_EXPIRE_HOURS = int(os.getenv('CHUNKED_UPLOAD_EXPIRE_HOURS', '24'))
+
+# Фоновый импорт ОФ-9 и поток прогресса (api/companies/imports/<id>/events/)
+IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', '2'))
+IMPORT_SPOOL_DIR = os.getenv('IMPORT_SPOOL_DIR', str(BASE_DIR / 'uploads' / 'incoming'))
+IMPORT_PROGRESS_SAVE_INTERVAL = float(os.getenv('IMPORT_PROGRESS_SAVE_INTERVAL', '2'))     # сек
+IMPORT_PROGRESS_POLL_INTERVAL = float(os.getenv('IMPORT_PROGRESS_POLL_INTERVAL', '1'))     # сек
+IMPORT_PROGRESS_HEARTBEAT = float(os.getenv('IMPORT_PROGRESS_HEARTBEAT', '15'))            # сек
+# Срок одного потока прогресса: под WSGI поток занимает поток воркера, браузер переподключается (Last-Event-ID)
+IMPORT_PROGRESS_STREAM_TIMEOUT = float(os.getenv('IMPORT_PROGRESS_STREAM_TIMEOUT', '60'))  # сек
+# Срок токена потока прогресса в адресе (?token=): EventSource браузера не передает заголовок Authorization
+IMPORT_EVENTS_TOKEN_TTL = int(os.getenv('IMPORT_EVENTS_TOKEN_TTL', '600'))  # сек
+
+# Очередь импортов по наборам данных (районы файла): ожидание, прерванные импорты
+IMPORT_LOCK_POLL_INTERVAL = float(os.getenv('IMPORT_LOCK_POLL_INTERVAL', '1'))     # сек
+IMPORT_LOCK_TIMEOUT = int(os.getenv('IMPORT_LOCK_TIMEOUT', '7200'))                # сек
+IMPORT_LOCK_WAIT_STALE = int(os.getenv('IMPORT_LOCK_WAIT_STALE', '60'))            # сек